@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import random
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+from datachat.core.document import Document
+from datachat.core.models import EmbeddingModel, InferenceModel
+
+_WORDS = (
+    "data pipeline latency vector search model prompt cache index query "
+    "stream batch token cluster retrieval ranking memory storage network "
+    "python sqlite embedding inference agent schema metric trace budget"
+).split()
+_TYPES = ("session", "keynote", "workshop", "panel")
+
+
+class FakeEmbedding(EmbeddingModel):
+    """Deterministic embedding model simulating request latency
+
+    The same text always maps to the same unit vector, seeded from its
+    hash, so runs are reproducible.
+    """
+
+    model_name = "fake-embedding"
+
+    def __init__(
+        self,
+        dimension: int = 256,
+        latency: float = 0.05,
+        per_text_latency: float = 0.0005,
+    ):
+        """Initialize the model
+
+        Args:
+            dimension: Length of the returned vectors
+            latency: Seconds each request takes
+            per_text_latency: Extra seconds per embedded text
+        """
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+
+    def create_embedding(self, text: str) -> List[float]:
+        return self.create_embeddings([text])[0]
+
+    def create_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        time.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    async def acreate_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        await asyncio.sleep(self._delay(texts))
+        return [self._vector(text) for text in texts]
+
+    def _delay(self, texts: Sequence[str]) -> float:
+        return self.latency + self.per_text_latency * len(texts)
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeInference(InferenceModel):
+    """Chat model that waits a fixed time and echoes the question"""
+
+    model_name = "gpt-4"
+
+    def __init__(self, latency: float = 0.5, tokens: int = 50):
+        """Initialize the model
+
+        Args:
+            latency: Seconds each response takes
+            tokens: Number of tokens streamed per response
+        """
+        self.latency = latency
+        self.tokens = tokens
+
+    def generate_response(
+        self, context: str, user_query: str, system_prompt: str, history_text: str = ""
+    ) -> str:
+        time.sleep(self.latency)
+        return self._answer(context, user_query)
+
+    async def agenerate_response(
+        self, context: str, user_query: str, system_prompt: str, history_text: str = ""
+    ) -> str:
+        await asyncio.sleep(self.latency)
+        return self._answer(context, user_query)
+
+    def stream_response(self, *args, **kwargs) -> Iterator[str]:
+        for token in self._answer(*args[:2]).split(" "):
+            time.sleep(self.latency / self.tokens)
+            yield token + " "
+
+    async def astream_response(self, *args, **kwargs) -> AsyncIterator[str]:
+        for token in self._answer(*args[:2]).split(" "):
+            await asyncio.sleep(self.latency / self.tokens)
+            yield token + " "
+
+    def _answer(self, context: str, user_query: str) -> str:
+        documents = context.count("\n") + 1 if context else 0
+        filler = " ".join(["token"] * max(self.tokens - 6, 0))
+        return f"Answer to {user_query!r} from {documents} documents {filler}".strip()
+
+
+class SyntheticDocument(Document):
+    """Generated conference session with a stable id, text and metadata"""
+
+    def __init__(self, index: int, seed: int = 0):
+        rng = random.Random(seed * 1_000_003 + index)
+        self.index = index
+        self.title = " ".join(rng.choices(_WORDS, k=4)).title()
+        self.abstract = " ".join(rng.choices(_WORDS, k=40))
+        self.speaker = f"Speaker {rng.randrange(max(index // 10, 1) + 50)}"
+        self.date = f"2024-10-{rng.randrange(20, 25)} {rng.randrange(9, 18):02d}:00:00"
+        self.type = rng.choice(_TYPES)
+
+    @property
+    def id(self) -> str:
+        return f"doc_{self.index}"
+
+    @property
+    def text(self) -> str:
+        return (
+            f"Title: {self.title}\nAbstract: {self.abstract}\n"
+            f"Speaker: {self.speaker}\nDate: {self.date}"
+        )
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "title": self.title,
+            "speaker": self.speaker,
+            "date": self.date,
+            "type": self.type,
+        }
+
+
+def synthetic_documents(count: int, seed: int = 0) -> Iterator[SyntheticDocument]:
+    return (SyntheticDocument(i, seed) for i in range(count))
+
+
+def synthetic_questions(count: int, seed: int = 0) -> List[str]:
+    """Distinct questions, so the answer cache never short-circuits a request"""
+    rng = random.Random(seed)
+    return [
+        f"What sessions cover {' and '.join(rng.sample(_WORDS, 2))}? (#{i})"
+        for i in range(count)
+    ]
@@ -0,0 +1,236 @@
+"""Offline load and latency benchmark for DataChat
+
+Registers synthetic datasets of increasing size and sends chat requests at
+increasing concurrency through the FastAPI app, with fake OpenAI models and
+a local NumPy vector store standing in for the network services. Results
+are written as JSON so runs can be compared:
+
+    python -m benchmarks.run --sizes 1000 10000 --concurrency 1 8 32 \\
+        --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+
+from benchmarks.fakes import (
+    FakeEmbedding,
+    FakeInference,
+    synthetic_documents,
+    synthetic_questions,
+)
+from datachat.api import routes
+from datachat.api.app import create_app
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.store.numpy_store import NumpyStore
+from datachat.store.quantized_store import QuantizedStore
+
+DATASET = "bench"
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Linearly interpolated percentile of values, p between 0 and 100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def make_chat(workdir: str, args: argparse.Namespace) -> DataChat:
+    config = Config(
+        OpenAIConfig("offline"), PineconeConfig("offline", "local"), Environment.TEST
+    )
+    root_dir = os.path.join(workdir, "vector_indexes")
+    if args.quantization:
+        vector_store = QuantizedStore(root_dir, args.quantization)
+    else:
+        vector_store = NumpyStore(root_dir)
+    return DataChat(
+        config,
+        vector_store=vector_store,
+        search_mode=args.search_mode,
+        embedding_model=FakeEmbedding(
+            args.dimension, args.embed_latency, args.embed_text_latency
+        ),
+        inference_model=FakeInference(args.inference_latency),
+    )
+
+
+def bench_ingest(chat: DataChat, size: int, args: argparse.Namespace) -> dict:
+    started = time.perf_counter()
+    stats = chat.register_dataset(
+        DATASET,
+        synthetic_documents(size, args.seed),
+        "You answer questions about conference sessions.",
+        batch_size=args.batch_size,
+        filter_fields={"type": "keyword", "speaker": "keyword", "date": "date"},
+        embedding_model=args.embedding_model,
+    )
+    seconds = time.perf_counter() - started
+    return {
+        "rows": size,
+        "seconds": seconds,
+        "rows_per_second": size / seconds if seconds > 0 else 0.0,
+        "rows_embedded": stats.rows_embedded,
+        "rows_upserted": stats.rows_upserted,
+    }
+
+
+async def bench_chat(concurrency: int, requests: int, seed: int) -> dict:
+    """Send requests to the chat route with at most `concurrency` in flight"""
+    questions = synthetic_questions(requests, seed)
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=create_app())
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://datachat", timeout=None
+    ) as client:
+
+        async def ask(i: int, question: str) -> None:
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    f"/api/v1/datasets/{DATASET}/chat",
+                    json={"message": question, "session_id": f"bench-{seed}-{i}"},
+                )
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(ask(i, q) for i, q in enumerate(questions)))
+        seconds = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": requests / seconds if seconds > 0 else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results = []
+    cwd = os.getcwd()
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory(prefix="datachat-bench-") as workdir:
+            # DataChat keeps its SQLite files in the working directory
+            os.chdir(workdir)
+            try:
+                chat = make_chat(workdir, args)
+                routes.DataChatManager._instance = chat
+                ingest = bench_ingest(chat, size, args)
+                print(
+                    f"size={size}: ingest {ingest['rows_per_second']:.0f} rows/s",
+                    file=sys.stderr,
+                )
+                chats = []
+                for concurrency in args.concurrency:
+                    result = asyncio.run(
+                        bench_chat(concurrency, args.requests, args.seed)
+                    )
+                    print(
+                        f"size={size} concurrency={concurrency}: "
+                        f"p50 {result['p50_ms']:.0f}ms p95 {result['p95_ms']:.0f}ms "
+                        f"p99 {result['p99_ms']:.0f}ms",
+                        file=sys.stderr,
+                    )
+                    chats.append(result)
+                chat.repo.close()
+            finally:
+                routes.DataChatManager._instance = None
+                os.chdir(cwd)
+        results.append(
+            {
+                "size": size,
+                "ingest": ingest,
+                "chat": chats,
+                "peak_rss_bytes": peak_rss_bytes(),
+            }
+        )
+
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            key: value for key, value in vars(args).items() if key != "output"
+        },
+        "results": results,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument(
+        "--requests", type=int, default=100, help="Chat requests per concurrency"
+    )
+    parser.add_argument("--search-mode", default=DataChat.HYBRID)
+    parser.add_argument(
+        "--embedding-model",
+        default=DataChat.DEFAULT_EMBEDDING,
+        help='"local" embeds in process instead of with the fake model',
+    )
+    parser.add_argument(
+        "--quantization",
+        choices=QuantizedStore.QUANTIZATIONS,
+        help="Search vectors compressed this way instead of as float32",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--embed-text-latency", type=float, default=0.0005)
+    parser.add_argument("--inference-latency", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON results here, not to stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+from datachat.core import metrics
 from .routes import router
 
 
-def create_app() -> FastAPI:
-    """Create and configure FastAPI application"""
+def create_app(server_timing: bool = False) -> FastAPI:
+    """Create and configure FastAPI application
+
+    Args:
+        server_timing: Add a Server-Timing header with the time each stage
+            of the request took
+    """
     app = FastAPI(
         title="DataChat API",
         description="API for json data based chat interactions",
@@ -13,4 +23,24 @@ def create_app() -> FastAPI:
 
     app.include_router(router, prefix="/api/v1")
 
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def get_metrics() -> PlainTextResponse:
+        """Latency, token, cache and ingest metrics in the Prometheus format"""
+        return PlainTextResponse(
+            metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    if server_timing:
+
+        @app.middleware("http")
+        async def add_server_timing(request: Request, call_next):
+            started = time.perf_counter()
+            with metrics.collect_timings() as timings:
+                response = await call_next(request)
+            # Streamed bodies are still being produced, so only the stages
+            # finished before the headers went out are reported
+            timings["total"] = time.perf_counter() - started
+            response.headers["Server-Timing"] = metrics.server_timing(timings)
+            return response
+
     return app
@@ -1,13 +1,69 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
 class ChatQuery(BaseModel):
     message: str
+    # Conversation to continue; requests without one get no history and
+    # are not remembered
+    session_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
     response: str
+    # Prompt tokens spent on retrieved documents, and tokens left out to
+    # stay within the model's context budget
+    context_tokens: int = 0
+    context_tokens_dropped: int = 0
+    # Candidate documents retrieved, those kept after reranking, and the
+    # time reranking took
+    documents_retrieved: int = 0
+    documents_selected: int = 0
+    rerank_ms: float = 0.0
 
 
 class UploadResponse(BaseModel):
     message: str
+
+
+class DocumentsResponse(BaseModel):
+    rows_read: int
+    rows_upserted: int
+    rows_unchanged: int
+    rows_skipped: int
+
+
+class RemoveDocumentsResponse(BaseModel):
+    removed: int
+
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    dataset_name: str
+    status: str
+    rows_read: int
+    rows_embedded: int
+    rows_cached: int
+    rows_upserted: int
+    rows_unchanged: int
+    rows_skipped: int
+    rows_deleted: int
+    rows_per_second: float
+    elapsed_seconds: float
+    errors: List[str]
+    created_at: str
+
+
+class AnswerCacheStatsResponse(BaseModel):
+    entries: int
+    hits: int
+    similar_hits: int
+    misses: int
+    hit_rate: float
+    saved_seconds: float
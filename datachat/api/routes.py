@@ -1,13 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Path
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, Any, List, Optional
+import asyncio
 import json
+import tempfile
 
 from pydantic import BaseModel
 
 from datachat.core import registry
 from datachat.core.data_chat import DataChat
+from datachat.core.ingestion import IngestionManager
 from datachat.core.registry import DocumentRegistry
-from .models import ChatQuery, ChatResponse, UploadResponse
+from .models import (
+    AnswerCacheStatsResponse,
+    ChatQuery,
+    ChatResponse,
+    DocumentsResponse,
+    JobResponse,
+    JobStatusResponse,
+    RemoveDocumentsResponse,
+    UploadResponse,
+)
 import traceback
 
 
@@ -21,10 +34,34 @@ class DataChatManager:
         return cls._instance
 
 
+class IngestionManagerProvider:
+    _instance: Optional[IngestionManager] = None
+
+    @classmethod
+    def get_instance(cls) -> IngestionManager:
+        if cls._instance is None:
+            cls._instance = IngestionManager(DataChatManager.get_instance())
+        return cls._instance
+
+
 class UploadPayload(BaseModel):
     data: List[Dict[str, Any]]
     document_type: str
     system_prompt: str
+    context_fields: Optional[List[str]] = None
+    # Metadata fields questions may be filtered on: "keyword" or "date"
+    filter_fields: Optional[Dict[str, str]] = None
+    # "local" embeds in process instead of calling the default model
+    embedding_model: Optional[str] = None
+
+
+class DocumentsPayload(BaseModel):
+    data: List[Dict[str, Any]]
+    document_type: str
+
+
+class RemoveDocumentsPayload(BaseModel):
+    ids: List[str]
 
 
 router = APIRouter()
@@ -36,6 +73,10 @@ async def get_data_chat() -> DataChat:
     return chat_manager.get_instance()
 
 
+async def get_ingestion_manager() -> IngestionManager:
+    return IngestionManagerProvider.get_instance()
+
+
 @router.post("/datasets/{dataset_name}/upload")
 async def upload_data(
     data_chat: DataChat = Depends(get_data_chat),
@@ -54,7 +95,14 @@ async def upload_data(
 
     try:
         documents = [document_class(item) for item in data]
-        data_chat.register_dataset(dataset_name, documents, payload.system_prompt)
+        await data_chat.aregister_dataset(
+            dataset_name,
+            documents,
+            payload.system_prompt,
+            context_fields=payload.context_fields,
+            filter_fields=payload.filter_fields,
+            embedding_model=payload.embedding_model,
+        )
         return UploadResponse(
             message=f"Dataset '{dataset_name}' uploaded and processed successfully"
         )
@@ -63,13 +111,207 @@ async def upload_data(
         raise HTTPException(500, f"Failed to process upload: {str(e)}")
 
 
+@router.post("/datasets/{dataset_name}/documents", response_model=DocumentsResponse)
+async def add_documents(
+    dataset_name: str,
+    payload: DocumentsPayload,
+    data_chat: DataChat = Depends(get_data_chat),
+) -> DocumentsResponse:
+    """Add documents to an existing dataset, skipping ids it already has"""
+    return await _upsert_documents(data_chat.add_documents, dataset_name, payload)
+
+
+@router.put("/datasets/{dataset_name}/documents", response_model=DocumentsResponse)
+async def update_documents(
+    dataset_name: str,
+    payload: DocumentsPayload,
+    data_chat: DataChat = Depends(get_data_chat),
+) -> DocumentsResponse:
+    """Re-embed documents of a dataset whose text or metadata changed"""
+    return await _upsert_documents(data_chat.update_documents, dataset_name, payload)
+
+
+@router.delete(
+    "/datasets/{dataset_name}/documents", response_model=RemoveDocumentsResponse
+)
+async def remove_documents(
+    dataset_name: str,
+    payload: RemoveDocumentsPayload,
+    data_chat: DataChat = Depends(get_data_chat),
+) -> RemoveDocumentsResponse:
+    """Remove documents from a dataset by id"""
+    try:
+        removed = await asyncio.to_thread(
+            data_chat.remove_documents, dataset_name, payload.ids
+        )
+        return RemoveDocumentsResponse(removed=removed)
+    except Exception as e:
+        raise HTTPException(500, f"Failed to remove documents: {str(e)}")
+
+
+async def _upsert_documents(
+    method, dataset_name: str, payload: DocumentsPayload
+) -> DocumentsResponse:
+    try:
+        document_class = registry.get(payload.document_type)
+    except KeyError:
+        raise HTTPException(400, f"Unknown document type: {payload.document_type}")
+
+    try:
+        documents = [document_class(item) for item in payload.data]
+        stats = await asyncio.to_thread(method, dataset_name, documents)
+        return DocumentsResponse(
+            rows_read=stats.rows_read,
+            rows_upserted=stats.rows_upserted,
+            rows_unchanged=stats.rows_unchanged,
+            rows_skipped=stats.rows_skipped,
+        )
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(500, f"Failed to update documents: {str(e)}")
+
+
+@router.post(
+    "/datasets/{dataset_name}/jobs", response_model=JobResponse, status_code=202
+)
+async def create_ingestion_job(
+    request: Request,
+    dataset_name: str = Path(
+        ..., description="The name of the dataset to upload data to"
+    ),
+    document_type: str = Query(..., description="Registered document type"),
+    system_prompt: str = Query(..., description="System prompt for the dataset"),
+    context_fields: Optional[List[str]] = Query(
+        None, description="Metadata fields included in the prompt context"
+    ),
+    filter_fields: Optional[List[str]] = Query(
+        None, description="Filterable metadata fields as field:kind"
+    ),
+    embedding_model: Optional[str] = Query(
+        None, description='"local" to embed in process, defaults to OpenAI'
+    ),
+    ingestion: IngestionManager = Depends(get_ingestion_manager),
+) -> JobResponse:
+    """Upload NDJSON data (one JSON object per line) as a background job
+
+    The body is spooled to a temporary file without being parsed, so large
+    uploads return a job id as soon as they are received. Rows are parsed
+    incrementally by the job; poll ``/jobs/{job_id}`` for progress.
+    """
+    try:
+        document_class = registry.get(document_type)
+    except KeyError:
+        raise HTTPException(400, f"Unknown document type: {document_type}")
+
+    # Small uploads stay in memory, large ones spill to disk
+    source = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        async for chunk in request.stream():
+            source.write(chunk)
+        source.seek(0)
+    except Exception as e:
+        source.close()
+        raise HTTPException(400, f"Failed to read upload: {str(e)}")
+
+    try:
+        filters = dict(item.split(":", 1) for item in filter_fields or [])
+    except ValueError:
+        raise HTTPException(400, "filter_fields must be given as field:kind")
+
+    job = ingestion.submit(
+        dataset_name,
+        source,
+        document_class,
+        system_prompt,
+        context_fields,
+        filters or None,
+        embedding_model,
+    )
+    return JobResponse(job_id=job.id, status=job.status.value)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_ingestion_job(
+    job_id: str, ingestion: IngestionManager = Depends(get_ingestion_manager)
+) -> JobStatusResponse:
+    """Report progress of an ingestion job"""
+    job = ingestion.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job '{job_id}' not found")
+    return JobStatusResponse(**job.to_dict())
+
+
 @router.post("/datasets/{dataset_name}/chat", response_model=ChatResponse)
 async def chat(
     dataset_name: str, query: ChatQuery, data_chat: DataChat = Depends(get_data_chat)
 ) -> ChatResponse:
     """Generate a response to user message"""
     try:
-        response = data_chat.generate_response(dataset_name, query.message)
-        return ChatResponse(response=response)
+        response = await data_chat.agenerate_response(
+            dataset_name, query.message, session_id=query.session_id or None
+        )
+        return ChatResponse(response=response, **_context_usage())
     except Exception as e:
         raise HTTPException(500, f"Failed to generate response: {str(e)}")
+
+
+@router.post("/datasets/{dataset_name}/chat/stream")
+async def chat_stream(
+    dataset_name: str, query: ChatQuery, data_chat: DataChat = Depends(get_data_chat)
+) -> StreamingResponse:
+    """Stream a response to user message as Server-Sent Events
+
+    Each token is sent as a ``token`` event. The stream ends with a ``done``
+    event carrying context token usage, or an ``error`` event if generation
+    fails part way.
+    """
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for token in data_chat.astream_response(
+                dataset_name, query.message, session_id=query.session_id or None
+            ):
+                yield _sse("token", {"token": token})
+            yield _sse("done", _context_usage())
+        except Exception as e:
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"Failed to generate response: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats/answer-cache", response_model=AnswerCacheStatsResponse)
+async def answer_cache_stats(
+    data_chat: DataChat = Depends(get_data_chat),
+) -> AnswerCacheStatsResponse:
+    """Report answer cache hit rate and the time it saved"""
+    return AnswerCacheStatsResponse(**data_chat.answer_cache.stats())
+
+
+@router.delete("/datasets/{dataset_name}/sessions/{session_id}", status_code=204)
+async def clear_session(
+    dataset_name: str, session_id: str, data_chat: DataChat = Depends(get_data_chat)
+) -> None:
+    """Forget the conversation history of a session"""
+    await asyncio.to_thread(data_chat.sessions.clear, dataset_name, session_id)
+
+
+def _context_usage() -> Dict[str, float]:
+    packed = DataChat.last_context()
+    if packed is None:
+        return {}
+    return {
+        "context_tokens": packed.tokens_used,
+        "context_tokens_dropped": packed.tokens_dropped,
+        "documents_retrieved": packed.documents_retrieved,
+        "documents_selected": packed.documents_selected,
+        "rerank_ms": packed.rerank_seconds * 1000,
+    }
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
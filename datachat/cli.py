@@ -0,0 +1,74 @@
+"""Command line tools for managing DataChat datasets
+
+Export a dataset's embeddings to a snapshot directory, and import it in
+another environment without embedding any document again:
+
+    python -m datachat.cli export sessions snapshots/sessions
+    python -m datachat.cli import snapshots/sessions --name sessions
+"""
+
+import argparse
+import logging
+from typing import List, Optional
+
+from datachat.core.data_chat import DataChat
+
+
+def export_dataset(chat: DataChat, args: argparse.Namespace) -> None:
+    manifest = chat.export_dataset(args.dataset, args.path, args.batch_size)
+    print(
+        f"Exported {manifest.count} documents of {manifest.name} "
+        f"({manifest.dimension} dimensions) to {args.path}"
+    )
+
+
+def import_dataset(chat: DataChat, args: argparse.Namespace) -> None:
+    stats = chat.import_dataset(args.path, args.name, args.batch_size)
+    print(
+        f"Imported {stats.rows_upserted} documents from {args.path} "
+        f"in {stats.elapsed:.1f}s"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="datachat", description=__doc__.splitlines()[0]
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser(
+        "export", help="Write a dataset's embeddings to a snapshot"
+    )
+    export.add_argument("dataset", help="Name of the dataset to export")
+    export.add_argument("path", help="Snapshot directory, replaced if it exists")
+    export.add_argument("--batch-size", type=int, default=1000)
+    export.set_defaults(handler=export_dataset)
+
+    load = commands.add_parser(
+        "import", help="Load a snapshot without embedding any document"
+    )
+    load.add_argument("path", help="Snapshot directory")
+    load.add_argument(
+        "--name", help="Dataset name to import as, defaults to the exported one"
+    )
+    load.add_argument("--batch-size", type=int, default=500)
+    load.set_defaults(handler=import_dataset)
+
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None, chat: Optional[DataChat] = None) -> None:
+    """Run a command
+
+    Args:
+        argv: Command line arguments, defaults to sys.argv
+        chat: DataChat instance to run the command on, defaults to one
+            built from the environment's configuration
+    """
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args(argv)
+    args.handler(chat or DataChat(), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class _Entry:
+    answer: str
+    embedding: np.ndarray
+    latency: float
+
+
+class AnswerCache:
+    """Size-bounded LRU cache of chat answers, scoped per dataset
+
+    A query hits on an exact match of its normalized text, or on a cached
+    query whose embedding has at least ``similarity_threshold`` cosine
+    similarity with it. Every dataset has a version that is bumped when its
+    documents change; bumping drops the dataset's entries, and answers
+    computed against an older version are never stored.
+    """
+
+    def __init__(self, max_entries: int = 1000, similarity_threshold: float = 0.95):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of answers kept across all datasets
+            similarity_threshold: Minimum cosine similarity for a cached
+                query to count as a near duplicate
+        """
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        # Stacked embeddings of each dataset's entries, rebuilt after changes
+        self._matrices: Dict[str, Tuple[List[Tuple[str, str]], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+    def version(self, dataset_name: str) -> int:
+        with self._lock:
+            return self._versions.get(dataset_name, 0)
+
+    def get(self, dataset_name: str, query: str) -> Optional[str]:
+        """Look up an answer for the exact normalized query"""
+        key = (dataset_name, self.normalize(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._hit(key, entry)
+            self.hits += 1
+            return entry.answer
+
+    def get_similar(self, dataset_name: str, embedding: List[float]) -> Optional[str]:
+        """Look up an answer for a near-duplicate query, counting a miss if none"""
+        with self._lock:
+            keys, matrix = self._matrix(dataset_name)
+            if keys:
+                scores = matrix @ self._unit(embedding)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry = self._entries[keys[best]]
+                    self._hit(keys[best], entry)
+                    self.similar_hits += 1
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        dataset_name: str,
+        query: str,
+        embedding: List[float],
+        answer: str,
+        version: int,
+        latency: float,
+    ) -> None:
+        """Store an answer computed against the given dataset version
+
+        Args:
+            latency: Seconds it took to compute the answer, credited as
+                saved time on every later hit
+        """
+        key = (dataset_name, self.normalize(query))
+        with self._lock:
+            if version != self._versions.get(dataset_name, 0):
+                return
+            self._entries[key] = _Entry(answer, self._unit(embedding), latency)
+            self._entries.move_to_end(key)
+            self._matrices.pop(dataset_name, None)
+            while len(self._entries) > self.max_entries:
+                (evicted, _), _ = self._entries.popitem(last=False)
+                self._matrices.pop(evicted, None)
+
+    def invalidate(self, dataset_name: str) -> None:
+        """Drop a dataset's answers and bump its version"""
+        with self._lock:
+            self._versions[dataset_name] = self._versions.get(dataset_name, 0) + 1
+            for key in [k for k in self._entries if k[0] == dataset_name]:
+                del self._entries[key]
+            self._matrices.pop(dataset_name, None)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.hits + self.similar_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _hit(self, key: Tuple[str, str], entry: _Entry) -> None:
+        self._entries.move_to_end(key)
+        self.saved_seconds += entry.latency
+
+    def _matrix(self, dataset_name: str) -> Tuple[List[Tuple[str, str]], np.ndarray]:
+        if dataset_name not in self._matrices:
+            keys = [k for k in self._entries if k[0] == dataset_name]
+            matrix = (
+                np.stack([self._entries[k].embedding for k in keys])
+                if keys
+                else np.empty((0, 0), dtype=np.float32)
+            )
+            self._matrices[dataset_name] = (keys, matrix)
+        return self._matrices[dataset_name]
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
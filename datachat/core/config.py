@@ -28,6 +28,9 @@ class PineconeConfig:
 
     api_key: str
     region: str
+    # Index holding every dataset as a namespace; None gives each dataset
+    # an index of its own
+    shared_index: Optional[str] = None
 
 
 @dataclass(frozen=True)
@@ -80,6 +83,7 @@ class Config:
             pinecone=PineconeConfig(
                 api_key=os.getenv("PINECONE_API_KEY"),
                 region=os.getenv("PINECONE_REGION"),
+                shared_index=os.getenv("PINECONE_SHARED_INDEX") or None,
             ),
             env=env,
         )
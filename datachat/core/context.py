@@ -0,0 +1,132 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+@dataclass
+class PackedContext:
+    """Retrieved documents rendered into a token-bounded prompt section"""
+
+    text: str
+    documents_used: int = 0
+    documents_dropped: int = 0
+    tokens_used: int = 0
+    tokens_dropped: int = 0
+    # Documents retrieved, and kept by the reranker's cutoff
+    documents_retrieved: int = 0
+    documents_selected: int = 0
+    rerank_seconds: float = 0.0
+
+
+class ContextBuilder:
+    """Packs retrieved documents into the prompt under a token budget
+
+    Each document is projected onto the dataset's context fields, rendered
+    as one compact ``key: value | key: value`` line and included once.
+    Documents are added in retrieval order until the next one would exceed
+    the budget; the rest are dropped.
+    """
+
+    # Context tokens allowed per model, leaving room for the system prompt,
+    # conversation history and the answer
+    MODEL_BUDGETS = {
+        "gpt-4": 4_000,
+        "gpt-4-turbo": 60_000,
+        "gpt-4o": 60_000,
+        "gpt-4o-mini": 60_000,
+        "gpt-3.5-turbo": 8_000,
+    }
+    DEFAULT_BUDGET = 4_000
+
+    def __init__(
+        self,
+        model_name: str = "gpt-4",
+        max_tokens: Optional[int] = None,
+        count_tokens: Optional[Callable[[List[str]], List[int]]] = None,
+    ):
+        """Initialize the builder
+
+        Args:
+            model_name: Inference model the context is packed for
+            max_tokens: Token budget for the context, defaults to the
+                model's entry in MODEL_BUDGETS
+            count_tokens: Optional function returning the token count of
+                each text, defaults to the model's tiktoken encoding
+        """
+        self.model_name = model_name
+        self.max_tokens = max_tokens or self.MODEL_BUDGETS.get(
+            model_name, self.DEFAULT_BUDGET
+        )
+        self._count_tokens = count_tokens
+        self._lock = threading.Lock()
+
+    def build(
+        self, documents: Sequence[Dict[str, Any]], fields: Optional[List[str]] = None
+    ) -> PackedContext:
+        """Render documents into the context, stopping at the token budget
+
+        Args:
+            documents: Retrieved document metadata, most relevant first
+            fields: Metadata fields to include, defaults to all of them
+                except underscore-prefixed ones derived for filtering
+
+        Returns:
+            The rendered context with used and dropped token counts
+        """
+        lines = list(dict.fromkeys(self._render(doc, fields) for doc in documents))
+        lines = [line for line in lines if line]
+        counts = self.count_tokens(lines)
+
+        used = 0
+        budget = self.max_tokens
+        for count in counts:
+            # Every line after the first also costs a newline token
+            cost = count + (1 if used else 0)
+            if cost > budget:
+                break
+            budget -= cost
+            used += 1
+
+        return PackedContext(
+            text="\n".join(lines[:used]),
+            documents_used=used,
+            documents_dropped=len(lines) - used,
+            tokens_used=self.max_tokens - budget,
+            tokens_dropped=sum(counts[used:]),
+        )
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token count of each text"""
+        if self._count_tokens is None:
+            with self._lock:
+                if self._count_tokens is None:
+                    self._count_tokens = self._load_counter()
+        return self._count_tokens(texts)
+
+    def _load_counter(self) -> Callable[[List[str]], List[int]]:
+        try:
+            import tiktoken
+
+            try:
+                encoding = tiktoken.encoding_for_model(self.model_name)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+            return lambda texts: [
+                len(tokens) for tokens in encoding.encode_ordinary_batch(texts)
+            ]
+        except Exception as e:
+            # The encodings are downloaded on first use; estimate when offline
+            logging.warning(f"Falling back to estimated token counts: {e}")
+            return lambda texts: [len(text) // 4 + 1 for text in texts]
+
+    @staticmethod
+    def _render(document: Dict[str, Any], fields: Optional[List[str]]) -> str:
+        keys = fields
+        if keys is None:
+            keys = [key for key in document if not key.startswith("_")]
+        return " | ".join(
+            f"{key}: {document[key]}"
+            for key in keys
+            if document.get(key) not in (None, "")
+        )
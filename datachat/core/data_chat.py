@@ -1,112 +1,966 @@
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import shutil
+import threading
 import time
-from typing import Dict, List, Optional
+from contextvars import ContextVar
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
+import numpy as np
 
 from datachat.core.document import Document
 from datachat.store.pinecone_store import PineconeStore
-from datachat.store.vector_store import VectorStore
+from datachat.store.vector_store import Match, VectorBatch, VectorStore
+from datachat.core.answer_cache import AnswerCache
 from datachat.core.config import Config
-from datachat.core.models import OpenAIEmbedding, OpenAIInference
+from datachat.core import metrics, query_planner
+from datachat.core.context import ContextBuilder, PackedContext
+from datachat.core.models import (
+    EmbeddingModel,
+    InferenceModel,
+    OpenAIEmbedding,
+    OpenAIInference,
+)
 from datachat.core.dataset_repository import Dataset, DatasetRepository
+from datachat.core.embedding_cache import CachedEmbedding, EmbeddingCache
+from datachat.core.exceptions import VectorStoreError
+from datachat.core.ingestion import IngestStats
+from datachat.core.lexical_index import LexicalIndex
+from datachat.core.local_embedding import HashedNgramEmbedding
+from datachat.core.pipeline import IngestPipeline, Row
+from datachat.core.reranker import LexicalReranker, Ranking, Reranker
+from datachat.core.session_memory import InMemorySessionStore, SessionStore
+from datachat.core.snapshot import SnapshotManifest, SnapshotReader, SnapshotWriter
 
-from langchain.memory import ConversationBufferWindowMemory
+
+# Context packed for the latest response of the current thread or task
+_last_context: ContextVar[Optional[PackedContext]] = ContextVar(
+    "last_context", default=None
+)
 
 
 class DataChat:
 
+    # Ways of retrieving documents for a question
+    VECTOR = "vector"
+    HYBRID = "hybrid"
+    SEARCH_MODES = (VECTOR, HYBRID)
+
+    # Documents retrieved per question when callers don't set top_k
+    DEFAULT_TOP_K = {VECTOR: 100, HYBRID: 20}
+
+    # Rank offset of reciprocal rank fusion, damping the weight of top ranks
+    RRF_K = 60
+
+    # Embedding models a dataset can use: the instance's embedding model, or
+    # a local hashed n-gram model fitted to the dataset
+    DEFAULT_EMBEDDING = "default"
+    LOCAL_EMBEDDING = "local"
+    EMBEDDING_MODELS = (DEFAULT_EMBEDDING, LOCAL_EMBEDDING)
+
     def __init__(
         self,
         config: Optional[Config] = None,
         memory_size: int = 3,  # Keep last 3 message pairs by default
+        vector_store: Optional[VectorStore] = None,
+        session_store: Optional[SessionStore] = None,
+        search_mode: str = HYBRID,
+        reranker: Optional[Reranker] = None,
+        embedding_model: Optional[EmbeddingModel] = None,
+        inference_model: Optional[InferenceModel] = None,
     ):
         """Initialize DataChat with documents and system prompt.
 
         Args:
             config: Optional configuration for OpenAI and Pinecone
+            memory_size: Exchanges remembered per conversation when no
+                session store is given
+            vector_store: Optional vector store, defaults to Pinecone
+            session_store: Optional conversation history store, defaults to
+                an in-process store
+            search_mode: "hybrid" fuses BM25 keyword and vector rankings,
+                "vector" uses vector similarity only
+            reranker: Optional reranker choosing the documents sent to the
+                model, defaults to a LexicalReranker
+            embedding_model: Optional embedding model, defaults to OpenAI
+            inference_model: Optional chat model, defaults to OpenAI
+
+        Raises:
+            ValueError: If search_mode is unknown
         """
+        if search_mode not in self.SEARCH_MODES:
+            raise ValueError(
+                f"Unknown search mode '{search_mode}', expected one of "
+                f"{', '.join(self.SEARCH_MODES)}"
+            )
 
         self.config = config or Config.load()
         self.repo = DatasetRepository()
+        self.lexical_index = LexicalIndex()
+        self.search_mode = search_mode
 
         print()
-        self.vector_store = PineconeStore(self.config.pinecone)
-        self.embedding_model = OpenAIEmbedding(self.config.openai)
-        self.inference_model = OpenAIInference(self.config.openai)
-        # Initialize simple window memory
-        self.memory = ConversationBufferWindowMemory(
-            k=memory_size, return_messages=True
+        self.vector_store = vector_store or PineconeStore(self.config.pinecone)
+        self.embedding_model = CachedEmbedding(
+            embedding_model or OpenAIEmbedding(self.config.openai), EmbeddingCache()
+        )
+        self.inference_model = inference_model or OpenAIInference(self.config.openai)
+        self.local_embedding_dir = Path("local_embeddings")
+        self._local_models: Dict[str, HashedNgramEmbedding] = {}
+        self._local_lock = threading.Lock()
+        self.context_builder = ContextBuilder(
+            getattr(self.inference_model, "model_name", "gpt-4")
+        )
+        self.answer_cache = AnswerCache()
+        self.query_planner = query_planner.QueryPlanner()
+        self.reranker = reranker or LexicalReranker()
+        self.sessions = (
+            session_store
+            if session_store is not None
+            else InMemorySessionStore(window=memory_size)
         )
 
     def register_dataset(
-        self, dataset_name: str, documents: List[Document], system_prompt: str
-    ):
-        index_name = self._get_index_name(dataset_name)
+        self,
+        dataset_name: str,
+        documents: Iterable[Document],
+        system_prompt: str,
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+        stats: Optional[IngestStats] = None,
+        context_fields: Optional[List[str]] = None,
+        filter_fields: Optional[Dict[str, str]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> IngestStats:
+        """Embed and upsert documents into the dataset's index
+
+        Documents are consumed lazily and streamed through overlapping
+        render, embed and upsert stages, so memory use is bounded by
+        ``batch_size * max_in_flight`` rather than by the dataset size.
+        Re-registering a dataset only embeds documents whose text or
+        metadata changed and removes documents that are no longer present.
+
+        Args:
+            dataset_name: Name of the dataset
+            documents: Any iterable or generator of documents
+            system_prompt: System prompt used when chatting with the dataset
+            batch_size: Number of documents per embed/upsert batch
+            max_in_flight: Batches buffered between stages, and number of
+                concurrent embed and upsert workers
+            stats: Optional counters to update while ingesting
+            context_fields: Metadata fields included in the prompt context,
+                defaults to all of them
+            filter_fields: Metadata fields questions may be filtered on,
+                mapped to "keyword" or "date"
+            embedding_model: "local" to embed with a hashed n-gram model
+                running in process, "default" or None for the instance's
+                embedding model. Changing it re-embeds the whole dataset.
+
+        Returns:
+            Ingest counters for this registration
+
+        Raises:
+            ValueError: If a filter field kind or embedding model is unknown
+        """
+        embedding_model = self._check_embedding_model(embedding_model)
+        index_name, namespace = self._locate(dataset_name, embedding_model)
+        stats = stats or IngestStats()
+        generation = time.time_ns()
 
         logging.info(f"Registering dataset: {dataset_name}")
 
-        self.repo.upsert_dataset(Dataset(dataset_name, index_name, system_prompt))
+        dataset = Dataset(
+            dataset_name,
+            index_name,
+            system_prompt,
+            context_fields=context_fields,
+            filter_fields=self._check_filter_fields(filter_fields),
+            embedding_model=embedding_model,
+            namespace=namespace,
+        )
+        self._reset_if_vectors_moved(dataset)
+        self.repo.upsert_dataset(dataset)
 
-        vectors = [
-            (
-                document.id,
-                self.embedding_model.create_embedding(document.text),
-                document.metadata,
-            )
-            for document in documents
-        ]
-        self.vector_store.upsert(index_name, vectors=vectors)
+        pipeline = self._ingest_pipeline(
+            dataset, generation, stats, batch_size, max_in_flight
+        )
+        pipeline.run(
+            documents,
+            stats,
+            embed=lambda texts: self._embed_texts(dataset, texts, stats),
+            upsert=lambda vectors: self.vector_store.upsert(
+                index_name, vectors, namespace=namespace
+            ),
+        )
+        self._remove_stale_documents(dataset, generation, stats)
+
+        logging.info("Waiting for vectors to be indexed...")
+        waited = self._wait_for_indexing(dataset, pipeline.last_upserted)
+        logging.info(f"Vectors are indexed and ready for querying after {waited:.2f}s")
+
+        self.answer_cache.invalidate(dataset_name)
+        self._log_ingest(f"registering dataset: {dataset_name}", stats)
+        return stats
+
+    async def aregister_dataset(
+        self,
+        dataset_name: str,
+        documents: Iterable[Document],
+        system_prompt: str,
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+        stats: Optional[IngestStats] = None,
+        context_fields: Optional[List[str]] = None,
+        filter_fields: Optional[Dict[str, str]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> IngestStats:
+        """Async variant of register_dataset that never blocks the event loop"""
+        embedding_model = self._check_embedding_model(embedding_model)
+        index_name, namespace = self._locate(dataset_name, embedding_model)
+        stats = stats or IngestStats()
+        generation = time.time_ns()
+
+        logging.info(f"Registering dataset: {dataset_name}")
+
+        dataset = Dataset(
+            dataset_name,
+            index_name,
+            system_prompt,
+            context_fields=context_fields,
+            filter_fields=self._check_filter_fields(filter_fields),
+            embedding_model=embedding_model,
+            namespace=namespace,
+        )
+        await asyncio.to_thread(self._reset_if_vectors_moved, dataset)
+        await asyncio.to_thread(self.repo.upsert_dataset, dataset)
+
+        pipeline = self._ingest_pipeline(
+            dataset, generation, stats, batch_size, max_in_flight
+        )
+        await pipeline.arun(
+            documents,
+            stats,
+            embed=lambda texts: self._aembed_texts(dataset, texts, stats),
+            upsert=lambda vectors: self.vector_store.aupsert(
+                index_name, vectors, namespace=namespace
+            ),
+        )
+        await asyncio.to_thread(
+            self._remove_stale_documents, dataset, generation, stats
+        )
 
         logging.info("Waiting for vectors to be indexed...")
-        self._wait_for_indexing()
-        logging.info("Vectors are now indexed and ready for querying")
+        waited = await self._await_indexing(dataset, pipeline.last_upserted)
+        logging.info(f"Vectors are indexed and ready for querying after {waited:.2f}s")
+
+        self.answer_cache.invalidate(dataset_name)
+        self._log_ingest(f"registering dataset: {dataset_name}", stats)
+        return stats
+
+    def add_documents(
+        self,
+        dataset_name: str,
+        documents: Iterable[Document],
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+    ) -> IngestStats:
+        """Add new documents to an existing dataset
+
+        Documents whose id is already in the dataset are skipped; use
+        update_documents to change them.
+
+        Raises:
+            Exception: If dataset doesn't exist
+        """
+        return self._upsert_documents(
+            dataset_name, documents, batch_size, max_in_flight, mode="add"
+        )
+
+    def update_documents(
+        self,
+        dataset_name: str,
+        documents: Iterable[Document],
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+    ) -> IngestStats:
+        """Re-embed documents of a dataset whose text or metadata changed
+
+        Documents whose id is not in the dataset are skipped; use
+        add_documents to add them.
+
+        Raises:
+            Exception: If dataset doesn't exist
+        """
+        return self._upsert_documents(
+            dataset_name, documents, batch_size, max_in_flight, mode="update"
+        )
+
+    def remove_documents(self, dataset_name: str, document_ids: List[str]) -> int:
+        """Remove documents from a dataset by id
+
+        Returns:
+            Number of removed documents that were part of the dataset
+
+        Raises:
+            Exception: If dataset doesn't exist
+        """
+        dataset = self._get_dataset(dataset_name)
+        known = self.repo.get_document_hashes(dataset_name, document_ids)
+        if known:
+            self.vector_store.delete_vectors(
+                dataset.index_name, list(known), namespace=dataset.namespace
+            )
+            self.lexical_index.delete(dataset_name, list(known))
+            self.repo.delete_document_hashes(dataset_name, list(known))
+            self.answer_cache.invalidate(dataset_name)
+        logging.info(f"Removed {len(known)} documents from dataset: {dataset_name}")
+        return len(known)
+
+    def _upsert_documents(
+        self,
+        dataset_name: str,
+        documents: Iterable[Document],
+        batch_size: int,
+        max_in_flight: int,
+        mode: str,
+    ) -> IngestStats:
+        dataset = self._get_dataset(dataset_name)
+        stats = IngestStats()
 
-        logging.info(f"Finished registering dataset: {dataset_name}")
+        pipeline = self._ingest_pipeline(
+            dataset, time.time_ns(), stats, batch_size, max_in_flight, mode
+        )
+        pipeline.run(
+            documents,
+            stats,
+            embed=lambda texts: self._embed_texts(dataset, texts, stats),
+            upsert=lambda vectors: self.vector_store.upsert(
+                dataset.index_name, vectors, namespace=dataset.namespace
+            ),
+        )
+        self._wait_for_indexing(dataset, pipeline.last_upserted)
 
-    def generate_response(self, dataset_name, user_query: str, top_k: int = 100) -> str:
+        self.answer_cache.invalidate(dataset_name)
+        self._log_ingest(f"updating dataset: {dataset_name}", stats)
+        return stats
+
+    def generate_response(
+        self,
+        dataset_name,
+        user_query: str,
+        top_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> str:
         """Generate a response for a dataset based on the user query and relevant context.
 
+        Answers to questions asked without prior conversation are cached per
+        dataset, so repeated and near-duplicate questions skip retrieval and
+        inference.
+
         Args:
             user_query: User's question about the data
+            top_k: Candidate documents retrieved before reranking, defaults
+                to DEFAULT_TOP_K of the search mode
+            session_id: Conversation whose history is used and extended.
+                Without one, the question is answered on its own and not
+                remembered
 
         Returns:
             Generated response from the chat model
         """
-        # Get relevant context from vector store
+        started = time.perf_counter()
+        dataset = self._get_dataset(dataset_name)
+        history = self._history_text(dataset_name, session_id)
+        version = self.answer_cache.version(dataset_name)
+
+        response = self._cached_answer(dataset_name, user_query, history)
+        if response is None:
+            query_vector = self._embedding_for(dataset).create_embedding(user_query)
+            response = self._cached_answer(
+                dataset_name, user_query, history, query_vector
+            )
+
+        if response is None:
+            # Get relevant context from vector store
+            ranking = self._retrieve(dataset, user_query, query_vector, top_k)
+            context = self._pack_context(dataset, ranking)
+
+            response = self.inference_model.generate_response(
+                context, user_query, dataset.system_prompt, history
+            )
+            if not history:
+                self.answer_cache.put(
+                    dataset_name,
+                    user_query,
+                    query_vector,
+                    response,
+                    version,
+                    time.perf_counter() - started,
+                )
+
+        # Save the interaction to the conversation history
+        if session_id is not None:
+            self.sessions.append(dataset_name, session_id, user_query, response)
+
+        return response
+
+    async def agenerate_response(
+        self,
+        dataset_name,
+        user_query: str,
+        top_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> str:
+        """Async variant of generate_response that never blocks the event loop"""
+        started = time.perf_counter()
+        dataset = await asyncio.to_thread(self._get_dataset, dataset_name)
+        history = await asyncio.to_thread(self._history_text, dataset_name, session_id)
+        version = self.answer_cache.version(dataset_name)
+
+        response = self._cached_answer(dataset_name, user_query, history)
+        if response is None:
+            query_vector = await self._embedding_for(dataset).acreate_embedding(
+                user_query
+            )
+            response = self._cached_answer(
+                dataset_name, user_query, history, query_vector
+            )
+
+        if response is None:
+            ranking = await self._aretrieve(dataset, user_query, query_vector, top_k)
+            context = self._pack_context(dataset, ranking)
+
+            response = await self.inference_model.agenerate_response(
+                context, user_query, dataset.system_prompt, history
+            )
+            if not history:
+                self.answer_cache.put(
+                    dataset_name,
+                    user_query,
+                    query_vector,
+                    response,
+                    version,
+                    time.perf_counter() - started,
+                )
+
+        if session_id is not None:
+            await asyncio.to_thread(
+                self.sessions.append, dataset_name, session_id, user_query, response
+            )
+
+        return response
+
+    def stream_response(
+        self,
+        dataset_name,
+        user_query: str,
+        top_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Stream the response for a user query token by token
+
+        A cached answer is yielded in one piece. The full response is saved
+        to the session history once the stream is exhausted.
+        """
+        started = time.perf_counter()
+        dataset = self._get_dataset(dataset_name)
+        history = self._history_text(dataset_name, session_id)
+        version = self.answer_cache.version(dataset_name)
+
+        response = self._cached_answer(dataset_name, user_query, history)
+        if response is None:
+            query_vector = self._embedding_for(dataset).create_embedding(user_query)
+            response = self._cached_answer(
+                dataset_name, user_query, history, query_vector
+            )
+
+        if response is not None:
+            yield response
+        else:
+            ranking = self._retrieve(dataset, user_query, query_vector, top_k)
+            context = self._pack_context(dataset, ranking)
+
+            tokens = []
+            for token in self.inference_model.stream_response(
+                context, user_query, dataset.system_prompt, history
+            ):
+                tokens.append(token)
+                yield token
+
+            response = "".join(tokens)
+            if not history:
+                self.answer_cache.put(
+                    dataset_name,
+                    user_query,
+                    query_vector,
+                    response,
+                    version,
+                    time.perf_counter() - started,
+                )
+
+        if session_id is not None:
+            self.sessions.append(dataset_name, session_id, user_query, response)
+
+    async def astream_response(
+        self,
+        dataset_name,
+        user_query: str,
+        top_k: Optional[int] = None,
+        session_id: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Async variant of stream_response"""
+        started = time.perf_counter()
+        dataset = await asyncio.to_thread(self._get_dataset, dataset_name)
+        history = await asyncio.to_thread(self._history_text, dataset_name, session_id)
+        version = self.answer_cache.version(dataset_name)
+
+        response = self._cached_answer(dataset_name, user_query, history)
+        if response is None:
+            query_vector = await self._embedding_for(dataset).acreate_embedding(
+                user_query
+            )
+            response = self._cached_answer(
+                dataset_name, user_query, history, query_vector
+            )
+
+        if response is not None:
+            yield response
+        else:
+            ranking = await self._aretrieve(dataset, user_query, query_vector, top_k)
+            context = self._pack_context(dataset, ranking)
+
+            tokens = []
+            async for token in self.inference_model.astream_response(
+                context, user_query, dataset.system_prompt, history
+            ):
+                tokens.append(token)
+                yield token
+
+            response = "".join(tokens)
+            if not history:
+                self.answer_cache.put(
+                    dataset_name,
+                    user_query,
+                    query_vector,
+                    response,
+                    version,
+                    time.perf_counter() - started,
+                )
+
+        if session_id is not None:
+            await asyncio.to_thread(
+                self.sessions.append, dataset_name, session_id, user_query, response
+            )
+
+    def _retrieve(
+        self,
+        dataset: Dataset,
+        user_query: str,
+        query_vector: List[float],
+        top_k: Optional[int],
+    ) -> Ranking:
+        """Search the dataset, filtered on metadata the question mentions
+
+        Falls back to an unfiltered search when the filter matches nothing.
+        The candidates are reranked and cut down to the relevant ones.
+        """
+        top_k = top_k or self.DEFAULT_TOP_K[self.search_mode]
+        filter = self._plan_filter(dataset, user_query)
+        matches = []
+        if filter is not None:
+            matches = self._search(dataset, user_query, query_vector, top_k, filter)
+        if not matches:
+            matches = self._search(dataset, user_query, query_vector, top_k)
+        return self.reranker.rerank(user_query, matches)
+
+    async def _aretrieve(
+        self,
+        dataset: Dataset,
+        user_query: str,
+        query_vector: List[float],
+        top_k: Optional[int],
+    ) -> Ranking:
+        """Async variant of _retrieve"""
+        top_k = top_k or self.DEFAULT_TOP_K[self.search_mode]
+        filter = await asyncio.to_thread(self._plan_filter, dataset, user_query)
+        matches = []
+        if filter is not None:
+            matches = await self._asearch(
+                dataset, user_query, query_vector, top_k, filter
+            )
+        if not matches:
+            matches = await self._asearch(dataset, user_query, query_vector, top_k)
+        return await asyncio.to_thread(self.reranker.rerank, user_query, matches)
+
+    def _search(
+        self,
+        dataset: Dataset,
+        user_query: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict] = None,
+    ) -> List[Match]:
+        if self.search_mode == self.VECTOR:
+            return self.vector_store.query(
+                dataset.index_name, query_vector, top_k, filter, dataset.namespace
+            )
+        # Fuse deeper candidate lists than the result so documents ranked
+        # moderately by both retrievers can reach the top
+        vector_matches = self.vector_store.query(
+            dataset.index_name, query_vector, top_k * 2, filter, dataset.namespace
+        )
+        lexical_matches = self.lexical_index.query(
+            dataset.name, user_query, top_k * 2, filter
+        )
+        return self._fuse([vector_matches, lexical_matches], top_k)
+
+    async def _asearch(
+        self,
+        dataset: Dataset,
+        user_query: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict] = None,
+    ) -> List[Match]:
+        if self.search_mode == self.VECTOR:
+            return await self.vector_store.aquery(
+                dataset.index_name, query_vector, top_k, filter, dataset.namespace
+            )
+        vector_matches, lexical_matches = await asyncio.gather(
+            self.vector_store.aquery(
+                dataset.index_name, query_vector, top_k * 2, filter, dataset.namespace
+            ),
+            asyncio.to_thread(
+                self.lexical_index.query, dataset.name, user_query, top_k * 2, filter
+            ),
+        )
+        return self._fuse([vector_matches, lexical_matches], top_k)
+
+    def _fuse(self, rankings: List[List[Match]], top_k: int) -> List[Match]:
+        """Merge rankings by reciprocal rank fusion
+
+        Every ranking contributes 1 / (RRF_K + rank) to a document's score,
+        so the retrievers' incomparable raw scores never need calibrating.
+        """
+        scores: Dict[str, float] = {}
+        metadata: Dict[str, Dict[str, Any]] = {}
+        for matches in rankings:
+            for rank, match in enumerate(matches, start=1):
+                scores[match.id] = scores.get(match.id, 0.0) + 1.0 / (self.RRF_K + rank)
+                metadata.setdefault(match.id, match.metadata)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return [
+            Match(doc_id, scores[doc_id], metadata[doc_id]) for doc_id in ranked[:top_k]
+        ]
+
+    def _plan_filter(self, dataset: Dataset, user_query: str) -> Optional[Dict]:
+        if not dataset.filter_fields:
+            return None
+        filter = self.query_planner.plan(
+            dataset.name,
+            user_query,
+            dataset.filter_fields,
+            self.repo.get_field_values(dataset.name),
+        )
+        if filter is not None:
+            logging.info(f"Filtering dataset {dataset.name} on {filter}")
+        return filter
+
+    def _cached_answer(
+        self,
+        dataset_name: str,
+        user_query: str,
+        history: str,
+        query_vector: Optional[List[float]] = None,
+    ) -> Optional[str]:
+        """Look up a cached answer, by exact query or by query embedding
+
+        Follow-up questions depend on the conversation so never hit the cache.
+        """
+        if history:
+            return None
+        if query_vector is None:
+            answer = self.answer_cache.get(dataset_name, user_query)
+            # A miss here is followed by a lookup by embedding
+            metrics.record_cache("answer", int(answer is not None))
+        else:
+            answer = self.answer_cache.get_similar(dataset_name, query_vector)
+            metrics.record_cache("answer", int(answer is not None), int(answer is None))
+        if answer is not None:
+            _last_context.set(PackedContext(text=""))
+            logging.info(f"Answered from cache for dataset: {dataset_name}")
+        return answer
+
+    @staticmethod
+    def last_context() -> Optional[PackedContext]:
+        """Context packed for the latest response in this thread or task"""
+        return _last_context.get()
+
+    def _pack_context(self, dataset: Dataset, ranking: Ranking) -> str:
+        with metrics.timed("context"):
+            packed = self.context_builder.build(
+                ranking.documents, dataset.context_fields
+            )
+        packed.documents_retrieved = ranking.candidates
+        packed.documents_selected = len(ranking.matches)
+        packed.rerank_seconds = ranking.seconds
+        _last_context.set(packed)
+        logging.info(
+            f"Reranked {ranking.candidates} documents in "
+            f"{ranking.seconds * 1000:.1f}ms, keeping {len(ranking.matches)}"
+        )
+        logging.info(
+            f"Packed {packed.documents_used} documents into {packed.tokens_used} "
+            f"context tokens ({packed.documents_dropped} documents, "
+            f"{packed.tokens_dropped} tokens dropped)"
+        )
+        return packed.text
+
+    def _get_dataset(self, dataset_name: str) -> Dataset:
         dataset: Dataset = self.repo.get_dataset(dataset_name)
         if not dataset:
             raise Exception(f"Dataset {dataset_name} not found")
+        return dataset
+
+    def _history_text(self, dataset_name: str, session_id: Optional[str]) -> str:
+        """Render the conversation history of a session for the prompt"""
+        if session_id is None:
+            return ""
+        return "\n".join(
+            f"Human: {user_message}\nAssistant: {response}"
+            for user_message, response in self.sessions.history(
+                dataset_name, session_id
+            )
+        )
+
+    def _embed_texts(
+        self, dataset: Dataset, texts: List[str], stats: IngestStats
+    ) -> List[List[float]]:
+        model = self._embedding_for(dataset, fit_texts=texts)
+        if isinstance(model, CachedEmbedding):
+            embeddings, hits = model.create_embeddings_with_hits(texts)
+            stats.increment(rows_cached=hits, rows_embedded=len(texts) - hits)
+        else:
+            embeddings = model.create_embeddings(texts)
+            stats.increment(rows_embedded=len(texts))
+        return embeddings
 
-        query_vector = self.embedding_model.create_embedding(user_query)
-        context = self.vector_store.search(dataset.index_name, query_vector, top_k)
+    async def _aembed_texts(
+        self, dataset: Dataset, texts: List[str], stats: IngestStats
+    ) -> List[List[float]]:
+        model = await asyncio.to_thread(self._embedding_for, dataset, texts)
+        if isinstance(model, CachedEmbedding):
+            embeddings, hits = await model.acreate_embeddings_with_hits(texts)
+            stats.increment(rows_cached=hits, rows_embedded=len(texts) - hits)
+        else:
+            embeddings = await model.acreate_embeddings(texts)
+            stats.increment(rows_embedded=len(texts))
+        return embeddings
 
-        # Get conversation history
-        history = self.memory.load_memory_variables({}).get("history", [])
+    def _embedding_for(
+        self, dataset: Dataset, fit_texts: Optional[List[str]] = None
+    ) -> EmbeddingModel:
+        """Embedding model of a dataset
+
+        Args:
+            fit_texts: Documents to fit a local model on if it isn't yet
+        """
+        if dataset.embedding_model != self.LOCAL_EMBEDDING:
+            return self.embedding_model
 
-        # Create prompt with history and context
-        history_text = "\n".join(
-            [
-                (
-                    f"Human: {msg.content}"
-                    if msg.type == "human"
-                    else f"Assistant: {msg.content}"
+        path = self.local_embedding_dir / f"{dataset.name}.npz"
+        with self._local_lock:
+            model = self._local_models.get(dataset.name)
+            if model is None:
+                model = (
+                    HashedNgramEmbedding.load(path)
+                    if path.exists()
+                    else HashedNgramEmbedding()
                 )
-                for msg in history
-            ]
-        )
+                self._local_models[dataset.name] = model
+            if fit_texts and not model.fitted:
+                # The first documents fix the IDF weights for good
+                model.fit(fit_texts)
+                model.save(path)
+        return model
+
+    def _forget_local_model(self, dataset_name: str) -> None:
+        with self._local_lock:
+            self._local_models.pop(dataset_name, None)
+            (self.local_embedding_dir / f"{dataset_name}.npz").unlink(missing_ok=True)
 
-        response = self.inference_model.generate_response(
-            context, user_query, dataset.system_prompt, history_text
+    def _reset_if_vectors_moved(self, dataset: Dataset) -> None:
+        """Drop a dataset's vectors if they were made by another model or
+        are stored in another index or namespace"""
+        previous = self.repo.get_dataset(dataset.name)
+        if previous is None or (
+            previous.embedding_model == dataset.embedding_model
+            and previous.index_name == dataset.index_name
+            and previous.namespace == dataset.namespace
+        ):
+            return
+        logging.info(
+            f"Embedding model or index of {dataset.name} changed, "
+            "re-embedding all documents"
         )
+        self.vector_store.delete(previous.index_name, previous.namespace)
+        self.repo.delete_document_hashes(dataset.name)
+        self._forget_local_model(dataset.name)
+        self.answer_cache.invalidate(dataset.name)
 
-        # Save the interaction to memory
-        self.memory.save_context({"input": user_query}, {"output": response})
+    def _ingest_pipeline(
+        self,
+        dataset: Dataset,
+        generation: int,
+        stats: IngestStats,
+        batch_size: int,
+        max_in_flight: int,
+        mode: str = "all",
+    ) -> IngestPipeline:
+        """Pipeline that skips unchanged documents and records content hashes
 
-        return response
+        Args:
+            mode: "all" accepts every changed document, "add" only unknown
+                ids and "update" only known ids
+        """
+        dataset_name = dataset.name
+        keyword_fields = [
+            field
+            for field, kind in (dataset.filter_fields or {}).items()
+            if kind == query_planner.KEYWORD
+        ]
+
+        def select(rows: List[Row]) -> List[Row]:
+            # Hash the annotated metadata so declaring new filter fields
+            # rewrites every document
+            rows = [
+                (doc_id, text, query_planner.annotate(meta, dataset.filter_fields))
+                for doc_id, text, meta in rows
+            ]
+            hashes = {
+                doc_id: self._content_hash(text, meta) for doc_id, text, meta in rows
+            }
+            known = self.repo.get_document_hashes(dataset_name, list(hashes))
+
+            unchanged = [d for d, h in hashes.items() if known.get(d) == h]
+            # Mark unchanged documents as present so they are not treated as stale
+            self.repo.touch_document_hashes(dataset_name, unchanged, generation)
+            # Backfill documents embedded before the keyword index existed
+            unchanged_ids = set(unchanged)
+            self.lexical_index.upsert_missing(
+                dataset_name, [row for row in rows if row[0] in unchanged_ids]
+            )
+
+            selected = [
+                row
+                for row in rows
+                if known.get(row[0]) != hashes[row[0]]
+                and (mode == "all" or (row[0] in known) == (mode == "update"))
+            ]
+            stats.increment(
+                rows_unchanged=len(unchanged),
+                rows_skipped=len(rows) - len(unchanged) - len(selected),
+            )
+            return selected
+
+        def on_upserted(rows: List[Row]) -> None:
+            hashes = {
+                doc_id: self._content_hash(text, meta) for doc_id, text, meta in rows
+            }
+            self.repo.upsert_document_hashes(dataset_name, hashes, generation)
+            self.lexical_index.upsert(dataset_name, rows)
+            self.repo.add_field_values(
+                dataset_name,
+                {
+                    field: self._keyword_values(meta.get(field) for _, _, meta in rows)
+                    for field in keyword_fields
+                },
+            )
+
+        return IngestPipeline(batch_size, max_in_flight, select, on_upserted)
+
+    @staticmethod
+    def _keyword_values(values: Iterable[Any]) -> Set[str]:
+        """Short string values, including list items, worth matching in questions"""
+        found = set()
+        for value in values:
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, str) and 0 < len(item) <= 100:
+                    found.add(item)
+        return found
+
+    @classmethod
+    def _check_embedding_model(cls, embedding_model: Optional[str]) -> Optional[str]:
+        if embedding_model in (None, cls.DEFAULT_EMBEDDING):
+            return None
+        if embedding_model not in cls.EMBEDDING_MODELS:
+            raise ValueError(
+                f"Unknown embedding model '{embedding_model}', expected one of "
+                f"{', '.join(cls.EMBEDDING_MODELS)}"
+            )
+        return embedding_model
+
+    @staticmethod
+    def _check_filter_fields(
+        filter_fields: Optional[Dict[str, str]],
+    ) -> Optional[Dict[str, str]]:
+        for field, kind in (filter_fields or {}).items():
+            if kind not in query_planner.FIELD_KINDS:
+                raise ValueError(
+                    f"Unknown kind '{kind}' for filter field '{field}', expected "
+                    f"one of {', '.join(query_planner.FIELD_KINDS)}"
+                )
+        return filter_fields
+
+    def _remove_stale_documents(
+        self, dataset: Dataset, generation: int, stats: IngestStats
+    ) -> None:
+        """Delete documents that were not part of the latest registration"""
+        for ids in self.repo.stale_document_ids(dataset.name, generation):
+            self.vector_store.delete_vectors(
+                dataset.index_name, ids, namespace=dataset.namespace
+            )
+            self.lexical_index.delete(dataset.name, ids)
+            self.repo.delete_document_hashes(dataset.name, ids)
+            stats.increment(rows_deleted=len(ids))
+
+    @staticmethod
+    def _content_hash(text: str, metadata: Dict) -> str:
+        payload = json.dumps([text, metadata], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _log_ingest(action: str, stats: IngestStats) -> None:
+        stats.finish()
+        metrics.observe("ingest", stats.elapsed)
+        for outcome in ("upserted", "unchanged", "skipped", "deleted"):
+            metrics.INGEST_ROWS.inc(getattr(stats, f"rows_{outcome}"), outcome)
+        metrics.INGEST_ROWS_PER_SECOND.set(stats.rows_per_second)
+        logging.info(
+            f"Finished {action} ({stats.rows_upserted} upserted, "
+            f"{stats.rows_unchanged} unchanged, {stats.rows_deleted} deleted, "
+            f"{stats.rows_per_second:.1f} rows/s)"
+        )
 
     def delete_dataset(self, dataset_name: str) -> None:
         """Delete a dataset from both SQLite and Pinecone
 
+        A dataset stored in a shared index only has its namespace deleted.
+
         Args:
             dataset_name: Name of the dataset to delete
 
@@ -121,10 +975,15 @@ class DataChat:
 
         try:
             # Delete from Pinecone first
-            self.vector_store.delete(dataset.index_name)
+            self.vector_store.delete(dataset.index_name, dataset.namespace)
 
             # Delete from SQLite
+            self.lexical_index.delete(dataset_name)
+            self.repo.delete_document_hashes(dataset_name)
+            self.repo.delete_field_values(dataset_name)
             self.repo.delete_dataset(dataset_name)
+            self._forget_local_model(dataset_name)
+            self.answer_cache.invalidate(dataset_name)
 
             logging.info(f"Successfully deleted dataset '{dataset_name}'")
 
@@ -132,9 +991,283 @@ class DataChat:
             logging.error(f"Failed to delete dataset '{dataset_name}': {str(e)}")
             raise
 
-    def _wait_for_indexing(self, delay: int = 10):
-        # Initial delay to allow indexing to start
-        time.sleep(delay)
+    def export_dataset(
+        self, dataset_name: str, path: str, batch_size: int = 1000
+    ) -> SnapshotManifest:
+        """Write a dataset's embeddings and settings to a snapshot directory
+
+        Vectors are read back from the vector store, so a dataset can be
+        rebuilt from the snapshot without embedding any document again.
+
+        Args:
+            dataset_name: Name of the dataset to export
+            path: Directory to write the snapshot to, replaced if it exists
+            batch_size: Documents read from the stores at a time
+
+        Returns:
+            Manifest of the written snapshot
+
+        Raises:
+            Exception: If dataset doesn't exist
+            VectorStoreError: If documents are missing from the vector store
+        """
+        dataset = self._get_dataset(dataset_name)
+        writer = SnapshotWriter(path, self.repo.count_documents(dataset_name))
+        try:
+            for hashes in self.repo.document_hash_batches(dataset_name, batch_size):
+                ids = list(hashes)
+                vectors = {
+                    doc_id: (vector, metadata)
+                    for doc_id, vector, metadata in self.vector_store.fetch(
+                        dataset.index_name, ids, namespace=dataset.namespace
+                    )
+                }
+                if len(vectors) < len(ids):
+                    raise VectorStoreError(
+                        f"{len(ids) - len(vectors)} documents of {dataset_name} "
+                        "are missing from the vector store"
+                    )
+                terms = self.lexical_index.get_terms(dataset_name, ids)
+                writer.write(
+                    [
+                        {
+                            "id": doc_id,
+                            "metadata": vectors[doc_id][1],
+                            "hash": hashes[doc_id],
+                            "terms": terms[doc_id],
+                        }
+                        for doc_id in ids
+                    ],
+                    np.asarray([vectors[doc_id][0] for doc_id in ids], np.float32),
+                )
+
+            if dataset.embedding_model == self.LOCAL_EMBEDDING:
+                writer.include_local_model(
+                    self.local_embedding_dir / f"{dataset_name}.npz"
+                )
+            manifest = SnapshotManifest(
+                name=dataset_name,
+                system_prompt=dataset.system_prompt,
+                embedding_model=dataset.embedding_model,
+                model_name=self._model_name(dataset),
+                count=writer.count,
+                dimension=writer.dimension,
+                context_fields=dataset.context_fields,
+                filter_fields=dataset.filter_fields,
+                field_values=self.repo.get_field_values(dataset_name),
+            )
+            writer.commit(manifest)
+        except Exception:
+            writer.abort()
+            raise
+
+        logging.info(f"Exported {manifest.count} documents of {dataset_name} to {path}")
+        return manifest
+
+    def import_dataset(
+        self, path: str, dataset_name: Optional[str] = None, batch_size: int = 500
+    ) -> IngestStats:
+        """Load a snapshot written by export_dataset into the vector store
+
+        Nothing is embedded: the snapshot's records and memory-mapped
+        embeddings are streamed batch_size at a time into one bulk load,
+        so snapshots larger than memory load too. Only the vector store
+        holds on to ids and metadata. A dataset with the same name is
+        replaced, but only once the vectors are loaded: if loading fails,
+        the existing dataset keeps serving questions. The snapshot is
+        then read a second time, again batch by batch, for the content
+        hashes and terms of its documents.
+
+        Args:
+            path: Snapshot directory
+            dataset_name: Name to import the dataset as, defaults to the
+                name it was exported under
+            batch_size: Documents read from the snapshot at a time
+
+        Returns:
+            Ingest counters for the import
+
+        Raises:
+            ValueError: If path is not a snapshot, or its vectors were made
+                by another model than this instance's embedding model
+        """
+        snapshot = SnapshotReader(path)
+        manifest = snapshot.manifest
+        dataset_name = dataset_name or manifest.name
+        embedding_model = self._check_embedding_model(manifest.embedding_model)
+        model_name = getattr(self.embedding_model, "model_name", None)
+        if embedding_model is None and manifest.model_name != model_name:
+            raise ValueError(
+                f"Snapshot vectors were made by {manifest.model_name}, "
+                f"but questions would be embedded by {model_name}"
+            )
+
+        index_name, namespace = self._locate(dataset_name, embedding_model)
+        dataset = Dataset(
+            dataset_name,
+            index_name,
+            manifest.system_prompt,
+            context_fields=manifest.context_fields,
+            filter_fields=manifest.filter_fields,
+            embedding_model=embedding_model,
+            namespace=namespace,
+        )
+        previous = self.repo.get_dataset(dataset_name)
+
+        logging.info(f"Importing snapshot {path} into dataset: {dataset_name}")
+        stats = IngestStats()
+        generation = time.time_ns()
+        last_batch: List[str] = []
 
-    def _get_index_name(self, dataset_name):
-        return "datachat-" + dataset_name
+        def vector_batches() -> Iterator[VectorBatch]:
+            for records, vectors in snapshot.batches(batch_size):
+                last_batch[:] = [record["id"] for record in records]
+                stats.increment(rows_upserted=len(records))
+                yield last_batch[:], vectors, [r["metadata"] for r in records]
+
+        self.vector_store.bulk_load(index_name, vector_batches(), namespace=namespace)
+
+        # The vectors are in place: switch the dataset over to the snapshot
+        if previous is not None and (previous.index_name, previous.namespace) != (
+            index_name,
+            namespace,
+        ):
+            self.vector_store.delete(previous.index_name, previous.namespace)
+        if snapshot.local_model_path is not None:
+            self.local_embedding_dir.mkdir(parents=True, exist_ok=True)
+            target = self.local_embedding_dir / f"{dataset_name}.npz"
+            tmp = target.with_name(target.name + ".tmp")
+            shutil.copyfile(snapshot.local_model_path, tmp)
+            with self._local_lock:
+                self._local_models.pop(dataset_name, None)
+                os.replace(tmp, target)
+        else:
+            self._forget_local_model(dataset_name)
+        self.repo.upsert_dataset(dataset)
+        for records, _ in snapshot.batches(batch_size):
+            self.repo.upsert_document_hashes(
+                dataset_name,
+                {record["id"]: record["hash"] for record in records},
+                generation,
+            )
+            self.lexical_index.upsert_terms(
+                dataset_name,
+                [
+                    (record["id"], record["terms"], record["metadata"])
+                    for record in records
+                ],
+            )
+        self._remove_stale_documents(dataset, generation, stats)
+        self.repo.delete_field_values(dataset_name)
+        self.repo.add_field_values(dataset_name, manifest.field_values)
+
+        self._wait_for_indexing(dataset, last_batch)
+        self.answer_cache.invalidate(dataset_name)
+        self._log_ingest(f"importing dataset: {dataset_name}", stats)
+        return stats
+
+    def _model_name(self, dataset: Dataset) -> Optional[str]:
+        """Name of the model a dataset's vectors are embedded with"""
+        if dataset.embedding_model == self.LOCAL_EMBEDDING:
+            return self._embedding_for(dataset).model_name
+        return getattr(self.embedding_model, "model_name", None)
+
+    def _wait_for_indexing(
+        self,
+        dataset: Dataset,
+        ids: List[str],
+        timeout: float = 60.0,
+        initial_delay: float = 0.1,
+        max_delay: float = 2.0,
+    ) -> float:
+        """Poll the vector store until the vectors upserted last are visible
+
+        Batches become visible in the order they were written, so once the
+        last one can be fetched the ones before it can be too. Nothing is
+        polled when nothing was upserted, as Pinecone only creates an
+        index on the first upsert.
+
+        Args:
+            dataset: Dataset whose vectors were upserted
+            ids: Ids of the batch upserted last
+            timeout: Maximum number of seconds to wait
+            initial_delay: First polling interval, doubled after every poll
+            max_delay: Upper bound on the polling interval
+
+        Returns:
+            Seconds spent waiting
+        """
+        if not ids:
+            return 0.0
+        start = time.monotonic()
+        delays = self._poll_delays(initial_delay, max_delay)
+        while True:
+            visible = len(
+                self.vector_store.fetch(dataset.index_name, ids, dataset.namespace)
+            )
+            elapsed = time.monotonic() - start
+            if self._indexing_done(dataset, visible, len(ids), elapsed, timeout):
+                return elapsed
+            time.sleep(min(next(delays), timeout - elapsed))
+
+    async def _await_indexing(
+        self,
+        dataset: Dataset,
+        ids: List[str],
+        timeout: float = 60.0,
+        initial_delay: float = 0.1,
+        max_delay: float = 2.0,
+    ) -> float:
+        """Async variant of _wait_for_indexing"""
+        if not ids:
+            return 0.0
+        start = time.monotonic()
+        delays = self._poll_delays(initial_delay, max_delay)
+        while True:
+            visible = len(
+                await asyncio.to_thread(
+                    self.vector_store.fetch, dataset.index_name, ids, dataset.namespace
+                )
+            )
+            elapsed = time.monotonic() - start
+            if self._indexing_done(dataset, visible, len(ids), elapsed, timeout):
+                return elapsed
+            await asyncio.sleep(min(next(delays), timeout - elapsed))
+
+    @staticmethod
+    def _poll_delays(initial_delay: float, max_delay: float) -> Iterator[float]:
+        delay = initial_delay
+        while True:
+            yield min(delay, max_delay)
+            delay *= 2
+
+    @staticmethod
+    def _indexing_done(
+        dataset: Dataset, count: int, expected: int, elapsed: float, timeout: float
+    ) -> bool:
+        if count >= expected:
+            return True
+        if elapsed >= timeout:
+            logging.warning(
+                f"Timed out after {elapsed:.2f}s waiting for {dataset.name}: "
+                f"{count}/{expected} vectors of the last batch indexed"
+            )
+            return True
+        return False
+
+    def _locate(
+        self, dataset_name: str, embedding_model: Optional[str]
+    ) -> Tuple[str, Optional[str]]:
+        """Index and namespace a dataset's vectors are stored in
+
+        With a shared index configured, datasets are namespaces of it and
+        registering one never waits for an index to be provisioned.
+        """
+        shared_index = self.config.pinecone.shared_index
+        if shared_index is None:
+            return "datachat-" + dataset_name, None
+        # An index holds vectors of one dimension, so datasets embedded
+        # locally share a second index
+        if embedding_model == self.LOCAL_EMBEDDING:
+            return f"{shared_index}-{self.LOCAL_EMBEDDING}", dataset_name
+        return shared_index, dataset_name
@@ -1,10 +1,17 @@
+import copy
+import json
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import Any, Dict, Iterable, Iterator, Optional, List, Sequence
 import logging
 from pathlib import Path
 
+from datachat.core import metrics
+
 
 @dataclass
 class Dataset:
@@ -14,24 +21,126 @@ class Dataset:
     index_name: str
     system_prompt: str
     created_at: datetime = None
+    # Metadata fields rendered into the prompt context; None means all
+    context_fields: Optional[List[str]] = None
+    # Metadata fields queries may be filtered on, mapped to their kind
+    filter_fields: Optional[Dict[str, str]] = None
+    # Embedding model of the dataset's vectors; None means the default one
+    embedding_model: Optional[str] = None
+    # Namespace of the dataset's vectors inside its index; None when the
+    # dataset has an index of its own
+    namespace: Optional[str] = None
 
 
 class DatasetRepository:
-    """Repository for managing dataset metadata in SQLite"""
+    """Repository for managing dataset metadata in SQLite
+
+    Connections to the database come from a bounded pool and are checked
+    out for one transaction at a time, so short-lived worker threads reuse
+    them instead of each opening their own. The database runs in WAL mode
+    so readers never block the writer. Dataset rows and field values are
+    cached in memory after the first read and invalidated when they
+    change; callers get copies, so changing them never changes the cache.
+    """
 
-    def __init__(self, db_path: str = "datasets.db"):
+    def __init__(
+        self,
+        db_path: str = "datasets.db",
+        busy_timeout: float = 30.0,
+        pool_size: int = 8,
+    ):
         """Initialize the repository with the database path
 
         Args:
             db_path: Path to SQLite database file
+            busy_timeout: Seconds a writer waits for another writer's lock,
+                or for a pooled connection, before failing
+            pool_size: Maximum number of open connections
         """
         self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.pool_size = pool_size
+        self._local = threading.local()
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(
+            maxsize=pool_size
+        )
+        self._opened = 0
+        self._datasets: Dict[str, Dataset] = {}
+        self._field_values: Dict[str, Dict[str, List[str]]] = {}
+        self._version = 0
+        self._lock = threading.Lock()
         self._init_db()
 
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Check a pooled connection out for one transaction
+
+        A thread that already holds a connection gets the same one back,
+        joining its open transaction.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._local.conn = None
+            self._pool.put(conn)
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            opening = self._opened < self.pool_size
+            if opening:
+                self._opened += 1
+        if not opening:
+            try:
+                return self._pool.get(timeout=self.busy_timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError(
+                    f"No database connection free after {self.busy_timeout}s"
+                )
+
+        try:
+            conn = sqlite3.connect(
+                self.db_path, timeout=self.busy_timeout, check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps the database consistent without syncing every commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+        except sqlite3.Error:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def close(self) -> None:
+        """Close every pooled connection"""
+        with self._lock:
+            self._datasets.clear()
+            self._field_values.clear()
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
     def _init_db(self) -> None:
         """Initialize the database schema"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.execute(
                     """
                     CREATE TABLE IF NOT EXISTS datasets (
@@ -42,6 +151,38 @@ class DatasetRepository:
                     )
                 """
                 )
+                columns = {
+                    row[1] for row in conn.execute("PRAGMA table_info(datasets)")
+                }
+                for column in (
+                    "context_fields",
+                    "filter_fields",
+                    "embedding_model",
+                    "namespace",
+                ):
+                    if column not in columns:
+                        conn.execute(f"ALTER TABLE datasets ADD COLUMN {column} TEXT")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS document_hashes (
+                        dataset_name TEXT NOT NULL,
+                        document_id TEXT NOT NULL,
+                        content_hash TEXT NOT NULL,
+                        generation INTEGER NOT NULL,
+                        PRIMARY KEY (dataset_name, document_id)
+                    )
+                """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS field_values (
+                        dataset_name TEXT NOT NULL,
+                        field TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        PRIMARY KEY (dataset_name, field, value)
+                    )
+                """
+                )
         except sqlite3.Error as e:
             logging.error(f"Failed to initialize database: {e}")
             raise
@@ -56,22 +197,39 @@ class DatasetRepository:
             sqlite3.Error: If database operation fails
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.execute(
                     """
-                    INSERT INTO datasets (name, index_name, system_prompt)
-                    VALUES (?, ?, ?)
+                    INSERT INTO datasets
+                        (name, index_name, system_prompt, context_fields, filter_fields,
+                            embedding_model, namespace)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
                     ON CONFLICT(name) DO UPDATE SET
                         index_name = excluded.index_name,
                         system_prompt = excluded.system_prompt,
+                        context_fields = excluded.context_fields,
+                        filter_fields = excluded.filter_fields,
+                        embedding_model = excluded.embedding_model,
+                        namespace = excluded.namespace,
                         created_at = CURRENT_TIMESTAMP
                     """,
-                    (dataset.name, dataset.index_name, dataset.system_prompt)
+                    (
+                        dataset.name,
+                        dataset.index_name,
+                        dataset.system_prompt,
+                        self._dump_fields(dataset.context_fields),
+                        self._dump_fields(dataset.filter_fields),
+                        dataset.embedding_model,
+                        dataset.namespace,
+                    ),
                 )
         except sqlite3.Error as e:
             logging.error(f"Failed to upsert dataset: {e}")
             raise
+        finally:
+            self._invalidate(dataset.name)
 
+    @metrics.timed("sqlite")
     def get_dataset(self, name: str) -> Optional[Dataset]:
         """Retrieve a dataset by name
 
@@ -84,24 +242,30 @@ class DatasetRepository:
         Raises:
             sqlite3.Error: If database operation fails
         """
+        with self._lock:
+            dataset = self._datasets.get(name)
+            version = self._version
+        if dataset is not None:
+            return copy.deepcopy(dataset)
+
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connect() as conn:
                 row = conn.execute(
                     """
-                    SELECT name, index_name, system_prompt, created_at
+                    SELECT name, index_name, system_prompt, created_at, context_fields,
+                        filter_fields, embedding_model, namespace
                     FROM datasets WHERE name = ?
                     """,
                     (name,),
                 ).fetchone()
 
                 if row:
-                    return Dataset(
-                        name=row["name"],
-                        index_name=row["index_name"],
-                        system_prompt=row["system_prompt"],
-                        created_at=datetime.fromisoformat(row["created_at"]),
-                    )
+                    dataset = self._to_dataset(row)
+                    with self._lock:
+                        # Skip caching a row read before a concurrent write
+                        if version == self._version:
+                            self._datasets[name] = copy.deepcopy(dataset)
+                    return dataset
                 return None
         except sqlite3.Error as e:
             logging.error(f"Failed to get dataset: {e}")
@@ -117,24 +281,19 @@ class DatasetRepository:
             sqlite3.Error: If database operation fails
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connect() as conn:
                 rows = conn.execute(
-                    "SELECT name, index_name, system_prompt, created_at FROM datasets"
+                    """
+                    SELECT name, index_name, system_prompt, created_at, context_fields,
+                        filter_fields, embedding_model, namespace
+                    FROM datasets
+                    """
                 ).fetchall()
 
                 if not rows:
                     return {}
 
-                return {
-                    row["name"]: Dataset(
-                        name=row["name"],
-                        index_name=row["index_name"],
-                        system_prompt=row["system_prompt"],
-                        created_at=datetime.fromisoformat(row["created_at"]),
-                    )
-                    for row in rows
-                }
+                return {row["name"]: self._to_dataset(row) for row in rows}
         except sqlite3.Error as e:
             logging.error(f"Failed to list datasets: {e}")
             raise
@@ -152,9 +311,334 @@ class DatasetRepository:
             sqlite3.Error: If database operation fails
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.execute("DELETE FROM datasets WHERE name = ?", (name,))
                 return cursor.rowcount > 0
         except sqlite3.Error as e:
             logging.error(f"Failed to delete dataset: {e}")
             raise
+        finally:
+            self._invalidate(name)
+
+    @metrics.timed("sqlite")
+    def get_document_hashes(
+        self, dataset_name: str, document_ids: List[str]
+    ) -> Dict[str, str]:
+        """Look up stored content hashes for documents of a dataset
+
+        Args:
+            dataset_name: Name of the dataset
+            document_ids: Ids of the documents to look up
+
+        Returns:
+            Mapping of document id to content hash for the known ids
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        hashes = {}
+        try:
+            with self._connect() as conn:
+                for chunk in self._chunks(document_ids):
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = conn.execute(
+                        f"""
+                        SELECT document_id, content_hash FROM document_hashes
+                        WHERE dataset_name = ? AND document_id IN ({placeholders})
+                        """,
+                        (dataset_name, *chunk),
+                    )
+                    hashes.update(rows)
+            return hashes
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get document hashes: {e}")
+            raise
+
+    @metrics.timed("sqlite")
+    def upsert_document_hashes(
+        self, dataset_name: str, hashes: Dict[str, str], generation: int
+    ) -> None:
+        """Record content hashes of documents written to a dataset's index
+
+        Args:
+            dataset_name: Name of the dataset
+            hashes: Mapping of document id to content hash
+            generation: Registration the documents belong to
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    """
+                    INSERT INTO document_hashes
+                        (dataset_name, document_id, content_hash, generation)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(dataset_name, document_id) DO UPDATE SET
+                        content_hash = excluded.content_hash,
+                        generation = excluded.generation
+                    """,
+                    [
+                        (dataset_name, doc_id, content_hash, generation)
+                        for doc_id, content_hash in hashes.items()
+                    ],
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to upsert document hashes: {e}")
+            raise
+
+    @metrics.timed("sqlite")
+    def touch_document_hashes(
+        self, dataset_name: str, document_ids: List[str], generation: int
+    ) -> None:
+        """Mark unchanged documents as part of a registration
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    """
+                    UPDATE document_hashes SET generation = ?
+                    WHERE dataset_name = ? AND document_id = ?
+                    """,
+                    [(generation, dataset_name, doc_id) for doc_id in document_ids],
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to touch document hashes: {e}")
+            raise
+
+    def stale_document_ids(
+        self, dataset_name: str, generation: int, batch_size: int = 1000
+    ) -> Iterator[List[str]]:
+        """Yield ids of documents not seen by a registration, in batches
+
+        Args:
+            dataset_name: Name of the dataset
+            generation: Registration whose documents are current
+            batch_size: Maximum number of ids per batch
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        last_id = ""
+        try:
+            while True:
+                # Page by key and fetch each page fully so callers can
+                # delete between pages without holding a read open
+                with self._connect() as conn:
+                    ids = [
+                        row[0]
+                        for row in conn.execute(
+                            """
+                            SELECT document_id FROM document_hashes
+                            WHERE dataset_name = ? AND generation < ?
+                                AND document_id > ?
+                            ORDER BY document_id LIMIT ?
+                            """,
+                            (dataset_name, generation, last_id, batch_size),
+                        )
+                    ]
+                if not ids:
+                    return
+                yield ids
+                last_id = ids[-1]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to list stale documents: {e}")
+            raise
+
+    def document_hash_batches(
+        self, dataset_name: str, batch_size: int = 1000
+    ) -> Iterator[Dict[str, str]]:
+        """Yield content hashes of all documents of a dataset, in batches
+
+        Args:
+            dataset_name: Name of the dataset
+            batch_size: Maximum number of documents per batch
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        last_id = ""
+        try:
+            while True:
+                with self._connect() as conn:
+                    hashes = dict(
+                        conn.execute(
+                            """
+                            SELECT document_id, content_hash FROM document_hashes
+                            WHERE dataset_name = ? AND document_id > ?
+                            ORDER BY document_id LIMIT ?
+                            """,
+                            (dataset_name, last_id, batch_size),
+                        )
+                    )
+                if not hashes:
+                    return
+                yield hashes
+                last_id = max(hashes)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to list document hashes: {e}")
+            raise
+
+    def count_documents(self, dataset_name: str) -> int:
+        """Number of documents recorded for a dataset
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        try:
+            with self._connect() as conn:
+                return conn.execute(
+                    "SELECT COUNT(*) FROM document_hashes WHERE dataset_name = ?",
+                    (dataset_name,),
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to count documents: {e}")
+            raise
+
+    def delete_document_hashes(
+        self, dataset_name: str, document_ids: Optional[Sequence[str]] = None
+    ) -> None:
+        """Forget content hashes of some or all documents of a dataset
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        try:
+            with self._connect() as conn:
+                if document_ids is None:
+                    conn.execute(
+                        "DELETE FROM document_hashes WHERE dataset_name = ?",
+                        (dataset_name,),
+                    )
+                    return
+                conn.executemany(
+                    """
+                    DELETE FROM document_hashes
+                    WHERE dataset_name = ? AND document_id = ?
+                    """,
+                    [(dataset_name, doc_id) for doc_id in document_ids],
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete document hashes: {e}")
+            raise
+
+    def add_field_values(
+        self, dataset_name: str, values: Dict[str, Iterable[str]]
+    ) -> None:
+        """Record values seen for a dataset's keyword filter fields
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        rows = [
+            (dataset_name, field, value)
+            for field, field_values in values.items()
+            for value in field_values
+        ]
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                cursor = conn.executemany(
+                    """
+                    INSERT OR IGNORE INTO field_values (dataset_name, field, value)
+                    VALUES (?, ?, ?)
+                    """,
+                    rows,
+                )
+            if cursor.rowcount:
+                self._invalidate_field_values(dataset_name)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to add field values: {e}")
+            raise
+
+    @metrics.timed("sqlite")
+    def get_field_values(self, dataset_name: str) -> Dict[str, List[str]]:
+        """Known values of each keyword filter field of a dataset
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        with self._lock:
+            values = self._field_values.get(dataset_name)
+            version = self._version
+        if values is not None:
+            return {field: list(field_values) for field, field_values in values.items()}
+
+        values = {}
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT field, value FROM field_values WHERE dataset_name = ?",
+                    (dataset_name,),
+                )
+                for field, value in rows:
+                    values.setdefault(field, []).append(value)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to get field values: {e}")
+            raise
+        with self._lock:
+            # Skip caching values read before a concurrent write
+            if version == self._version:
+                self._field_values[dataset_name] = {
+                    field: list(field_values) for field, field_values in values.items()
+                }
+        return values
+
+    def delete_field_values(self, dataset_name: str) -> None:
+        """Forget the recorded filter field values of a dataset
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM field_values WHERE dataset_name = ?", (dataset_name,)
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete field values: {e}")
+            raise
+        finally:
+            self._invalidate_field_values(dataset_name)
+
+    @classmethod
+    def _to_dataset(cls, row: sqlite3.Row) -> Dataset:
+        return Dataset(
+            name=row["name"],
+            index_name=row["index_name"],
+            system_prompt=row["system_prompt"],
+            created_at=datetime.fromisoformat(row["created_at"]),
+            context_fields=cls._load_fields(row["context_fields"]),
+            filter_fields=cls._load_fields(row["filter_fields"]),
+            embedding_model=row["embedding_model"],
+            namespace=row["namespace"],
+        )
+
+    def _invalidate(self, name: str) -> None:
+        with self._lock:
+            self._datasets.pop(name, None)
+            self._version += 1
+
+    def _invalidate_field_values(self, dataset_name: str) -> None:
+        with self._lock:
+            self._field_values.pop(dataset_name, None)
+            self._version += 1
+
+    @staticmethod
+    def _dump_fields(fields: Optional[Any]) -> Optional[str]:
+        return json.dumps(fields) if fields is not None else None
+
+    @staticmethod
+    def _load_fields(value: Optional[str]) -> Optional[Any]:
+        return json.loads(value) if value is not None else None
+
+    @staticmethod
+    def _chunks(items: List[str], size: int = 500) -> Iterator[List[str]]:
+        # Keep well below SQLite's limit on bound parameters per statement
+        for start in range(0, len(items), size):
+            yield items[start : start + size]
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from datachat.core import metrics
+from datachat.core.models import EmbeddingModel
+
+
+class EmbeddingCache:
+    """Persistent, size-bounded LRU cache of embeddings in SQLite
+
+    Embeddings are keyed by (model_name, sha256(text)) and stored as packed
+    float32 blobs.
+    """
+
+    # Keep well below SQLite's limit on bound parameters per statement
+    _QUERY_CHUNK = 500
+
+    def __init__(self, db_path: str = "embeddings.db", max_entries: int = 1_000_000):
+        """Initialize the cache
+
+        Args:
+            db_path: Path to SQLite database file
+            max_entries: Maximum number of embeddings kept before evicting the
+                least recently used ones
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Entries in the database, counted once here and then kept up to
+        # date on insert and eviction instead of scanning the table
+        self._count = 0
+        self._init_db()
+
+    def _init_db(self) -> None:
+        """Initialize the database schema"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        model_name TEXT NOT NULL,
+                        text_hash TEXT NOT NULL,
+                        vector BLOB NOT NULL,
+                        last_access REAL NOT NULL,
+                        PRIMARY KEY (model_name, text_hash)
+                    )
+                """
+                )
+                conn.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_embeddings_last_access
+                    ON embeddings (last_access)
+                """
+                )
+                (self._count,) = conn.execute(
+                    "SELECT COUNT(*) FROM embeddings"
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to initialize embedding cache: {e}")
+            raise
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(
+        self, model_name: str, text_hashes: Sequence[str]
+    ) -> Dict[str, List[float]]:
+        """Look up cached embeddings and mark them as recently used
+
+        Returns:
+            Mapping of text hash to embedding for every hash found
+        """
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(text_hashes))
+        now = time.time()
+        with self._lock, sqlite3.connect(self.db_path) as conn:
+            for chunk in self._chunks(unique):
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"""
+                    SELECT text_hash, vector FROM embeddings
+                    WHERE model_name = ? AND text_hash IN ({placeholders})
+                    """,
+                    (model_name, *chunk),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+                if rows:
+                    conn.executemany(
+                        """
+                        UPDATE embeddings SET last_access = ?
+                        WHERE model_name = ? AND text_hash = ?
+                        """,
+                        [(now, model_name, text_hash) for text_hash, _ in rows],
+                    )
+            self.hits += sum(1 for h in text_hashes if h in found)
+            self.misses += sum(1 for h in text_hashes if h not in found)
+        return found
+
+    def put_many(self, model_name: str, embeddings: Dict[str, List[float]]) -> None:
+        """Store embeddings and evict the least recently used ones over capacity"""
+        if not embeddings:
+            return
+        now = time.time()
+        rows = [
+            (model_name, text_hash, array("f", vector).tobytes(), now)
+            for text_hash, vector in embeddings.items()
+        ]
+        with self._lock, sqlite3.connect(self.db_path) as conn:
+            # Only texts that just missed the cache get here, so inserting
+            # nearly always succeeds and tells how many entries were added
+            inserted = conn.executemany(
+                """
+                INSERT INTO embeddings (model_name, text_hash, vector, last_access)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(model_name, text_hash) DO NOTHING
+                """,
+                rows,
+            ).rowcount
+            if inserted < len(rows):
+                conn.executemany(
+                    """
+                    UPDATE embeddings SET vector = ?, last_access = ?
+                    WHERE model_name = ? AND text_hash = ?
+                    """,
+                    [(blob, at, model, h) for model, h, blob, at in rows],
+                )
+            self._count += inserted
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        overflow = self._count - self.max_entries
+        if overflow > 0:
+            evicted = conn.execute(
+                """
+                DELETE FROM embeddings WHERE rowid IN (
+                    SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?
+                )
+                """,
+                (overflow,),
+            ).rowcount
+            self._count -= evicted
+            logging.info(f"Evicted {evicted} embeddings from cache")
+
+    def clear(self) -> None:
+        with self._lock, sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM embeddings")
+            self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _chunks(self, items: List[str]) -> Iterable[List[str]]:
+        for start in range(0, len(items), self._QUERY_CHUNK):
+            yield items[start : start + self._QUERY_CHUNK]
+
+
+class CachedEmbedding(EmbeddingModel):
+    """Embedding model wrapper that only embeds texts missing from the cache"""
+
+    def __init__(self, model: EmbeddingModel, cache: Optional[EmbeddingCache] = None):
+        self.model = model
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+
+    def create_embedding(self, text: str) -> List[float]:
+        return self.create_embeddings([text])[0]
+
+    def create_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        return self.create_embeddings_with_hits(texts)[0]
+
+    def create_embeddings_with_hits(
+        self, texts: Sequence[str]
+    ) -> Tuple[List[List[float]], int]:
+        """Embed texts, also returning how many were served from the cache"""
+        texts = list(texts)
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, hashes)
+        hits = sum(1 for h in hashes if h in cached)
+        metrics.record_cache("embedding", hits, len(hashes) - hits)
+
+        # Embed each unseen text once, even if it appears several times
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        if missing:
+            new = dict(
+                zip(missing, self.model.create_embeddings(list(missing.values())))
+            )
+            self.cache.put_many(self.model_name, new)
+            cached.update(new)
+
+        return [cached[h] for h in hashes], hits
+
+    async def acreate_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        return (await self.acreate_embeddings_with_hits(texts))[0]
+
+    async def acreate_embeddings_with_hits(
+        self, texts: Sequence[str]
+    ) -> Tuple[List[List[float]], int]:
+        """Async version of create_embeddings_with_hits"""
+        texts = list(texts)
+        hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        cached = await asyncio.to_thread(self.cache.get_many, self.model_name, hashes)
+        hits = sum(1 for h in hashes if h in cached)
+        metrics.record_cache("embedding", hits, len(hashes) - hits)
+
+        missing = {h: text for h, text in zip(hashes, texts) if h not in cached}
+        if missing:
+            embeddings = await self.model.acreate_embeddings(list(missing.values()))
+            new = dict(zip(missing, embeddings))
+            await asyncio.to_thread(self.cache.put_many, self.model_name, new)
+            cached.update(new)
+
+        return [cached[h] for h in hashes], hits
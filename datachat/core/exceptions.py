@@ -1,4 +1,20 @@
 
 class VectorStoreError(Exception):
     """Raised when vector store operations fail"""
-    pass
\ No newline at end of file
+    pass
+
+
+class UpsertError(VectorStoreError):
+    """Raised when some chunks of an upsert fail after all retries
+
+    The vectors of the failed chunks are kept so the caller can resume by
+    upserting only those.
+    """
+
+    def __init__(self, message: str, failed_chunks: list):
+        super().__init__(message)
+        self.failed_chunks = failed_chunks
+
+    @property
+    def failed_vectors(self) -> list:
+        return [vector for chunk in self.failed_chunks for vector in chunk]
@@ -0,0 +1,227 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import IO, TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Type
+
+from datachat.core.document import Document
+
+if TYPE_CHECKING:
+    from datachat.core.data_chat import DataChat
+
+
+@dataclass
+class IngestStats:
+    """Progress counters for one dataset ingest"""
+
+    rows_read: int = 0
+    rows_embedded: int = 0
+    rows_cached: int = 0
+    rows_upserted: int = 0
+    rows_unchanged: int = 0
+    rows_skipped: int = 0
+    rows_deleted: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+    _lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False
+    )
+
+    def increment(self, **counts: int) -> None:
+        """Add to counters; safe to call from several pipeline workers"""
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.rows_upserted / elapsed if elapsed > 0 else 0.0
+
+    def finish(self) -> None:
+        self.finished_at = time.monotonic()
+
+
+class JobStatus(str, Enum):
+    """Lifecycle states of an ingestion job"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+@dataclass
+class IngestionJob:
+    """A dataset upload processed in the background"""
+
+    id: str
+    dataset_name: str
+    status: JobStatus = JobStatus.PENDING
+    stats: IngestStats = field(default_factory=IngestStats)
+    errors: List[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.now)
+
+    # Keep the job record small even when many rows are malformed
+    MAX_ERRORS = 100
+
+    def add_error(self, message: str) -> None:
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(message)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "dataset_name": self.dataset_name,
+            "status": self.status.value,
+            "rows_read": self.stats.rows_read,
+            "rows_embedded": self.stats.rows_embedded,
+            "rows_cached": self.stats.rows_cached,
+            "rows_upserted": self.stats.rows_upserted,
+            "rows_unchanged": self.stats.rows_unchanged,
+            "rows_skipped": self.stats.rows_skipped,
+            "rows_deleted": self.stats.rows_deleted,
+            "rows_per_second": round(self.stats.rows_per_second, 2),
+            "elapsed_seconds": round(self.stats.elapsed, 3),
+            "errors": list(self.errors),
+            "created_at": self.created_at.isoformat(),
+        }
+
+
+class IngestionManager:
+    """Runs NDJSON dataset uploads on a background worker pool"""
+
+    def __init__(
+        self,
+        data_chat: "DataChat",
+        max_workers: int = 2,
+        job_ttl: float = 3600.0,
+        max_jobs: int = 1000,
+    ):
+        """Initialize the manager
+
+        Args:
+            data_chat: DataChat instance registering the datasets
+            max_workers: Number of uploads ingested at the same time
+            job_ttl: Seconds a finished job stays available for polling
+            max_jobs: Number of jobs kept before the oldest finished ones
+                are dropped, even within their TTL
+        """
+        self.data_chat = data_chat
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ingest"
+        )
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        dataset_name: str,
+        source: IO[bytes],
+        document_class: Type[Document],
+        system_prompt: str,
+        context_fields: Optional[List[str]] = None,
+        filter_fields: Optional[Dict[str, str]] = None,
+        embedding_model: Optional[str] = None,
+    ) -> IngestionJob:
+        """Queue an NDJSON source for ingestion and return its job immediately
+
+        The job owns ``source`` and closes it when done.
+        """
+        job = IngestionJob(id=uuid.uuid4().hex, dataset_name=dataset_name)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(
+            self._run,
+            job,
+            source,
+            document_class,
+            system_prompt,
+            context_fields,
+            filter_fields,
+            embedding_model,
+        )
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        """Forget finished jobs past their TTL, or the oldest over capacity"""
+        now = time.monotonic()
+        finished = [
+            job for job in self._jobs.values() if job.stats.finished_at is not None
+        ]
+        finished.sort(key=lambda job: job.stats.finished_at)
+        overflow = len(self._jobs) - self.max_jobs + 1
+        for job in finished:
+            if overflow <= 0 and now - job.stats.finished_at < self.job_ttl:
+                break
+            del self._jobs[job.id]
+            overflow -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(
+        self,
+        job: IngestionJob,
+        source: IO[bytes],
+        document_class: Type[Document],
+        system_prompt: str,
+        context_fields: Optional[List[str]],
+        filter_fields: Optional[Dict[str, str]],
+        embedding_model: Optional[str],
+    ) -> None:
+        job.status = JobStatus.RUNNING
+        job.stats = IngestStats()
+        try:
+            with source:
+                documents = self._parse(job, source, document_class)
+                self.data_chat.register_dataset(
+                    job.dataset_name,
+                    documents,
+                    system_prompt,
+                    stats=job.stats,
+                    context_fields=context_fields,
+                    filter_fields=filter_fields,
+                    embedding_model=embedding_model,
+                )
+            job.status = JobStatus.COMPLETED
+        except Exception as e:
+            logging.exception(f"Ingestion job {job.id} failed")
+            job.add_error(str(e))
+            job.status = JobStatus.FAILED
+        finally:
+            job.stats.finish()
+
+    @staticmethod
+    def _parse(
+        job: IngestionJob, source: IO[bytes], document_class: Type[Document]
+    ) -> Iterator[Document]:
+        """Lazily turn NDJSON lines into documents, skipping bad rows"""
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                document = document_class(json.loads(line))
+                # Touch every field so malformed rows fail here, not mid-batch
+                document.id, document.text, document.metadata
+            except Exception as e:
+                job.add_error(f"Line {line_number}: {e!r}")
+                continue
+            yield document
@@ -0,0 +1,435 @@
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from datachat.core import metrics
+from datachat.store.filters import compile_filter
+from datachat.store.vector_store import Match
+
+# (id, text, metadata) for one document
+Row = Tuple[str, str, Dict[str, Any]]
+
+_TOKEN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a about an and any are as at be by do does for from has have how in is it "
+    "its me of on or tell that the there this to was were what when where which "
+    "who will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords"""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """BM25 inverted index over document text, persisted in SQLite
+
+    Postings hold one (term, document, term frequency) row each, in a
+    table clustered by term so a query reads only the postings of its own
+    terms. Documents are added and removed individually, and corpus
+    statistics are cached per dataset until the dataset changes.
+    """
+
+    # Keep well below SQLite's limit on bound parameters per statement
+    _QUERY_CHUNK = 500
+
+    def __init__(
+        self,
+        db_path: str = "lexical.db",
+        k1: float = 1.2,
+        b: float = 0.75,
+        busy_timeout: float = 30.0,
+    ):
+        """Initialize the index
+
+        Args:
+            db_path: Path to SQLite database file
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+            busy_timeout: Seconds a writer waits for another writer's lock
+        """
+        self.db_path = db_path
+        self.k1 = k1
+        self.b = b
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._stats: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self) -> None:
+        """Initialize the database schema"""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS lexical_documents (
+                        dataset_name TEXT NOT NULL,
+                        document_id TEXT NOT NULL,
+                        length INTEGER NOT NULL,
+                        metadata TEXT NOT NULL,
+                        PRIMARY KEY (dataset_name, document_id)
+                    ) WITHOUT ROWID
+                """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS lexical_postings (
+                        dataset_name TEXT NOT NULL,
+                        term TEXT NOT NULL,
+                        document_id TEXT NOT NULL,
+                        frequency INTEGER NOT NULL,
+                        PRIMARY KEY (dataset_name, term, document_id)
+                    ) WITHOUT ROWID
+                """
+                )
+                # Replacing or removing a document looks its postings up by id
+                conn.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_lexical_postings_document
+                    ON lexical_postings (dataset_name, document_id)
+                """
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to initialize lexical index: {e}")
+            raise
+
+    def upsert(self, dataset_name: str, rows: Sequence[Row]) -> None:
+        """Index documents, replacing earlier versions of the same ids
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                self._delete(conn, dataset_name, [doc_id for doc_id, _, _ in rows])
+                self._insert(conn, dataset_name, rows)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to update lexical index: {e}")
+            raise
+        finally:
+            self._invalidate(dataset_name)
+
+    def upsert_missing(self, dataset_name: str, rows: Sequence[Row]) -> None:
+        """Index only the documents that are not indexed yet
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        if not rows:
+            return
+        try:
+            with self._connect() as conn:
+                present = set()
+                for chunk in self._chunks([doc_id for doc_id, _, _ in rows]):
+                    present.update(
+                        doc_id
+                        for (doc_id,) in conn.execute(
+                            f"""
+                            SELECT document_id FROM lexical_documents
+                            WHERE dataset_name = ?
+                                AND document_id IN ({",".join("?" * len(chunk))})
+                            """,
+                            (dataset_name, *chunk),
+                        )
+                    )
+                missing = [row for row in rows if row[0] not in present]
+                if not missing:
+                    return
+                self._insert(conn, dataset_name, missing)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to update lexical index: {e}")
+            raise
+        self._invalidate(dataset_name)
+
+    def get_terms(
+        self, dataset_name: str, document_ids: Sequence[str]
+    ) -> Dict[str, Dict[str, int]]:
+        """Term frequencies of indexed documents, keyed by document id
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        terms: Dict[str, Dict[str, int]] = {doc_id: {} for doc_id in document_ids}
+        ids = list(terms)
+        try:
+            conn = self._connect()
+            for chunk in self._chunks(ids):
+                # Postings are looked up per document through the id index
+                rows = conn.execute(
+                    f"""
+                    SELECT document_id, term, frequency FROM lexical_postings
+                    WHERE dataset_name = ?
+                        AND document_id IN ({",".join("?" * len(chunk))})
+                    """,
+                    (dataset_name, *chunk),
+                )
+                for doc_id, term, frequency in rows:
+                    terms[doc_id][term] = frequency
+        except sqlite3.Error as e:
+            logging.error(f"Failed to read lexical index: {e}")
+            raise
+        return terms
+
+    def upsert_terms(
+        self,
+        dataset_name: str,
+        documents: Sequence[Tuple[str, Dict[str, int], Dict[str, Any]]],
+    ) -> None:
+        """Index documents from their term frequencies instead of their text
+
+        Args:
+            documents: (id, term frequencies, metadata) of every document,
+                as returned by get_terms
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        if not documents:
+            return
+        try:
+            with self._connect() as conn:
+                self._delete(conn, dataset_name, [doc_id for doc_id, _, _ in documents])
+                self._insert_terms(conn, dataset_name, documents)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to update lexical index: {e}")
+            raise
+        finally:
+            self._invalidate(dataset_name)
+
+    def delete(self, dataset_name: str, document_ids: Optional[List[str]] = None):
+        """Remove some or all documents of a dataset
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        try:
+            with self._connect() as conn:
+                if document_ids is None:
+                    for table in ("lexical_documents", "lexical_postings"):
+                        conn.execute(
+                            f"DELETE FROM {table} WHERE dataset_name = ?",
+                            (dataset_name,),
+                        )
+                else:
+                    self._delete(conn, dataset_name, document_ids)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to delete from lexical index: {e}")
+            raise
+        finally:
+            self._invalidate(dataset_name)
+
+    @metrics.timed("lexical_search")
+    def query(
+        self,
+        dataset_name: str,
+        text: str,
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Match]:
+        """Rank documents by BM25 score against the query text
+
+        Raises:
+            sqlite3.Error: If database operation fails
+        """
+        terms = Counter(tokenize(text))
+        if not terms or top_k <= 0:
+            return []
+        try:
+            count, average_length = self._corpus_stats(dataset_name)
+            if not count:
+                return []
+            conn = self._connect()
+            placeholders = ",".join("?" * len(terms))
+            # Query parameters of (term, weight) pairs; document frequencies
+            # are counted on the postings index without reading postings
+            weights: List[Any] = []
+            for term, df in conn.execute(
+                f"""
+                SELECT term, COUNT(*) FROM lexical_postings
+                WHERE dataset_name = ? AND term IN ({placeholders})
+                GROUP BY term
+                """,
+                (dataset_name, *terms),
+            ):
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                weights.extend((term, terms[term] * idf))
+            if not weights:
+                return []
+
+            # Scores are summed per document in SQLite, so postings are
+            # never loaded into Python
+            ranked = conn.execute(
+                f"""
+                WITH weights (term, weight) AS (
+                    VALUES {",".join(["(?, ?)"] * (len(weights) // 2))}
+                )
+                SELECT p.document_id, SUM(
+                    w.weight * p.frequency * ?
+                    / (p.frequency + ? * (? + ? * d.length))
+                ) AS score
+                FROM weights w
+                JOIN lexical_postings p
+                    ON p.dataset_name = ? AND p.term = w.term
+                JOIN lexical_documents d
+                    ON d.dataset_name = p.dataset_name
+                    AND d.document_id = p.document_id
+                GROUP BY p.document_id
+                ORDER BY score DESC, p.document_id
+                """,
+                (
+                    *weights,
+                    self.k1 + 1,
+                    self.k1,
+                    1 - self.b,
+                    self.b / average_length,
+                    dataset_name,
+                ),
+            )
+            return self._matches(conn, dataset_name, ranked, top_k, filter)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to query lexical index: {e}")
+            raise
+
+    def _matches(
+        self,
+        conn: sqlite3.Connection,
+        dataset_name: str,
+        ranked: Iterable[Tuple[str, float]],
+        top_k: int,
+        filter: Optional[Dict[str, Any]],
+    ) -> List[Match]:
+        predicate = compile_filter(filter) if filter else None
+        matches: List[Match] = []
+        ranked = iter(ranked)
+        # Load metadata a page at a time until enough documents pass the filter
+        page = top_k if predicate is None else max(top_k * 4, 100)
+        while chunk := list(islice(ranked, min(page, self._QUERY_CHUNK))):
+            placeholders = ",".join("?" * len(chunk))
+            metadata = dict(
+                conn.execute(
+                    f"""
+                    SELECT document_id, metadata FROM lexical_documents
+                    WHERE dataset_name = ? AND document_id IN ({placeholders})
+                    """,
+                    (dataset_name, *(doc_id for doc_id, _ in chunk)),
+                )
+            )
+            for doc_id, score in chunk:
+                meta = json.loads(metadata[doc_id])
+                if predicate is None or predicate(meta):
+                    matches.append(Match(doc_id, score, meta))
+                    if len(matches) == top_k:
+                        return matches
+        return matches
+
+    def _corpus_stats(self, dataset_name: str) -> Tuple[int, float]:
+        with self._lock:
+            stats = self._stats.get(dataset_name)
+        if stats is None:
+            count, total = (
+                self._connect()
+                .execute(
+                    """
+                    SELECT COUNT(*), COALESCE(SUM(length), 0)
+                    FROM lexical_documents WHERE dataset_name = ?
+                    """,
+                    (dataset_name,),
+                )
+                .fetchone()
+            )
+            stats = (count, max(total / count, 1.0) if count else 1.0)
+            with self._lock:
+                self._stats[dataset_name] = stats
+        return stats
+
+    def _chunks(self, items: List[str]) -> Iterable[List[str]]:
+        for start in range(0, len(items), self._QUERY_CHUNK):
+            yield items[start : start + self._QUERY_CHUNK]
+
+    def _invalidate(self, dataset_name: str) -> None:
+        with self._lock:
+            self._stats.pop(dataset_name, None)
+
+    @classmethod
+    def _insert(cls, conn: sqlite3.Connection, dataset_name: str, rows: Sequence[Row]):
+        cls._insert_terms(
+            conn,
+            dataset_name,
+            [
+                (doc_id, Counter(tokenize(text)), metadata)
+                for doc_id, text, metadata in rows
+            ],
+        )
+
+    @staticmethod
+    def _insert_terms(
+        conn: sqlite3.Connection,
+        dataset_name: str,
+        rows: Sequence[Tuple[str, Dict[str, int], Dict[str, Any]]],
+    ):
+        documents, postings = [], []
+        for doc_id, terms, metadata in rows:
+            documents.append(
+                (
+                    dataset_name,
+                    doc_id,
+                    sum(terms.values()),
+                    json.dumps(metadata, default=str),
+                )
+            )
+            postings.extend(
+                (dataset_name, term, doc_id, frequency)
+                for term, frequency in terms.items()
+            )
+        conn.executemany(
+            """
+            INSERT INTO lexical_documents (dataset_name, document_id, length, metadata)
+            VALUES (?, ?, ?, ?)
+            """,
+            documents,
+        )
+        conn.executemany(
+            """
+            INSERT INTO lexical_postings (dataset_name, term, document_id, frequency)
+            VALUES (?, ?, ?, ?)
+            """,
+            postings,
+        )
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, dataset_name: str, document_ids: List[str]):
+        ids = [(dataset_name, doc_id) for doc_id in document_ids]
+        conn.executemany(
+            """
+            DELETE FROM lexical_postings
+            WHERE dataset_name = ? AND document_id = ?
+            """,
+            ids,
+        )
+        conn.executemany(
+            """
+            DELETE FROM lexical_documents
+            WHERE dataset_name = ? AND document_id = ?
+            """,
+            ids,
+        )
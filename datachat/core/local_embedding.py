@@ -0,0 +1,142 @@
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from datachat.core.models import EmbeddingModel
+
+_WORD = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=200_000)
+def _word_features(
+    word: str, dimension: int, min_n: int, max_n: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed buckets and signs of a word and its character n-grams"""
+    padded = f"<{word}>"
+    grams = [word] + [
+        padded[i : i + n]
+        for n in range(min_n, max_n + 1)
+        for i in range(len(padded) - n + 1)
+    ]
+    hashes = np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype=np.int64)
+    # The low bits pick the bucket and the top bit the sign, so colliding
+    # features tend to cancel out rather than add up
+    signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+    return hashes % dimension, signs
+
+
+class HashedNgramEmbedding(EmbeddingModel):
+    """Local CPU embedding model projecting hashed n-grams with TF-IDF weights
+
+    Words and their character n-grams are hashed into a fixed number of
+    buckets with a random sign, weighted by sublinear term frequency and
+    by the inverse document frequency of their bucket, and L2-normalized.
+    The IDF weights are fitted once on a dataset's first documents and
+    then kept, so vectors stay comparable as the dataset changes.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 512,
+        ngram_range: Tuple[int, int] = (3, 5),
+        idf: Optional[np.ndarray] = None,
+    ):
+        """Initialize the model
+
+        Args:
+            dimension: Length of the produced vectors
+            ngram_range: Smallest and largest character n-gram length
+            idf: Fitted IDF weight per bucket, None until fit is called
+        """
+        self.dimension = dimension
+        self.ngram_range = tuple(ngram_range)
+        self.idf = idf
+        self.model_name = f"hashed-ngram-{dimension}"
+
+    @property
+    def fitted(self) -> bool:
+        return self.idf is not None
+
+    def fit(self, texts: Sequence[str]) -> None:
+        """Learn the IDF weight of every bucket from a sample of documents"""
+        document_frequency = np.zeros(self.dimension, dtype=np.float64)
+        for text in texts:
+            buckets = [self._features(word)[0] for word in set(self._words(text))]
+            if buckets:
+                document_frequency[np.unique(np.concatenate(buckets))] += 1
+        count = len(texts)
+        idf = np.log((1 + count) / (1 + document_frequency)) + 1
+        self.idf = idf.astype(np.float32)
+
+    def create_embedding(self, text: str) -> List[float]:
+        return self.create_embeddings([text])[0]
+
+    def create_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    async def acreate_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        # Encoding takes microseconds, less than a hop to a worker thread
+        return self.create_embeddings(texts)
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dimension) float32 matrix"""
+        positions, weights = [], []
+        for row, text in enumerate(texts):
+            for word, count in Counter(self._words(text)).items():
+                buckets, signs = self._features(word)
+                positions.append(buckets + row * self.dimension)
+                weights.append(signs * (1 + math.log(count)))
+
+        size = len(texts) * self.dimension
+        if positions:
+            flat = np.bincount(
+                np.concatenate(positions),
+                weights=np.concatenate(weights),
+                minlength=size,
+            )
+        else:
+            flat = np.zeros(size)
+        matrix = flat.reshape(len(texts), self.dimension).astype(np.float32)
+
+        idf = self.idf
+        if idf is not None:
+            matrix *= idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1)
+
+    def save(self, path: str) -> None:
+        """Persist the fitted model, replacing any earlier file atomically"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp.npz")
+        np.savez(
+            temporary,
+            dimension=self.dimension,
+            ngram_range=np.array(self.ngram_range),
+            idf=self.idf if self.idf is not None else np.empty(0, np.float32),
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "HashedNgramEmbedding":
+        with np.load(path) as state:
+            idf = state["idf"]
+            return cls(
+                int(state["dimension"]),
+                tuple(int(n) for n in state["ngram_range"]),
+                idf if idf.size else None,
+            )
+
+    def _features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        return _word_features(word, self.dimension, *self.ngram_range)
+
+    @staticmethod
+    def _words(text: str) -> List[str]:
+        return _WORD.findall(text.lower())
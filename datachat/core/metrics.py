@@ -0,0 +1,261 @@
+import bisect
+import threading
+import time
+from contextlib import ContextDecorator, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from SQLite lookups up to slow completions
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# US dollars per million (prompt, completion) tokens
+TOKEN_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "text-embedding-ada-002": (0.1, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+Labels = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        if len(labels) != len(self.labels):
+            raise ValueError(
+                f"{self.name} takes labels {self.labels}, got {tuple(labels)}"
+            )
+        return tuple(str(label) for label in labels)
+
+    def _format(self, key: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (
+            (name, value.replace("\\", "\\\\").replace('"', '\\"'))
+            for name, value in pairs
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing total per label set"""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [
+            f"{self.name}{self._format(key)} {value:g}" for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    """Latest value per label set"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Observation counts in cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (last one is +Inf) and the sum
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), total[0]))
+                for key, (counts, total) in self._values.items()
+            )
+        lines = super().render()
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(
+                    f"{self.name}_bucket{self._format(key, ('le', le))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{self._format(key)} {total:g}")
+            lines.append(f"{self.name}_count{self._format(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def _register(self, cls, name, help, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} is already a {metric.kind}")
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for m in metrics for line in m.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "datachat_stage_seconds", "Time spent in each stage of chat and ingest", ["stage"]
+)
+TOKENS = REGISTRY.counter(
+    "datachat_tokens_total",
+    "Tokens sent to and received from models",
+    ["model", "kind"],
+)
+COST = REGISTRY.counter(
+    "datachat_cost_usd_total", "Estimated model spend in US dollars", ["model"]
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "datachat_cache_lookups_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+INGEST_ROWS = REGISTRY.counter(
+    "datachat_ingest_rows_total", "Ingested rows by outcome", ["outcome"]
+)
+INGEST_ROWS_PER_SECOND = REGISTRY.gauge(
+    "datachat_ingest_rows_per_second", "Upsert throughput of the latest ingest"
+)
+
+# Stage timings of the request being served, if they are being collected
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("timings", default=None)
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record time spent in a stage, for metrics and the current request"""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+class timed(ContextDecorator):
+    """Time a block or function as a stage"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._started = 0.0
+
+    def _recreate_cm(self):
+        # A decorated function may run in several threads at once
+        return type(self)(self.stage)
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self._started)
+        return False
+
+
+def record_tokens(model: str, prompt: int, completion: int = 0) -> None:
+    """Count tokens a model call used and add its estimated cost"""
+    TOKENS.inc(prompt, model, "prompt")
+    if completion:
+        TOKENS.inc(completion, model, "completion")
+    prompt_price, completion_price = TOKEN_PRICES.get(model, (0.0, 0.0))
+    COST.inc((prompt * prompt_price + completion * completion_price) / 1e6, model)
+
+
+def record_cache(cache: str, hits: int, misses: int = 0) -> None:
+    if hits:
+        CACHE_LOOKUPS.inc(hits, cache, "hit")
+    if misses:
+        CACHE_LOOKUPS.inc(misses, cache, "miss")
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Collect the stage timings recorded while the block runs"""
+    token = _timings.set({})
+    try:
+        yield _timings.get()
+    finally:
+        _timings.reset(token)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Render stage timings as a Server-Timing header value in milliseconds"""
+    return ", ".join(f"{stage};dur={s * 1000:.1f}" for stage, s in timings.items())
@@ -1,11 +1,15 @@
+import asyncio
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from curses.ascii import EM
 import os
-from typing import List
+import time
+from typing import AsyncIterator, Iterator, List, Sequence
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
+from datachat.core import metrics
 from datachat.core.config import OpenAIConfig
 
 
@@ -17,30 +21,152 @@ class EmbeddingModel(ABC):
         """Generate embedding for given text"""
         pass
 
+    def create_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        """Generate embeddings for many texts, preserving input order"""
+        return [self.create_embedding(text) for text in texts]
+
+    async def acreate_embedding(self, text: str) -> List[float]:
+        """Async variant of create_embedding"""
+        return (await self.acreate_embeddings([text]))[0]
+
+    async def acreate_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        """Async variant of create_embeddings, run in a worker thread by default"""
+        return await asyncio.to_thread(self.create_embeddings, texts)
+
 
 class InferenceModel(ABC):
     """Model for performing inference/generation tasks"""
 
     @abstractmethod
     def generate_response(
-        self, context: List[dict], user_query: str, history_text: str = ""
+        self, context: str, user_query: str, history_text: str = ""
     ) -> str:
-        """Generate a response based on context and query"""
+        """Generate a response based on the rendered context and query"""
         pass
 
+    async def agenerate_response(self, *args, **kwargs) -> str:
+        """Async variant of generate_response, run in a worker thread by default"""
+        return await asyncio.to_thread(self.generate_response, *args, **kwargs)
+
+    def stream_response(self, *args, **kwargs) -> Iterator[str]:
+        """Yield the response in pieces as it is generated
+
+        Models without native streaming yield the whole response at once.
+        """
+        yield self.generate_response(*args, **kwargs)
+
+    async def astream_response(self, *args, **kwargs) -> AsyncIterator[str]:
+        """Async variant of stream_response"""
+        yield await self.agenerate_response(*args, **kwargs)
+
 
 class OpenAIEmbedding(EmbeddingModel):
+    # Limits for a single embeddings request
+    MAX_BATCH_SIZE = 2048
+    MAX_BATCH_TOKENS = 8191 * 32
+
     def __init__(
-        self, config: OpenAIConfig, model_name: str = "text-embedding-ada-002"
+        self,
+        config: OpenAIConfig,
+        model_name: str = "text-embedding-ada-002",
+        batch_size: int = 512,
+        batch_tokens: int = 100_000,
+        max_workers: int = 4,
     ):
+        """Initialize the OpenAI embedding model
+
+        Args:
+            config: OpenAI configuration
+            model_name: Embedding model to use
+            batch_size: Maximum number of texts sent in one request
+            batch_tokens: Approximate token budget for one request
+            max_workers: Number of batch requests running at the same time
+        """
         load_dotenv()
         self.client = OpenAI(api_key=config.api_key)
+        self.async_client = AsyncOpenAI(api_key=config.api_key)
         self.model_name = model_name
+        self.batch_size = min(batch_size, self.MAX_BATCH_SIZE)
+        self.batch_tokens = min(batch_tokens, self.MAX_BATCH_TOKENS)
+        self.max_workers = max_workers
 
     def create_embedding(self, text: str) -> List[float]:
-        response = self.client.embeddings.create(model=self.model_name, input=text)
+        with metrics.timed("embed"):
+            response = self.client.embeddings.create(model=self.model_name, input=text)
+        self._record_usage(response)
         return response.data[0].embedding
 
+    def create_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed texts in token-limited batches using a bounded worker pool"""
+        texts = list(texts)
+        if not texts:
+            return []
+
+        batches = list(self._batches(texts))
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(self._embed_batch, batches)
+            return [embedding for batch in results for embedding in batch]
+
+    async def acreate_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        """Embed texts in batches, with at most max_workers requests in flight"""
+        texts = list(texts)
+        if not texts:
+            return []
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def embed(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                with metrics.timed("embed"):
+                    response = await self.async_client.embeddings.create(
+                        model=self.model_name, input=batch
+                    )
+            self._record_usage(response)
+            return self._ordered(response)
+
+        results = await asyncio.gather(*(embed(b) for b in self._batches(texts)))
+        return [embedding for batch in results for embedding in batch]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        with metrics.timed("embed"):
+            response = self.client.embeddings.create(model=self.model_name, input=texts)
+        self._record_usage(response)
+        return self._ordered(response)
+
+    def _record_usage(self, response) -> None:
+        if response.usage is not None:
+            metrics.record_tokens(self.model_name, response.usage.prompt_tokens)
+
+    @staticmethod
+    def _ordered(response) -> List[List[float]]:
+        # The API does not guarantee ordering, so sort by the returned index
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def _batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """Group texts so each batch stays under the size and token limits"""
+        batch: List[str] = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = self._estimate_tokens(text)
+            if batch and (
+                len(batch) >= self.batch_size
+                or batch_tokens + tokens > self.batch_tokens
+            ):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # Roughly four characters per token for English text
+        return len(text) // 4 + 1
+
 
 class OpenAIInference(InferenceModel):
     """OpenAI's implementation of embedding model"""
@@ -61,34 +187,107 @@ class OpenAIInference(InferenceModel):
     ):
         load_dotenv()
         self.client = OpenAI(api_key=config.api_key)
+        self.async_client = AsyncOpenAI(api_key=config.api_key)
         self.model_name = model_name
 
     def generate_response(
         self,
-        context: List[dict],
+        context: str,
         user_query: str,
         system_prompt: str,
         history_text: str = "",
     ) -> str:
         """Generate completion for given query"""
+        with metrics.timed("inference"):
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._messages(
+                    context, user_query, system_prompt, history_text
+                ),
+            )
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
 
-        prompt = f"""{'System: ' + system_prompt}
-                        Previous conversation:
-                        {history_text}
-
-                        Relevant context:
-                        {context}
+    async def agenerate_response(
+        self,
+        context: str,
+        user_query: str,
+        system_prompt: str,
+        history_text: str = "",
+    ) -> str:
+        """Generate completion for given query without blocking the event loop"""
+        with metrics.timed("inference"):
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=self._messages(
+                    context, user_query, system_prompt, history_text
+                ),
+            )
+        self._record_usage(response.usage)
+        return response.choices[0].message.content
 
-                        Current query: {user_query}"""
+    def stream_response(
+        self,
+        context: str,
+        user_query: str,
+        system_prompt: str,
+        history_text: str = "",
+    ) -> Iterator[str]:
+        """Yield completion tokens as they arrive"""
+        started = time.perf_counter()
+        stream = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(context, user_query, system_prompt, history_text),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            self._record_usage(chunk.usage)
+        metrics.observe("inference", time.perf_counter() - started)
 
-        response = self.client.chat.completions.create(
+    async def astream_response(
+        self,
+        context: str,
+        user_query: str,
+        system_prompt: str,
+        history_text: str = "",
+    ) -> AsyncIterator[str]:
+        """Yield completion tokens as they arrive without blocking the event loop"""
+        started = time.perf_counter()
+        stream = await self.async_client.chat.completions.create(
             model=self.model_name,
-            messages=[
-                {"role": "system", "content": prompt},
-                {
-                    "role": "user",
-                    "content": f"Using the following context: {context}\n\nAnswer: {user_query}",
-                },
-            ],
+            messages=self._messages(context, user_query, system_prompt, history_text),
+            stream=True,
+            stream_options={"include_usage": True},
         )
-        return response.choices[0].message.content
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            self._record_usage(chunk.usage)
+        metrics.observe("inference", time.perf_counter() - started)
+
+    def _record_usage(self, usage) -> None:
+        # Streams report usage only in their final chunk
+        if usage is not None:
+            metrics.record_tokens(
+                self.model_name, usage.prompt_tokens, usage.completion_tokens
+            )
+
+    @staticmethod
+    def _messages(
+        context: str, user_query: str, system_prompt: str, history_text: str
+    ) -> List[dict]:
+        # The context goes in once, in the user turn, next to the question
+        prompt = f"""{'System: ' + system_prompt}
+                        Previous conversation:
+                        {history_text}"""
+
+        return [
+            {"role": "system", "content": prompt},
+            {
+                "role": "user",
+                "content": f"Relevant context:\n{context}\n\nAnswer: {user_query}",
+            },
+        ]
@@ -0,0 +1,214 @@
+import asyncio
+import queue
+import threading
+from itertools import islice
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from datachat.core.document import Document
+from datachat.core.ingestion import IngestStats
+
+# (id, text, metadata) for one document
+Row = Tuple[str, str, Dict[str, Any]]
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """Render, embed and upsert documents as overlapping pipeline stages
+
+    Documents are pulled from the input lazily and passed between stages in
+    batches through bounded queues. A full queue blocks the stage feeding
+    it, so at most a fixed number of batches is held in memory no matter
+    how many documents the input yields, while the embedding and upsert
+    network calls for different batches run at the same time.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 500,
+        max_in_flight: int = 4,
+        select: Optional[Callable[[List[Row]], List[Row]]] = None,
+        on_upserted: Optional[Callable[[List[Row]], None]] = None,
+    ):
+        """Initialize the pipeline
+
+        Args:
+            batch_size: Number of documents per batch
+            max_in_flight: Batches queued between stages, and the number of
+                workers running each network stage
+            select: Optional filter applied to each rendered batch; only the
+                rows it returns are embedded and upserted
+            on_upserted: Optional callback run after a batch is upserted
+        """
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.select = select
+        self.on_upserted = on_upserted
+        # Ids of the batch whose upsert finished last
+        self.last_upserted: List[str] = []
+
+    def run(
+        self,
+        documents: Iterable[Document],
+        stats: IngestStats,
+        embed: Callable[[List[str]], List[List[float]]],
+        upsert: Callable[[List[tuple]], None],
+    ) -> None:
+        """Run the pipeline with worker threads, blocking until it drains
+
+        Args:
+            documents: Documents to ingest, consumed lazily
+            stats: Counters updated as batches move through the stages
+            embed: Embeds a batch of texts
+            upsert: Upserts a batch of (id, vector, metadata) tuples
+        """
+        embed_queue: queue.Queue = queue.Queue(self.max_in_flight)
+        upsert_queue: queue.Queue = queue.Queue(self.max_in_flight)
+        failures: List[BaseException] = []
+        failed = threading.Event()
+
+        def worker(inbox: queue.Queue, work: Callable[[Any], None]) -> None:
+            while (item := inbox.get()) is not _DONE:
+                # After a failure keep draining so upstream stages never block
+                if failed.is_set():
+                    continue
+                try:
+                    work(item)
+                except BaseException as e:
+                    failures.append(e)
+                    failed.set()
+
+        def embed_rows(rows: List[Row]) -> None:
+            embeddings = embed([text for _, text, _ in rows])
+            upsert_queue.put((rows, self._to_vectors(rows, embeddings)))
+
+        def upsert_rows(item: Tuple[List[Row], List[tuple]]) -> None:
+            rows, vectors = item
+            upsert(vectors)
+            self.last_upserted = [doc_id for doc_id, _, _ in vectors]
+            stats.increment(rows_upserted=len(vectors))
+            if self.on_upserted:
+                self.on_upserted(rows)
+
+        embedders = self._start(self.max_in_flight, worker, embed_queue, embed_rows)
+        upserters = self._start(self.max_in_flight, worker, upsert_queue, upsert_rows)
+        try:
+            for rows in self._render(documents, stats):
+                if failed.is_set():
+                    break
+                if self.select:
+                    rows = self.select(rows)
+                if rows:
+                    embed_queue.put(rows)
+        finally:
+            self._stop(embedders, embed_queue)
+            self._stop(upserters, upsert_queue)
+
+        if failures:
+            raise failures[0]
+
+    async def arun(
+        self,
+        documents: Iterable[Document],
+        stats: IngestStats,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        upsert: Callable[[List[tuple]], Awaitable[None]],
+    ) -> None:
+        """Run the pipeline as asyncio tasks using async embed/upsert calls
+
+        Documents are read, and the select and on_upserted hooks run, in
+        worker threads, so neither blocks the event loop.
+        """
+        embed_queue: asyncio.Queue = asyncio.Queue(self.max_in_flight)
+        upsert_queue: asyncio.Queue = asyncio.Queue(self.max_in_flight)
+
+        async def embedder() -> None:
+            while (rows := await embed_queue.get()) is not _DONE:
+                embeddings = await embed([text for _, text, _ in rows])
+                await upsert_queue.put((rows, self._to_vectors(rows, embeddings)))
+
+        async def upserter() -> None:
+            while (item := await upsert_queue.get()) is not _DONE:
+                rows, vectors = item
+                await upsert(vectors)
+                self.last_upserted = [doc_id for doc_id, _, _ in vectors]
+                stats.increment(rows_upserted=len(vectors))
+                if self.on_upserted:
+                    await asyncio.to_thread(self.on_upserted, rows)
+
+        async def producer() -> None:
+            # Documents may come from a file or database, so they are read
+            # in a worker thread, like select runs
+            batches = self._render(documents, stats)
+            while (rows := await asyncio.to_thread(next, batches, None)) is not None:
+                if self.select:
+                    rows = await asyncio.to_thread(self.select, rows)
+                if rows:
+                    await embed_queue.put(rows)
+            for _ in range(self.max_in_flight):
+                await embed_queue.put(_DONE)
+
+        async def close_upserts() -> None:
+            await asyncio.gather(*embedders)
+            for _ in upserters:
+                await upsert_queue.put(_DONE)
+
+        embedders = [asyncio.create_task(embedder()) for _ in range(self.max_in_flight)]
+        upserters = [asyncio.create_task(upserter()) for _ in range(self.max_in_flight)]
+        tasks = [
+            asyncio.create_task(producer()),
+            asyncio.create_task(close_upserts()),
+            *embedders,
+            *upserters,
+        ]
+        try:
+            # Raises the first failure; the finally block stops the other stages
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _render(
+        self, documents: Iterable[Document], stats: IngestStats
+    ) -> Iterator[List[Row]]:
+        iterator = iter(documents)
+        while batch := list(islice(iterator, self.batch_size)):
+            stats.increment(rows_read=len(batch))
+            # Later duplicates of an id replace earlier ones, as in an upsert
+            rows = {doc.id: (doc.id, doc.text, doc.metadata) for doc in batch}
+            yield list(rows.values())
+
+    @staticmethod
+    def _to_vectors(rows: List[Row], embeddings: List[List[float]]) -> List[tuple]:
+        return [
+            (doc_id, embedding, metadata)
+            for (doc_id, _, metadata), embedding in zip(rows, embeddings)
+        ]
+
+    @staticmethod
+    def _start(count: int, target, *args) -> List[threading.Thread]:
+        threads = [
+            threading.Thread(target=target, args=args, daemon=True)
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    @staticmethod
+    def _stop(threads: List[threading.Thread], inbox: queue.Queue) -> None:
+        for _ in threads:
+            inbox.put(_DONE)
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,223 @@
+import re
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+
+# Kinds of metadata fields a dataset can declare as filterable
+KEYWORD = "keyword"
+DATE = "date"
+FIELD_KINDS = (KEYWORD, DATE)
+
+_MONTHS = {
+    "jan": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "may": 5,
+    "jun": 6,
+    "jul": 7,
+    "aug": 8,
+    "sep": 9,
+    "oct": 10,
+    "nov": 11,
+    "dec": 12,
+}
+_MONTH = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+_DAY = r"(\d{1,2})(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s+(\d{4}))?"
+_DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), ("year", "month", "day")),
+    (re.compile(rf"\b{_MONTH}\s+{_DAY}{_YEAR}\b", re.I), ("month", "day", "year")),
+    (
+        re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH}{_YEAR}\b", re.I),
+        ("day", "month", "year"),
+    ),
+]
+_RANGE_WORDS = re.compile(
+    r"\b(after|since|from|before|until|till|through|between)\s*$", re.I
+)
+_OPERATORS = {
+    "after": "$gt",
+    "since": "$gte",
+    "from": "$gte",
+    "before": "$lt",
+    "until": "$lte",
+    "till": "$lte",
+    "through": "$lte",
+}
+
+
+def date_keys(field: str) -> Tuple[str, str]:
+    """Derived metadata keys holding a date field as YYYYMMDD and as MMDD"""
+    return f"_{field}_day", f"_{field}_md"
+
+
+def annotate(
+    metadata: Dict[str, Any], filter_fields: Optional[Dict[str, str]]
+) -> Dict[str, Any]:
+    """Add the derived keys date filters run against to a copy of metadata
+
+    Date strings can't be range-filtered by every store, so each declared
+    date field is also stored as integers.
+    """
+    dates = [f for f, kind in (filter_fields or {}).items() if kind == DATE]
+    if not dates:
+        return metadata
+    annotated = dict(metadata)
+    for field in dates:
+        value = _parse_date(metadata.get(field))
+        if value is not None:
+            day_key, md_key = date_keys(field)
+            annotated[day_key] = value.year * 10000 + value.month * 100 + value.day
+            annotated[md_key] = value.month * 100 + value.day
+    return annotated
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if isinstance(value, (date, datetime)):
+        return value
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        match = re.match(r"\s*(\d{4})-(\d{2})-(\d{2})", value)
+        if match:
+            try:
+                return date(*map(int, match.groups()))
+            except ValueError:
+                return None
+        return None
+
+
+class QueryPlanner:
+    """Rule-based extraction of metadata filters from a question
+
+    Keyword fields match when one of the field's known values appears in
+    the question as whole words. Date fields match dates written as
+    ``2024-10-22``, ``October 22nd`` or ``22 Oct 2024``, optionally after
+    a range word such as "after", "before" or "between ... and ...".
+    """
+
+    def __init__(self):
+        # Compiled value patterns per (dataset, field), with the value list
+        # they were built from
+        self._patterns: Dict[Tuple[str, str], Tuple[List[str], Pattern]] = {}
+        self._lock = threading.Lock()
+
+    def plan(
+        self,
+        dataset_name: str,
+        query: str,
+        filter_fields: Dict[str, str],
+        field_values: Dict[str, List[str]],
+    ) -> Optional[Dict[str, Any]]:
+        """Build a metadata filter for the query
+
+        Args:
+            dataset_name: Dataset the query runs against
+            query: User's question
+            filter_fields: Declared filterable fields and their kinds
+            field_values: Known values of each keyword field
+
+        Returns:
+            A Pinecone-style filter, or None if nothing was recognised
+        """
+        conditions = []
+        for field, kind in filter_fields.items():
+            if kind == KEYWORD:
+                condition = self._keyword_condition(
+                    dataset_name, query, field, field_values.get(field, [])
+                )
+            elif kind == DATE:
+                condition = self._date_condition(query, field)
+            else:
+                condition = None
+            if condition:
+                conditions.append(condition)
+
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _keyword_condition(
+        self, dataset_name: str, query: str, field: str, values: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        pattern = self._pattern(dataset_name, field, values)
+        if pattern is None:
+            return None
+        by_lower = {value.lower(): value for value in values}
+        found = list(
+            dict.fromkeys(by_lower[m.group(1).lower()] for m in pattern.finditer(query))
+        )
+        if not found:
+            return None
+        if len(found) == 1:
+            return {field: {"$eq": found[0]}}
+        return {field: {"$in": found}}
+
+    def _pattern(
+        self, dataset_name: str, field: str, values: List[str]
+    ) -> Optional[Pattern]:
+        key = (dataset_name, field)
+        with self._lock:
+            cached = self._patterns.get(key)
+            if cached is not None and cached[0] is values:
+                return cached[1]
+
+        # Longest values first so "James Smith" wins over "James"
+        words = sorted((v for v in values if len(v) >= 3), key=len, reverse=True)
+        pattern = None
+        if words:
+            alternation = "|".join(re.escape(word) for word in words)
+            # Allow a plural "s" so "keynotes" matches "keynote"
+            pattern = re.compile(rf"\b({alternation})s?\b", re.I)
+        with self._lock:
+            self._patterns[key] = (values, pattern)
+        return pattern
+
+    @staticmethod
+    def _date_condition(query: str, field: str) -> Optional[Dict[str, Any]]:
+        mentions = []
+        for pattern, order in _DATE_PATTERNS:
+            for match in pattern.finditer(query):
+                parts = dict(zip(order, match.groups()))
+                month = _month(parts["month"])
+                day = int(parts["day"])
+                if month is None or not 1 <= day <= 31:
+                    continue
+                year = int(parts["year"]) if parts["year"] else None
+                range_word = _RANGE_WORDS.search(query[: match.start()])
+                word = range_word.group(1).lower() if range_word else None
+                mentions.append((match.start(), year, month, day, word))
+        if not mentions:
+            return None
+
+        mentions.sort()
+        day_key, md_key = date_keys(field)
+        with_year = all(year is not None for _, year, _, _, _ in mentions)
+        key = day_key if with_year else md_key
+        values = [
+            (year or 0) * 10000 * with_year + month * 100 + day
+            for _, year, month, day, _ in mentions
+        ]
+        words = [word for *_, word in mentions]
+
+        if words[0] == "between" and len(values) >= 2:
+            return {key: {"$gte": values[0], "$lte": values[1]}}
+        condition = {}
+        for value, word in zip(values, words):
+            if word in _OPERATORS:
+                condition[_OPERATORS[word]] = value
+        if condition:
+            return {key: condition}
+        if len(values) == 1:
+            return {key: {"$eq": values[0]}}
+        return {key: {"$in": list(dict.fromkeys(values))}}
+
+
+def _month(value: str) -> Optional[int]:
+    if value.isdigit():
+        month = int(value)
+        return month if 1 <= month <= 12 else None
+    return _MONTHS.get(value[:3].lower())
@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+from datachat.core import metrics
+from datachat.core.lexical_index import tokenize
+from datachat.store.vector_store import Match
+
+
+@dataclass
+class Ranking:
+    """Retrieved documents left after reranking and the adaptive cutoff"""
+
+    matches: List[Match]
+    candidates: int = 0
+    seconds: float = 0.0
+
+    @property
+    def documents(self) -> List[Dict[str, Any]]:
+        return [match.metadata for match in self.matches]
+
+
+class Reranker(ABC):
+    """Rescores retrieved documents and keeps only the relevant head
+
+    Documents are sorted by relevance and cut at the first one that scores
+    below ``min_score`` or falls more than ``max_gap`` below the document
+    ranked just above it, but never below ``min_k`` documents.
+    """
+
+    def __init__(self, min_score: float = 0.1, max_gap: float = 0.25, min_k: int = 3):
+        """Initialize the reranker
+
+        Args:
+            min_score: Relevance below which documents are dropped
+            max_gap: Drop in relevance between neighbours that ends the list
+            min_k: Documents always kept, if retrieved
+        """
+        self.min_score = min_score
+        self.max_gap = max_gap
+        self.min_k = min_k
+
+    @abstractmethod
+    def score(self, query: str, matches: Sequence[Match]) -> List[float]:
+        """Relevance of each document to the query, between 0 and 1"""
+        pass
+
+    def rerank(self, query: str, matches: Sequence[Match]) -> Ranking:
+        """Sort documents by relevance and apply the adaptive cutoff"""
+        started = time.perf_counter()
+        if not matches:
+            return Ranking([])
+        scores = self.score(query, matches)
+        ranked = sorted(zip(scores, matches), key=lambda pair: pair[0], reverse=True)
+        kept = self.cutoff([score for score, _ in ranked])
+        seconds = time.perf_counter() - started
+        metrics.observe("rerank", seconds)
+        return Ranking(
+            [Match(match.id, score, match.metadata) for score, match in ranked[:kept]],
+            candidates=len(matches),
+            seconds=seconds,
+        )
+
+    def cutoff(self, scores: List[float]) -> int:
+        """Number of documents to keep from scores sorted high to low"""
+        for i in range(max(self.min_k, 1), len(scores)):
+            if scores[i] < self.min_score or scores[i - 1] - scores[i] > self.max_gap:
+                return i
+        return len(scores)
+
+    @staticmethod
+    def _text(match: Match) -> str:
+        return " ".join(
+            str(value)
+            for key, value in match.metadata.items()
+            if not key.startswith("_") and value not in (None, "")
+        )
+
+
+class LexicalReranker(Reranker):
+    """Cheap local reranker blending retrieval rank with query term overlap
+
+    The retrieval scores are min-max scaled so a steep drop in them shows
+    up as a gap; the overlap is the share of the question's terms that the
+    document contains.
+    """
+
+    def __init__(self, overlap_weight: float = 0.5, **kwargs):
+        """Initialize the reranker
+
+        Args:
+            overlap_weight: Share of the relevance given to term overlap
+            **kwargs: Cutoff settings passed to Reranker
+        """
+        super().__init__(**kwargs)
+        self.overlap_weight = overlap_weight
+
+    def score(self, query: str, matches: Sequence[Match]) -> List[float]:
+        retrieval = [match.score for match in matches]
+        low, high = min(retrieval), max(retrieval)
+        scaled = [
+            (score - low) / (high - low) if high > low else 1.0 for score in retrieval
+        ]
+
+        terms = {self._stem(token) for token in tokenize(query)}
+        if not terms:
+            return scaled
+        weight = self.overlap_weight
+        scores = []
+        for match, prior in zip(matches, scaled):
+            words = {self._stem(token) for token in tokenize(self._text(match))}
+            overlap = len(terms & words) / len(terms)
+            scores.append((1 - weight) * prior + weight * overlap)
+        return scores
+
+    @staticmethod
+    def _stem(token: str) -> str:
+        # Plural questions ("keynotes") should match singular values
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            return token[:-1]
+        return token
+
+
+class CrossEncoderReranker(Reranker):
+    """Reranker scoring question and document together with a cross-encoder
+
+    More accurate than LexicalReranker at the cost of a model forward pass
+    per document. Requires the sentence-transformers package.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        batch_size: int = 32,
+        **kwargs,
+    ):
+        """Initialize the reranker; the model is loaded on first use
+
+        Args:
+            model_name: Hugging Face cross-encoder model
+            batch_size: Documents scored per forward pass
+            **kwargs: Cutoff settings passed to Reranker
+
+        Raises:
+            ImportError: If sentence-transformers is not installed
+        """
+        super().__init__(**kwargs)
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "CrossEncoderReranker requires the sentence-transformers package"
+            ) from e
+        self._load = lambda: CrossEncoder(model_name)
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def score(self, query: str, matches: Sequence[Match]) -> List[float]:
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+        logits = self._model.predict(
+            [(query, self._text(match)) for match in matches],
+            batch_size=self.batch_size,
+        )
+        return [1 / (1 + math.exp(-float(logit))) for logit in logits]
@@ -0,0 +1,285 @@
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Tuple
+
+# (user message, assistant response) for one exchange
+Turn = Tuple[str, str]
+
+
+class SessionStore(ABC):
+    """Conversation history partitioned by (dataset, session id)
+
+    Each session keeps its last ``window`` exchanges. At most
+    ``max_sessions`` sessions are kept, evicting the least recently used,
+    and sessions idle for longer than ``ttl_seconds`` expire.
+    """
+
+    def __init__(
+        self, window: int = 3, max_sessions: int = 10_000, ttl_seconds: float = 3600
+    ):
+        """Initialize the store
+
+        Args:
+            window: Number of exchanges remembered per session
+            max_sessions: Maximum number of sessions kept
+            ttl_seconds: Idle time after which a session is forgotten
+        """
+        self.window = window
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def history(self, dataset_name: str, session_id: str) -> List[Turn]:
+        """Return the remembered exchanges of a session, oldest first"""
+        pass
+
+    @abstractmethod
+    def append(
+        self, dataset_name: str, session_id: str, user_message: str, response: str
+    ) -> None:
+        """Remember an exchange and mark the session as recently used"""
+        pass
+
+    @abstractmethod
+    def clear(self, dataset_name: str, session_id: str) -> None:
+        """Forget a session"""
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of live sessions"""
+        pass
+
+
+@dataclass
+class _Session:
+    turns: Deque[Turn]
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class InMemorySessionStore(SessionStore):
+    """Session store kept in process memory
+
+    Sessions are held in an ordered dict in least-recently-used order, so
+    both LRU eviction and TTL expiry only ever pop from its front.
+    """
+
+    def __init__(
+        self, window: int = 3, max_sessions: int = 10_000, ttl_seconds: float = 3600
+    ):
+        super().__init__(window, max_sessions, ttl_seconds)
+        self._sessions: "OrderedDict[Tuple[str, str], _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def history(self, dataset_name: str, session_id: str) -> List[Turn]:
+        with self._lock:
+            self._expire(time.monotonic())
+            session = self._sessions.get((dataset_name, session_id))
+            return list(session.turns) if session else []
+
+    def append(
+        self, dataset_name: str, session_id: str, user_message: str, response: str
+    ) -> None:
+        key = (dataset_name, session_id)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.pop(key, None) or _Session(
+                deque(maxlen=self.window)
+            )
+            session.turns.append((user_message, response))
+            session.last_used = now
+            self._sessions[key] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, dataset_name: str, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop((dataset_name, session_id), None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._sessions)
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_used <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store persisted in SQLite, shared by every worker process"""
+
+    def __init__(
+        self,
+        db_path: str = "sessions.db",
+        window: int = 3,
+        max_sessions: int = 10_000,
+        ttl_seconds: float = 3600,
+    ):
+        """Initialize the store
+
+        Args:
+            db_path: Path to SQLite database file
+            window: Number of exchanges remembered per session
+            max_sessions: Maximum number of sessions kept
+            ttl_seconds: Idle time after which a session is forgotten
+        """
+        super().__init__(window, max_sessions, ttl_seconds)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _init_db(self) -> None:
+        """Initialize the database schema"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        dataset_name TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        last_used REAL NOT NULL,
+                        PRIMARY KEY (dataset_name, session_id)
+                    )
+                """
+                )
+                conn.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_sessions_last_used
+                    ON sessions (last_used)
+                """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS session_turns (
+                        dataset_name TEXT NOT NULL,
+                        session_id TEXT NOT NULL,
+                        turn INTEGER NOT NULL,
+                        user_message TEXT NOT NULL,
+                        response TEXT NOT NULL,
+                        PRIMARY KEY (dataset_name, session_id, turn)
+                    )
+                """
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to initialize session store: {e}")
+            raise
+
+    def history(self, dataset_name: str, session_id: str) -> List[Turn]:
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(
+                    """
+                    SELECT t.user_message, t.response
+                    FROM session_turns t JOIN sessions s
+                        ON s.dataset_name = t.dataset_name
+                        AND s.session_id = t.session_id
+                    WHERE t.dataset_name = ? AND t.session_id = ?
+                        AND s.last_used >= ?
+                    ORDER BY t.turn
+                    """,
+                    (dataset_name, session_id, cutoff),
+                ).fetchall()
+            return [(user_message, response) for user_message, response in rows]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load session history: {e}")
+            raise
+
+    def append(
+        self, dataset_name: str, session_id: str, user_message: str, response: str
+    ) -> None:
+        now = time.time()
+        key = (dataset_name, session_id)
+        try:
+            with self._lock, sqlite3.connect(self.db_path) as conn:
+                self._expire(conn, now)
+                conn.execute(
+                    """
+                    INSERT INTO sessions (dataset_name, session_id, last_used)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(dataset_name, session_id) DO UPDATE SET
+                        last_used = excluded.last_used
+                    """,
+                    (*key, now),
+                )
+                conn.execute(
+                    """
+                    INSERT INTO session_turns
+                        (dataset_name, session_id, turn, user_message, response)
+                    SELECT ?, ?, COALESCE(MAX(turn), 0) + 1, ?, ?
+                    FROM session_turns WHERE dataset_name = ? AND session_id = ?
+                    """,
+                    (*key, user_message, response, *key),
+                )
+                # Keep only the last `window` exchanges of the session
+                conn.execute(
+                    """
+                    DELETE FROM session_turns
+                    WHERE dataset_name = ? AND session_id = ? AND turn <= (
+                        SELECT MAX(turn) FROM session_turns
+                        WHERE dataset_name = ? AND session_id = ?
+                    ) - ?
+                    """,
+                    (*key, *key, self.window),
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to save session history: {e}")
+            raise
+
+    def clear(self, dataset_name: str, session_id: str) -> None:
+        try:
+            with self._lock, sqlite3.connect(self.db_path) as conn:
+                self._delete(conn, [(dataset_name, session_id)])
+        except sqlite3.Error as e:
+            logging.error(f"Failed to clear session: {e}")
+            raise
+
+    def __len__(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                return conn.execute(
+                    "SELECT COUNT(*) FROM sessions WHERE last_used >= ?", (cutoff,)
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Failed to count sessions: {e}")
+            raise
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute(
+            "SELECT dataset_name, session_id FROM sessions WHERE last_used < ?",
+            (now - self.ttl_seconds,),
+        ).fetchall()
+        self._delete(conn, expired)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        excess = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        excess -= self.max_sessions
+        if excess > 0:
+            oldest = conn.execute(
+                """
+                SELECT dataset_name, session_id FROM sessions
+                ORDER BY last_used LIMIT ?
+                """,
+                (excess,),
+            ).fetchall()
+            self._delete(conn, oldest)
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, keys: List[Tuple[str, str]]) -> None:
+        for table in ("sessions", "session_turns"):
+            conn.executemany(
+                f"DELETE FROM {table} WHERE dataset_name = ? AND session_id = ?",
+                keys,
+            )
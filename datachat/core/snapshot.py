@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Bumped whenever the layout changes in a way older readers can't handle
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.jsonl"
+LOCAL_MODEL_FILE = "local_embedding.npz"
+
+
+@dataclass
+class SnapshotManifest:
+    """Everything about a snapshot except its documents"""
+
+    name: str
+    system_prompt: str
+    # Embedding model the vectors were made with, as DataChat names it
+    # ("local", or None for the default) and as the model names itself
+    embedding_model: Optional[str]
+    model_name: Optional[str]
+    count: int
+    dimension: int
+    context_fields: Optional[List[str]] = None
+    filter_fields: Optional[Dict[str, str]] = None
+    field_values: Dict[str, List[str]] = field(default_factory=dict)
+    created_at: str = ""
+    version: int = FORMAT_VERSION
+
+
+class SnapshotWriter:
+    """Writes a dataset snapshot directory
+
+    A snapshot holds the dataset's embeddings as one contiguous float32
+    ``.npy`` matrix, one JSON line per document with its id, metadata,
+    content hash and BM25 term frequencies in the same order, and a
+    manifest. Everything is written to a temporary directory that replaces
+    ``path`` only once the snapshot is complete.
+    """
+
+    def __init__(self, path: str, count: int):
+        """Initialize the writer
+
+        Args:
+            path: Directory to write the snapshot to
+            count: Number of documents that will be written
+        """
+        self.path = Path(path)
+        self.count = count
+        self.written = 0
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        shutil.rmtree(self._tmp, ignore_errors=True)
+        self._tmp.mkdir(parents=True)
+        self._records = open(self._tmp / RECORDS_FILE, "w", encoding="utf-8")
+        self._embeddings: Optional[np.ndarray] = None
+
+    @property
+    def dimension(self) -> int:
+        return self._embeddings.shape[1] if self._embeddings is not None else 0
+
+    def write(self, records: List[Dict[str, Any]], vectors: np.ndarray) -> None:
+        """Append documents and their embeddings, in the same order
+
+        Raises:
+            ValueError: If more documents are written than announced
+        """
+        if self.written + len(records) > self.count:
+            raise ValueError(f"Snapshot holds only {self.count} documents")
+        if self._embeddings is None:
+            # Filled in place through a memory map, never held in memory
+            self._embeddings = np.lib.format.open_memmap(
+                self._tmp / EMBEDDINGS_FILE,
+                mode="w+",
+                dtype=np.float32,
+                shape=(self.count, vectors.shape[1]),
+            )
+        self._embeddings[self.written : self.written + len(records)] = vectors
+        for record in records:
+            self._records.write(json.dumps(record, default=str) + "\n")
+        self.written += len(records)
+
+    def include_local_model(self, path: Path) -> None:
+        """Ship the fitted local embedding model queries must embed with"""
+        shutil.copyfile(path, self._tmp / LOCAL_MODEL_FILE)
+
+    def commit(self, manifest: SnapshotManifest) -> None:
+        """Write the manifest and move the finished snapshot into place
+
+        Raises:
+            ValueError: If fewer documents were written than announced
+        """
+        if self.written != self.count:
+            self.abort()
+            raise ValueError(
+                f"Snapshot expected {self.count} documents, got {self.written}"
+            )
+        self._records.close()
+        if self._embeddings is not None:
+            self._embeddings.flush()
+            self._embeddings = None
+        manifest.count = self.count
+        manifest.created_at = datetime.now(timezone.utc).isoformat()
+        with open(self._tmp / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(asdict(manifest), f, indent=2)
+
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self._records.close()
+        self._embeddings = None
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+class SnapshotReader:
+    """Reads a snapshot written by SnapshotWriter
+
+    The embedding matrix is memory mapped, so batches are paged in from
+    disk as they are read and snapshots larger than memory load fine.
+    """
+
+    def __init__(self, path: str):
+        """Open a snapshot
+
+        Raises:
+            ValueError: If path is not a snapshot this version can read
+        """
+        self.path = Path(path)
+        manifest_path = self.path / MANIFEST_FILE
+        if not manifest_path.exists():
+            raise ValueError(f"No snapshot found at {path}")
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(
+                f"Snapshot format {manifest['version']} is newer than the "
+                f"supported format {FORMAT_VERSION}"
+            )
+        self.manifest = SnapshotManifest(**manifest)
+        self.embeddings = (
+            np.load(self.path / EMBEDDINGS_FILE, mmap_mode="r")
+            if self.manifest.count
+            else np.empty((0, self.manifest.dimension), np.float32)
+        )
+
+    @property
+    def local_model_path(self) -> Optional[Path]:
+        path = self.path / LOCAL_MODEL_FILE
+        return path if path.exists() else None
+
+    def batches(
+        self, batch_size: int = 500
+    ) -> Iterator[Tuple[List[Dict[str, Any]], np.ndarray]]:
+        """Yield documents with their embeddings, batch_size at a time"""
+        with open(self.path / RECORDS_FILE, encoding="utf-8") as f:
+            records: List[Dict[str, Any]] = []
+            start = 0
+            for line in f:
+                records.append(json.loads(line))
+                if len(records) == batch_size:
+                    yield records, self.embeddings[start : start + len(records)]
+                    start += len(records)
+                    records = []
+            if records:
+                yield records, self.embeddings[start : start + len(records)]
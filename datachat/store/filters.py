@@ -0,0 +1,90 @@
+from typing import Any, Callable, Dict, List
+
+from datachat.core.exceptions import VectorStoreError
+
+# Predicate over a vector's metadata
+Predicate = Callable[[Dict[str, Any]], bool]
+
+_MISSING = object()
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": lambda value, arg: value == arg,
+    "$ne": lambda value, arg: value != arg,
+    "$gt": lambda value, arg: value is not _MISSING and value > arg,
+    "$gte": lambda value, arg: value is not _MISSING and value >= arg,
+    "$lt": lambda value, arg: value is not _MISSING and value < arg,
+    "$lte": lambda value, arg: value is not _MISSING and value <= arg,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+# Operators a list value satisfies only if all its elements do; a list
+# satisfies the others if any of its elements does, as in Pinecone
+_NEGATED = {"$ne", "$nin"}
+
+
+def compile_filter(filter: Dict[str, Any]) -> Predicate:
+    """Compile a Pinecone-style metadata filter into a predicate
+
+    Supports ``{"field": value}`` equality, the ``$eq``, ``$ne``, ``$gt``,
+    ``$gte``, ``$lt``, ``$lte``, ``$in`` and ``$nin`` operators, and
+    ``$and``/``$or`` over lists of filters. Conditions on several fields
+    must all hold. A list value matches if any of its elements does, or
+    for ``$ne`` and ``$nin``, if none of them is excluded.
+
+    Raises:
+        VectorStoreError: If the filter uses an unknown operator
+    """
+    predicates: List[Predicate] = []
+    for key, condition in filter.items():
+        if key in ("$and", "$or"):
+            parts = [compile_filter(part) for part in condition]
+            combine = all if key == "$and" else any
+            predicates.append(
+                lambda meta, parts=parts, combine=combine: combine(
+                    part(meta) for part in parts
+                )
+            )
+        elif key.startswith("$"):
+            raise VectorStoreError(f"Unsupported filter operator: {key}")
+        else:
+            predicates.append(_field_predicate(key, condition))
+    return lambda meta: all(predicate(meta) for predicate in predicates)
+
+
+def _field_predicate(field: str, condition: Any) -> Predicate:
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+
+    checks = []
+    for operator, arg in condition.items():
+        if operator not in _OPERATORS:
+            raise VectorStoreError(f"Unsupported filter operator: {operator}")
+        check = _OPERATORS[operator]
+        if operator in _NEGATED:
+            checks.append((_on_elements(check, all), arg))
+        else:
+            checks.append((_on_elements(check, any), arg))
+
+    def predicate(meta: Dict[str, Any]) -> bool:
+        value = meta.get(field, _MISSING)
+        try:
+            return all(check(value, arg) for check, arg in checks)
+        except TypeError:
+            # Values of a different type than the filter never match
+            return False
+
+    return predicate
+
+
+def _on_elements(
+    check: Callable[[Any, Any], bool], combine: Callable[[Any], bool]
+) -> Callable[[Any, Any], bool]:
+    """Apply check to each element of list values, combining the results"""
+
+    def apply(value: Any, arg: Any) -> bool:
+        if isinstance(value, list):
+            return combine(check(element, arg) for element in value)
+        return check(value, arg)
+
+    return apply
@@ -0,0 +1,369 @@
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .numpy_store import NumpyStore, _Index, _normalize, _normalize_query, _top_k
+
+
+class _IVFIndex(_Index):
+    """Inverted-file index: vectors are bucketed by their nearest centroid
+
+    A query only scores the vectors in the ``nprobe`` buckets whose centroids
+    are closest to it. Each bucket is an array of row numbers with spare
+    room at its end, so new rows are appended to the buckets of their
+    centroids without touching the others; like the matrix, appends go
+    past the sizes searches of the previous index look at.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        centroids: Optional[np.ndarray] = None,
+        assignments: Optional[np.ndarray] = None,
+        nprobe: int = 8,
+        min_train_size: int = 4096,
+    ):
+        super().__init__(vectors, ids, metadata)
+        self.centroids = centroids
+        self.set_assignments(
+            assignments if assignments is not None else np.empty(0, np.int32)
+        )
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.trained_size = len(ids) if centroids is not None else 0
+        self._build_lists()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def set_assignments(self, buffer: np.ndarray) -> None:
+        """Use a buffer holding each row's bucket in its first rows"""
+        self.assignment_buffer = buffer
+        self.assignments = buffer[: len(self.ids)]
+
+    def copy(self) -> "_IVFIndex":
+        clone = super().copy()
+        if self.trained:
+            clone.lists = list(self.lists)
+            clone.list_sizes = self.list_sizes.copy()
+        return clone
+
+    def upsert(self, vectors: List[tuple]) -> np.ndarray:
+        previous = len(self.ids)
+        rows = super().upsert(vectors)
+        if self._needs_training():
+            self.train()
+        elif self.trained:
+            self._assign_rows(rows, previous)
+        return rows
+
+    def built(self) -> None:
+        if self._needs_training():
+            self.train()
+
+    def delete(self, ids: List[str]) -> np.ndarray:
+        keep = super().delete(ids)
+        if self.trained and not keep.all():
+            self.set_assignments(self.assignment_buffer[: len(keep)][keep])
+            self._build_lists()
+        return keep
+
+    def bucket(self, centroid: int) -> np.ndarray:
+        """Rows in the bucket of a centroid"""
+        return self.lists[centroid][: self.list_sizes[centroid]]
+
+    def search_rows(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        if filter is not None:
+            # Filters usually leave few candidates, so scan them exactly
+            return super().search_rows(query_vector, top_k, filter)
+        return self.search_rows_with(query_vector, top_k, self.nprobe)
+
+    def search_rows_with(
+        self, query_vector: List[float], top_k: int, nprobe: int
+    ) -> np.ndarray:
+        if not self.trained or nprobe >= self.centroids.shape[0]:
+            return super().search_rows(query_vector, top_k)
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        query = _normalize_query(query_vector)
+        probes = _top_k(self.centroids @ query, nprobe)
+        candidates = np.concatenate([self.bucket(c) for c in probes])
+        if candidates.size == 0:
+            return candidates
+        return candidates[_top_k(self.vectors[candidates] @ query, top_k)]
+
+    def train(self, iterations: int = 10, seed: int = 0) -> None:
+        """Cluster the vectors with spherical k-means and rebuild the buckets"""
+        count = len(self.ids)
+        nlist = max(1, int(4 * np.sqrt(count)))
+        rng = np.random.default_rng(seed)
+        # A few hundred points per centroid are enough to place it
+        sample_size = min(count, nlist * 256)
+        sample = self.vectors[np.sort(rng.choice(count, sample_size, replace=False))]
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            # Re-seed empty clusters from random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids
+        self.set_assignments(self._assign(self.vectors))
+        self.trained_size = count
+        self._build_lists()
+        logging.info(f"Trained IVF index with {nlist} lists over {count} vectors")
+
+    def _needs_training(self) -> bool:
+        count = len(self.ids)
+        if not self.trained:
+            return count >= self.min_train_size
+        # Retrain once the index has grown enough for the lists to get long
+        return count >= 4 * self.trained_size
+
+    def _assign(self, vectors: np.ndarray, batch_size: int = 8192) -> np.ndarray:
+        return np.concatenate(
+            [
+                np.argmax(vectors[start : start + batch_size] @ self.centroids.T, 1)
+                for start in range(0, vectors.shape[0], batch_size)
+            ]
+            or [np.empty(0, dtype=np.int64)]
+        ).astype(np.int32)
+
+    def _assign_rows(self, rows: np.ndarray, previous: int) -> None:
+        """Put upserted rows in the buckets of their nearest centroids"""
+        labels = self._assign(self.vectors[rows])
+        replaced = rows < previous
+        old = self.assignment_buffer[rows[replaced]]
+        # Replaced rows whose vector moved to another bucket leave the old one
+        moved = labels[replaced] != old
+        for centroid in np.unique(old[moved]):
+            gone = rows[replaced][moved][old[moved] == centroid]
+            kept = self.bucket(centroid)
+            kept = kept[~np.isin(kept, gone)]
+            self.lists[centroid] = kept
+            self.list_sizes[centroid] = len(kept)
+
+        if self.assignment_buffer.shape[0] < len(self.ids):
+            grown = np.empty(2 * len(self.ids), np.int32)
+            grown[:previous] = self.assignments
+            self.assignment_buffer = grown
+        self.assignment_buffer[rows] = labels
+        self.assignments = self.assignment_buffer[: len(self.ids)]
+
+        joined = np.concatenate([rows[replaced][moved], rows[~replaced]])
+        labels = np.concatenate([labels[replaced][moved], labels[~replaced]])
+        order = np.argsort(labels, kind="stable")
+        centroids, starts = np.unique(labels[order], return_index=True)
+        for centroid, group in zip(centroids, np.split(joined[order], starts[1:])):
+            self._append(centroid, group)
+
+    def _append(self, centroid: int, rows: np.ndarray) -> None:
+        """Add rows to a bucket, doubling its array when it is full"""
+        bucket, size = self.lists[centroid], self.list_sizes[centroid]
+        if size + len(rows) > len(bucket):
+            grown = np.empty(max(2 * len(bucket), size + len(rows), 16), np.int64)
+            grown[:size] = bucket[:size]
+            self.lists[centroid] = bucket = grown
+        bucket[size : size + len(rows)] = rows
+        self.list_sizes[centroid] = size + len(rows)
+
+    def _build_lists(self) -> None:
+        if not self.trained:
+            self.lists, self.list_sizes = [], np.empty(0, dtype=np.int64)
+            return
+        order = np.argsort(self.assignments, kind="stable")
+        counts = np.bincount(self.assignments, minlength=self.centroids.shape[0])
+        self.lists = np.split(order, np.cumsum(counts)[:-1])
+        self.list_sizes = counts.astype(np.int64)
+
+
+class IVFStore(NumpyStore):
+    """Approximate nearest-neighbour vector store using an IVF index
+
+    Small indexes are searched exactly. Once an index holds ``min_train_size``
+    vectors it is clustered into roughly ``4 * sqrt(n)`` lists and queries
+    only scan the ``nprobe`` closest lists. Raising ``nprobe`` trades latency
+    for recall; :meth:`tune` picks the smallest value meeting a recall target.
+    """
+
+    CENTROIDS_FILE = "centroids.npy"
+    ASSIGNMENTS_FILE = "assignments.npy"
+    PARAMS_FILE = "ivf.json"
+
+    def __init__(
+        self,
+        root_dir: str = "vector_indexes",
+        nprobe: int = 8,
+        min_train_size: int = 4096,
+    ):
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        # Centroids last written per index, rewritten only after training
+        self._saved_centroids: Dict[str, np.ndarray] = {}
+        super().__init__(root_dir)
+
+    def set_nprobe(
+        self, index_name: str, nprobe: int, namespace: Optional[str] = None
+    ) -> None:
+        key = self._key(index_name, namespace)
+        with self._lock:
+            index = self._get_index(key).copy()
+            index.nprobe = nprobe
+            self._save(key, index, np.empty(0, dtype=np.int64))
+            self._indexes[key] = index
+
+    def measure_recall(
+        self,
+        index_name: str,
+        top_k: int = 10,
+        samples: int = 100,
+        nprobe: Optional[int] = None,
+        seed: int = 0,
+        namespace: Optional[str] = None,
+    ) -> float:
+        """Recall@top_k of the IVF search against exact search
+
+        Stored vectors of the namespace are used as sample queries. Writes
+        wait until the measurement is done, so it sees a single index.
+        """
+        with self._lock:
+            index = self._get_index(self._key(index_name, namespace))
+            if not index.ids:
+                return 1.0
+            nprobe = nprobe or index.nprobe
+            rng = np.random.default_rng(seed)
+            queries = rng.choice(len(index.ids), min(samples, len(index.ids)), False)
+
+            found = 0
+            for row in queries:
+                query = index.vectors[row]
+                exact = set(_Index.search_rows(index, query, top_k).tolist())
+                approx = set(index.search_rows_with(query, top_k, nprobe).tolist())
+                found += len(exact & approx)
+            return found / (len(queries) * min(top_k, len(index.ids)))
+
+    def tune(
+        self,
+        index_name: str,
+        target_recall: float = 0.95,
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+    ) -> int:
+        """Pick the smallest nprobe whose measured recall meets the target
+
+        Each namespace of a shared index is tuned on its own vectors, with
+        writes to the store held off until the new nprobe is saved.
+        """
+        with self._lock:
+            index = self._get_index(self._key(index_name, namespace))
+            if not index.trained:
+                return index.nprobe
+
+            nlist = index.centroids.shape[0]
+            nprobe = 1
+            while nprobe < nlist:
+                recall = self.measure_recall(
+                    index_name, top_k, nprobe=nprobe, namespace=namespace
+                )
+                if recall >= target_recall:
+                    break
+                nprobe *= 2
+            nprobe = min(nprobe, nlist)
+            logging.info(
+                f"Tuned IVF index {self._key(index_name, namespace)}: "
+                f"nprobe={nprobe} for recall@{top_k} >= {target_recall}"
+            )
+            self.set_nprobe(index_name, nprobe, namespace=namespace)
+            return nprobe
+
+    def _new_index(
+        self, vectors: np.ndarray, ids: List[str], metadata: List[Dict[str, Any]]
+    ) -> _IVFIndex:
+        return _IVFIndex(
+            vectors,
+            ids,
+            metadata,
+            nprobe=self.nprobe,
+            min_train_size=self.min_train_size,
+        )
+
+    def _load(self, index_name: str) -> _IVFIndex:
+        index = super()._load(index_name)
+        path = self._index_path(index_name)
+        if (path / self.PARAMS_FILE).exists():
+            with open(path / self.PARAMS_FILE, encoding="utf-8") as f:
+                params = json.load(f)
+            index.nprobe = params["nprobe"]
+            index.trained_size = params["trained_size"]
+        if (path / self.CENTROIDS_FILE).exists():
+            index.centroids = np.load(path / self.CENTROIDS_FILE)
+            self._saved_centroids[index_name] = index.centroids
+            assignments = np.load(path / self.ASSIGNMENTS_FILE, mmap_mode="r+")
+            count = len(index.ids)
+            if len(assignments) < count or (
+                count and assignments[:count].max() >= len(index.centroids)
+            ):
+                logging.warning(f"Reassigning IVF index {index_name} after a crash")
+                assignments = index._assign(index.vectors)
+            index.set_assignments(assignments)
+            index._build_lists()
+        return index
+
+    def _reserve(
+        self, index_name: str, index: _IVFIndex, rows: int, dimension: int
+    ) -> None:
+        super()._reserve(index_name, index, rows, dimension)
+        if index.trained and index.assignment_buffer.shape[0] < rows:
+            index.set_assignments(
+                self._grow(
+                    index_name, self.ASSIGNMENTS_FILE, index.assignments, rows, ()
+                )
+            )
+
+    def _save(
+        self, index_name: str, index: _IVFIndex, rows: Optional[np.ndarray] = None
+    ) -> None:
+        # The base class commits the index, so everything it refers to
+        # must be on disk first
+        path = self._index_path(index_name)
+        path.mkdir(parents=True, exist_ok=True)
+        if index.trained:
+            if self._saved_centroids.get(index_name) is not index.centroids:
+                tmp = path / (self.CENTROIDS_FILE + ".tmp")
+                with open(tmp, "wb") as f:
+                    np.save(f, index.centroids)
+                os.replace(tmp, path / self.CENTROIDS_FILE)
+                self._saved_centroids[index_name] = index.centroids
+            index.set_assignments(
+                self._persist(
+                    path,
+                    self.ASSIGNMENTS_FILE,
+                    index.assignment_buffer,
+                    len(index.ids),
+                )
+            )
+        tmp = path / (self.PARAMS_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"nprobe": index.nprobe, "trained_size": index.trained_size}, f)
+        os.replace(tmp, path / self.PARAMS_FILE)
+        super()._save(index_name, index, rows)
+
+    def _forget(self, index_name: str) -> None:
+        super()._forget(index_name)
+        self._saved_centroids.pop(index_name, None)
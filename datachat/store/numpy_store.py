@@ -0,0 +1,592 @@
+import copy
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from datachat.core import metrics
+from datachat.core.exceptions import VectorStoreError
+
+from .filters import compile_filter
+from .vector_store import Match, VectorBatch, VectorStore
+
+
+class _Index:
+    """Contiguous float32 matrix of unit vectors with parallel id/metadata arrays
+
+    Stores never grow or shrink an index that searches can see: writers
+    work on a copy and swap it in, so searches run without holding a lock.
+    The matrix is the first ``len(ids)`` rows of a larger buffer, and new
+    vectors are written to its spare rows, which no search looks at, so
+    upserts don't copy the vectors already stored. Vectors replaced by an
+    upsert are overwritten in place, so a search running at that moment
+    may score such a row with either its old or its new vector.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+    ):
+        """Initialize the index
+
+        Args:
+            vectors: Buffer whose first len(ids) rows are the vectors
+            ids: Document id of each row
+            metadata: Metadata of each row
+        """
+        self.ids = ids
+        self.metadata = metadata
+        self.positions = {doc_id: row for row, doc_id in enumerate(ids)}
+        self.set_buffer(vectors)
+
+    def set_buffer(self, buffer: np.ndarray) -> None:
+        """Use a buffer holding the current vectors in its first rows"""
+        self.buffer = buffer
+        self.vectors = buffer[: len(self.ids)]
+
+    def copy(self) -> "_Index":
+        clone = copy.copy(self)
+        clone.ids = list(self.ids)
+        clone.metadata = list(self.metadata)
+        clone.positions = dict(self.positions)
+        return clone
+
+    @property
+    def dimension(self) -> Optional[int]:
+        return self.vectors.shape[1] if len(self.ids) else None
+
+    def upsert(self, vectors: List[tuple]) -> np.ndarray:
+        """Insert or replace vectors, returning the rows that were written"""
+        ids = [doc_id for doc_id, _, _ in vectors]
+        matrix = _normalize(np.asarray([v for _, v, _ in vectors], dtype=np.float32))
+        if self.dimension is not None and matrix.shape[1] != self.dimension:
+            raise VectorStoreError(
+                f"Vector dimension {matrix.shape[1]} does not match index "
+                f"dimension {self.dimension}"
+            )
+
+        # Later duplicates win, matching Pinecone's upsert semantics
+        latest = {doc_id: i for i, doc_id in enumerate(ids)}
+        updated = [
+            (self.positions[d], i) for d, i in latest.items() if d in self.positions
+        ]
+        added = [i for d, i in latest.items() if d not in self.positions]
+
+        count = len(self.ids)
+        self.reserve(count + len(added), matrix.shape[1])
+        if updated:
+            rows, sources = zip(*updated)
+            self.buffer[list(rows)] = matrix[list(sources)]
+        if added:
+            self.buffer[count : count + len(added)] = matrix[added]
+
+        for row, source in updated:
+            self.metadata[row] = vectors[source][2]
+        for source in added:
+            self.positions[ids[source]] = len(self.ids)
+            self.ids.append(ids[source])
+            self.metadata.append(vectors[source][2])
+        self.vectors = self.buffer[: len(self.ids)]
+        return np.array(
+            [row for row, _ in updated] + list(range(count, len(self.ids))),
+            dtype=np.int64,
+        )
+
+    def delete(self, ids: List[str]) -> np.ndarray:
+        """Remove vectors by id, returning a mask of the rows that were kept"""
+        keep = np.ones(len(self.ids), dtype=bool)
+        for doc_id in ids:
+            row = self.positions.get(doc_id)
+            if row is not None:
+                keep[row] = False
+        if keep.all():
+            return keep
+
+        vectors = np.ascontiguousarray(self.vectors[keep])
+        self.ids = [doc_id for doc_id, k in zip(self.ids, keep) if k]
+        self.metadata = [meta for meta, k in zip(self.metadata, keep) if k]
+        self.positions = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.set_buffer(vectors)
+        return keep
+
+    def built(self) -> None:
+        """Called once an index was built from a whole matrix at once"""
+
+    def reserve(self, rows: int, dimension: int) -> None:
+        """Make room for rows vectors, doubling the buffer when it is full"""
+        if self.buffer.shape[0] >= rows and self.buffer.shape[1] == dimension:
+            return
+        buffer = np.empty((max(rows, 2 * self.buffer.shape[0]), dimension), np.float32)
+        if self.ids:
+            buffer[: len(self.ids)] = self.vectors
+        self.set_buffer(buffer)
+
+    def query(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Match]:
+        rows = self.search_rows(query_vector, top_k, filter)
+        if rows.size == 0:
+            return []
+        scores = self.vectors[rows] @ _normalize_query(query_vector)
+        return [
+            Match(self.ids[row], float(score), self.metadata[row])
+            for row, score in zip(rows, scores)
+        ]
+
+    def search_rows(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        """Exact cosine search returning matching row numbers, best first"""
+        if not self.ids or top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+        query = _normalize_query(query_vector)
+        if filter is None:
+            return _top_k(self.vectors @ query, top_k)
+
+        # Only score the rows whose metadata passes the filter
+        rows = self.filter_rows(filter)
+        if rows.size == 0:
+            return rows
+        return rows[_top_k(self.vectors[rows] @ query, top_k)]
+
+    def filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Row numbers whose metadata matches a Pinecone-style filter"""
+        predicate = compile_filter(filter)
+        return np.fromiter(
+            (row for row, meta in enumerate(self.metadata) if predicate(meta)),
+            dtype=np.int64,
+        )
+
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of the top_k highest scores, best first"""
+    k = min(top_k, scores.shape[0])
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _normalize_query(query_vector: List[float]) -> np.ndarray:
+    return _normalize(np.asarray(query_vector, dtype=np.float32)[None, :])[0]
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyStore(VectorStore):
+    """In-process vector store doing exact cosine search with NumPy
+
+    Each index is kept as one contiguous float32 matrix of normalized vectors
+    and persisted under ``root_dir/<index_name>``, with every namespace
+    stored as an index of its own under ``namespaces/<namespace>`` there.
+    Reopening an index memory maps the matrix instead of reading it into
+    memory.
+
+    The vectors file is preallocated with spare rows, doubling when full,
+    and upserts write their vectors straight into it. Ids and metadata go
+    to an append-only log with one line per written row. A small state
+    file, replaced atomically after everything else is on disk, records
+    how many rows and how much of the log are valid, so new rows and log
+    lines a crash leaves past those are ignored. Vectors of ids that are
+    upserted again are overwritten in place, so a crash before the state
+    is committed may leave such ids with their new vector but their
+    previous metadata. Saving an upsert costs time proportional to its
+    own vectors, not to the size of the index.
+    """
+
+    VECTORS_FILE = "vectors.npy"
+    RECORDS_FILE = "records.jsonl"
+    STATE_FILE = "index.json"
+    NAMESPACES_DIR = "namespaces"
+    # Rows a new vectors file has room for
+    MIN_CAPACITY = 1024
+
+    def __init__(self, root_dir: str = "vector_indexes"):
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self._indexes: Dict[str, _Index] = {}
+        # (bytes, lines) of each index's records log that are committed
+        self._records: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.RLock()
+
+    @metrics.timed("vector_upsert")
+    def upsert(
+        self, index_name: str, vectors: List[tuple], namespace: Optional[str] = None
+    ) -> None:
+        """Upsert (id, vector, metadata) tuples into the index"""
+        if not vectors:
+            return
+        index_name = self._key(index_name, namespace)
+        try:
+            with self._lock:
+                index = self._get_index(index_name).copy()
+                self._reserve(
+                    index_name, index, len(index.ids) + len(vectors), len(vectors[0][1])
+                )
+                rows = index.upsert(vectors)
+                self._save(index_name, index, rows)
+                self._indexes[index_name] = index
+        except VectorStoreError:
+            raise
+        except Exception as e:
+            raise VectorStoreError(f"Failed to upsert vectors: {str(e)}")
+
+    @metrics.timed("vector_search")
+    def query(
+        self,
+        index_name: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Match]:
+        """Return the top_k most similar vectors matching the filter"""
+        try:
+            with self._lock:
+                index = self._get_index(self._key(index_name, namespace))
+            return index.query(query_vector, top_k, filter)
+        except VectorStoreError:
+            raise
+        except Exception as e:
+            raise VectorStoreError(f"Failed to search vectors: {str(e)}")
+
+    def fetch(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> List[tuple]:
+        """Stored (normalized) vectors and metadata of the given ids"""
+        try:
+            with self._lock:
+                index = self._get_index(self._key(index_name, namespace))
+            found = [
+                (doc_id, index.positions[doc_id])
+                for doc_id in ids
+                if doc_id in index.positions
+            ]
+            if not found:
+                return []
+            # One gather keeps reads from a memory map in a single pass
+            rows = np.array([row for _, row in found], dtype=np.int64)
+            vectors = np.asarray(index.vectors[rows], dtype=np.float32)
+            return [
+                (doc_id, vector.tolist(), index.metadata[row])
+                for (doc_id, row), vector in zip(found, vectors)
+            ]
+        except Exception as e:
+            raise VectorStoreError(f"Failed to fetch vectors: {str(e)}")
+
+    def count(self, index_name: str, namespace: Optional[str] = None) -> int:
+        """Number of vectors in the index; writes are visible immediately"""
+        with self._lock:
+            return len(self._get_index(self._key(index_name, namespace)).ids)
+
+    def delete_vectors(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> None:
+        """Delete individual vectors by document id"""
+        if not ids:
+            return
+        index_name = self._key(index_name, namespace)
+        try:
+            with self._lock:
+                index = self._get_index(index_name).copy()
+                if index.delete(ids).all():
+                    return  # None of the ids are stored
+                self._save(index_name, index)
+                self._indexes[index_name] = index
+        except Exception as e:
+            raise VectorStoreError(f"Failed to delete vectors: {str(e)}")
+
+    def bulk_load(
+        self,
+        index_name: str,
+        batches: Iterable[VectorBatch],
+        namespace: Optional[str] = None,
+    ) -> None:
+        """Replace an index or namespace with vectors loaded batch by batch
+
+        The new index is built next to the current one, its vectors file
+        doubling as it fills, and swapped in once it is complete. Only
+        ids and metadata are kept in memory, as for any open index.
+
+        Raises:
+            VectorStoreError: If ids repeat, or building the index fails
+        """
+        key = self._key(index_name, namespace)
+        staging = key + ".loading"
+        try:
+            with self._lock:
+                path, staged = self._index_path(key), self._index_path(staging)
+                shutil.rmtree(staged, ignore_errors=True)
+                staged.mkdir(parents=True)
+                vectors = np.empty((0, 0), np.float32)
+                ids: List[str] = []
+                metadata: List[Dict[str, Any]] = []
+                seen = set()
+                for batch_ids, matrix, batch_metadata in batches:
+                    matrix = _normalize(np.asarray(matrix, np.float32))
+                    seen.update(batch_ids)
+                    if len(seen) != len(ids) + len(batch_ids):
+                        raise VectorStoreError("Bulk loaded ids must be unique")
+                    if ids and matrix.shape[1] != vectors.shape[1]:
+                        raise VectorStoreError(
+                            f"Vector dimension {matrix.shape[1]} does not match "
+                            f"index dimension {vectors.shape[1]}"
+                        )
+                    rows = len(ids) + len(batch_ids)
+                    if rows > len(vectors):
+                        vectors = self._persist(
+                            staged,
+                            self.VECTORS_FILE,
+                            self._grow(
+                                staging,
+                                self.VECTORS_FILE,
+                                vectors[: len(ids)],
+                                rows,
+                                matrix.shape[1:],
+                            ),
+                            len(ids),
+                        )
+                    vectors[len(ids) : rows] = matrix
+                    ids.extend(batch_ids)
+                    metadata.extend(batch_metadata)
+                index = self._new_index(vectors, ids, metadata)
+                index.built()
+                self._save(staging, index)
+
+                # Namespaces are stored inside their index's directory
+                if namespace is None and (path / self.NAMESPACES_DIR).exists():
+                    os.replace(path / self.NAMESPACES_DIR, staged / self.NAMESPACES_DIR)
+                replaced = self._index_path(key + ".replaced")
+                shutil.rmtree(replaced, ignore_errors=True)
+                if path.exists():
+                    os.replace(path, replaced)
+                os.replace(staged, path)
+                shutil.rmtree(replaced, ignore_errors=True)
+                # Reopened from its new place on next use
+                self._forget(staging)
+                self._forget(key)
+        except Exception as e:
+            self._forget(staging)
+            shutil.rmtree(self._index_path(staging), ignore_errors=True)
+            if isinstance(e, VectorStoreError):
+                raise
+            raise VectorStoreError(f"Failed to load vectors: {str(e)}")
+
+    def delete(self, index_name: str, namespace: Optional[str] = None):
+        try:
+            with self._lock:
+                key = self._key(index_name, namespace)
+                # Deleting an index deletes its namespaces too
+                for name in list(self._indexes):
+                    if name == key or name.startswith(key + "/"):
+                        self._forget(name)
+                path = self._index_path(key)
+                if path.exists():
+                    shutil.rmtree(path)
+                    logging.info(f"Local index {key} deleted")
+        except Exception as e:
+            raise VectorStoreError(
+                f"Failed to delete local index '{index_name}': {str(e)}"
+            )
+
+    def _forget(self, index_name: str) -> None:
+        """Drop what is kept in memory about an index"""
+        self._indexes.pop(index_name, None)
+        self._records.pop(index_name, None)
+
+    def _key(self, index_name: str, namespace: Optional[str]) -> str:
+        """Name of the index holding a namespace, relative to root_dir"""
+        if namespace is None:
+            return index_name
+        return f"{index_name}/{self.NAMESPACES_DIR}/{namespace}"
+
+    def _get_index(self, index_name: str) -> _Index:
+        index = self._indexes.get(index_name)
+        if index is None:
+            index = self._load(index_name)
+            self._indexes[index_name] = index
+        return index
+
+    def _index_path(self, index_name: str) -> Path:
+        return self.root_dir / index_name
+
+    def _load(self, index_name: str) -> _Index:
+        stored = self._read(index_name)
+        if stored is None:
+            return self._new_index(np.empty((0, 0), np.float32), [], [])
+        return self._new_index(*stored)
+
+    def _read(
+        self, index_name: str
+    ) -> Optional[Tuple[np.ndarray, List[str], List[Dict[str, Any]]]]:
+        """Vectors buffer, ids and metadata of a persisted index, if any"""
+        path = self._index_path(index_name)
+        if not (path / self.STATE_FILE).exists():
+            return None
+        with open(path / self.STATE_FILE, encoding="utf-8") as f:
+            state = json.load(f)
+        count = state["count"]
+        ids: List[str] = [""] * count
+        metadata: List[Dict[str, Any]] = [{}] * count
+        # Later lines for a row replace earlier ones; bytes past the
+        # committed size were left by an interrupted write
+        remaining = state["records_size"]
+        with open(path / self.RECORDS_FILE, "rb") as f:
+            for line in f:
+                remaining -= len(line)
+                if remaining < 0:
+                    break
+                row, ids[row], metadata[row] = json.loads(line)
+        self._records[index_name] = (
+            state["records_size"],
+            state["records_lines"],
+        )
+        vectors = np.load(path / self.VECTORS_FILE, mmap_mode="r+")
+        return vectors, ids, metadata
+
+    def _new_index(
+        self, vectors: np.ndarray, ids: List[str], metadata: List[Dict[str, Any]]
+    ) -> _Index:
+        return _Index(vectors, ids, metadata)
+
+    def _reserve(
+        self, index_name: str, index: _Index, rows: int, dimension: int
+    ) -> None:
+        """Grow the index's vectors file so that rows vectors fit in it
+
+        The grown file is written next to the current one and only
+        replaces it when the index is saved.
+        """
+        if index.ids and index.buffer.shape[1] != dimension:
+            return  # Upserting will report the mismatch
+        if index.buffer.shape[0] >= rows and index.buffer.shape[1] == dimension:
+            return
+        index.set_buffer(
+            self._grow(index_name, self.VECTORS_FILE, index.vectors, rows, (dimension,))
+        )
+
+    def _grow(
+        self,
+        index_name: str,
+        file_name: str,
+        current: np.ndarray,
+        rows: int,
+        shape: Tuple[int, ...],
+    ) -> np.memmap:
+        """Memory mapped buffer with room for rows, starting with current
+
+        The buffer is at least twice as long as current, is written next
+        to file_name and only replaces it when the index is saved.
+        """
+        path = self._index_path(index_name)
+        path.mkdir(parents=True, exist_ok=True)
+        buffer = np.lib.format.open_memmap(
+            path / (file_name + ".tmp"),
+            mode="w+",
+            dtype=current.dtype,
+            shape=(max(rows, 2 * len(current), self.MIN_CAPACITY),) + shape,
+        )
+        if len(current):
+            buffer[: len(current)] = current
+        return buffer
+
+    def _save(
+        self, index_name: str, index: _Index, rows: Optional[np.ndarray] = None
+    ) -> None:
+        """Persist an index
+
+        Args:
+            rows: Rows written since the index was last saved; None writes
+                every row, e.g. after a delete moved rows around
+        """
+        path = self._index_path(index_name)
+        path.mkdir(parents=True, exist_ok=True)
+        index.set_buffer(
+            self._persist(path, self.VECTORS_FILE, index.buffer, len(index.ids))
+        )
+
+        size, lines = self._records.get(index_name, (0, 0))
+        # Rewrite the log once replaced rows make up most of it
+        if (
+            rows is None
+            or index_name not in self._records
+            or lines + len(rows) > 2 * len(index.ids) + self.MIN_CAPACITY
+        ):
+            size, lines = self._write_records(path, index)
+        elif len(rows):
+            size = self._append_records(path, index, rows, size)
+            lines += len(rows)
+
+        # Committing the state makes the new rows and records visible
+        state = {"count": len(index.ids), "records_size": size, "records_lines": lines}
+        tmp_state = path / (self.STATE_FILE + ".tmp")
+        with open(tmp_state, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_state, path / self.STATE_FILE)
+        self._records[index_name] = (size, lines)
+
+    def _persist(
+        self, path: Path, file_name: str, buffer: np.ndarray, count: int
+    ) -> np.ndarray:
+        """Make the first count rows of a buffer the file's, memory mapped
+
+        Buffers mapping the file itself are only flushed, grown ones
+        replace it, and in-memory ones are written out first.
+        """
+        target = path / file_name
+        if isinstance(buffer, np.memmap):
+            buffer.flush()
+            if Path(buffer.filename) == target.absolute():
+                return buffer  # Rows were written into the file in place
+            tmp = Path(buffer.filename)
+        else:
+            # Write to a temporary file first so a crash never leaves a torn index
+            tmp = path / (file_name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, buffer[:count])
+        os.replace(tmp, target)
+        return np.load(target, mmap_mode="r+")
+
+    def _write_records(self, path: Path, index: _Index) -> Tuple[int, int]:
+        """Write a log holding only the current records, returning its size"""
+        tmp = path / (self.RECORDS_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            for row, record in enumerate(zip(index.ids, index.metadata)):
+                f.write(self._record_line(row, *record))
+            size = f.tell()
+        os.replace(tmp, path / self.RECORDS_FILE)
+        return size, len(index.ids)
+
+    def _append_records(
+        self, path: Path, index: _Index, rows: np.ndarray, size: int
+    ) -> int:
+        """Append the records of rows to the log, returning its new size"""
+        with open(path / self.RECORDS_FILE, "r+b") as f:
+            # Drop whatever an interrupted write left after the last commit
+            f.truncate(size)
+            f.seek(size)
+            for row in rows.tolist():
+                f.write(self._record_line(row, index.ids[row], index.metadata[row]))
+            return f.tell()
+
+    @staticmethod
+    def _record_line(row: int, doc_id: str, metadata: Dict[str, Any]) -> bytes:
+        return (json.dumps([row, doc_id, metadata]) + "\n").encode("utf-8")
@@ -1,68 +1,320 @@
+import json
 import logging
+import random
+import threading
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, List, Dict, Any, Optional
 from fastapi.background import P
 from pinecone import Pinecone, ServerlessSpec
 
+from datachat.core import metrics
 from datachat.core.config import Config, PineconeConfig
-from datachat.core.exceptions import VectorStoreError
+from datachat.core.exceptions import UpsertError, VectorStoreError
 from datachat.core.models import EmbeddingModel, OpenAIEmbedding
 
-from .vector_store import VectorStore
+from .vector_store import Match, VectorStore
 
 
 class PineconeStore(VectorStore):
     """Pinecone vector store implementation"""
 
-    def __init__(self, config: PineconeConfig):
+    # Pinecone rejects requests over 2MB or 1000 vectors
+    MAX_REQUEST_BYTES = 2 * 1024 * 1024
+    MAX_REQUEST_VECTORS = 1000
+
+    def __init__(
+        self,
+        config: PineconeConfig,
+        chunk_size: int = 200,
+        chunk_bytes: int = 1536 * 1024,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        retry_delay: float = 0.5,
+    ):
+        """Initialize the Pinecone store
+
+        Args:
+            config: Pinecone configuration
+            chunk_size: Maximum number of vectors per upsert request
+            chunk_bytes: Approximate maximum payload size per upsert request
+            max_workers: Number of upsert requests sent at the same time
+            max_retries: Retries per chunk after the first attempt fails
+            retry_delay: Base delay for jittered exponential backoff
+        """
         self.pc = Pinecone(api_key=config.api_key)
         self.config = config
+        self.chunk_size = min(chunk_size, self.MAX_REQUEST_VECTORS)
+        self.chunk_bytes = min(chunk_bytes, self.MAX_REQUEST_BYTES)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+        # Index handles keep their own HTTP connection pools, so reuse them
+        self._handles: Dict[str, Any] = {}
+        self._index_names: Optional[set] = None
+        self._creating: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get_index(self, index_name, dimension: int = 1536):
+        """Return a handle to the index, creating the index if needed
 
-    def get_index(self, index_name):
-        indexes = self.pc.list_indexes()
-        if index_name not in indexes.names():
-            logging.info(f"Creating index: {index_name}")
+        Args:
+            dimension: Vector length of a new index, defaults to OpenAI's
+        """
+        if not self._index_exists(index_name):
+            # Upsert workers of a new dataset all get here at once; only
+            # the first may create the index
+            with self._creation_lock(index_name):
+                if not self._index_exists(index_name):
+                    self._create_index(index_name, dimension)
+        return self._handle(index_name)
+
+    def _creation_lock(self, index_name: str) -> threading.Lock:
+        with self._lock:
+            return self._creating.setdefault(index_name, threading.Lock())
+
+    def _create_index(self, index_name: str, dimension: int) -> None:
+        logging.info(f"Creating index: {index_name}")
+        try:
             self.pc.create_index(
                 name=index_name,
-                dimension=1536,  # OpenAI embedding dimension
+                dimension=dimension,
                 metric="cosine",
                 spec=ServerlessSpec(cloud="aws", region=self.config.region),
             )
-        return self.pc.Index(index_name)
+        except Exception as e:
+            # Another process created it first, which is just as good
+            if getattr(e, "status", None) != 409 and "ALREADY_EXISTS" not in str(e):
+                raise
+            logging.info(f"Index {index_name} already exists")
+        with self._lock:
+            if self._index_names is not None:
+                self._index_names.add(index_name)
 
-    def upsert(self, index_name: str, vectors: List[tuple]) -> None:
-        """Upsert vectors to Pinecone"""
+    def _handle(self, index_name: str):
+        """Cached data-plane handle; avoids a host lookup and new connections"""
+        handle = self._handles.get(index_name)
+        if handle is None:
+            with self._lock:
+                handle = self._handles.get(index_name)
+                if handle is None:
+                    handle = self._handles[index_name] = self.pc.Index(index_name)
+        return handle
+
+    def _index_exists(self, index_name: str) -> bool:
+        """Check index existence, listing indexes only on first use"""
+        with self._lock:
+            if self._index_names is None:
+                self._index_names = set(self.pc.list_indexes().names())
+            return index_name in self._index_names
+
+    def invalidate(self, index_name: Optional[str] = None) -> None:
+        """Forget cached handles and index names, e.g. after external changes"""
+        with self._lock:
+            if index_name is None:
+                self._handles.clear()
+                self._index_names = None
+            else:
+                self._handles.pop(index_name, None)
+                if self._index_names is not None:
+                    self._index_names.discard(index_name)
+
+    @metrics.timed("vector_upsert")
+    def upsert(
+        self,
+        index_name: str,
+        vectors: List[tuple],
+        namespace: Optional[str] = None,
+        on_progress: Optional[Callable[[int, int, int], None]] = None,
+    ) -> None:
+        """Upsert vectors to Pinecone in parallel, size-limited chunks
+
+        Args:
+            index_name: Index to upsert into
+            vectors: (id, vector, metadata) tuples
+            namespace: Optional namespace of the index to upsert into
+            on_progress: Called after each successful chunk with
+                (chunks done, total chunks, vectors upserted so far)
+
+        Raises:
+            UpsertError: If chunks still fail after retries; holds the
+                failed chunks so they can be upserted again
+        """
+        if not vectors:
+            return
         try:
-            index = self.get_index(index_name)
-            index.upsert(vectors=vectors)
+            index = self.get_index(index_name, len(vectors[0][1]))
         except Exception as e:
             raise VectorStoreError(f"Failed to upsert vectors: {str(e)}")
 
-    def search(
-        self, index_name: str, query_vector: List[float], top_k: int
-    ) -> List[Dict[str, Any]]:
-        """Search for similar vectors in Pinecone"""
+        chunks = list(self._chunks(vectors))
+        failed = []
+        done = upserted = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._upsert_chunk, index, chunk, namespace): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(f"Chunk of {len(chunk)} vectors failed: {e}")
+                    failed.append(chunk)
+                    continue
+                done += 1
+                upserted += len(chunk)
+                logging.info(
+                    f"Upserted chunk {done}/{len(chunks)} to {index_name} "
+                    f"({upserted}/{len(vectors)} vectors)"
+                )
+                if on_progress:
+                    on_progress(done, len(chunks), upserted)
+
+        if failed:
+            raise UpsertError(
+                f"Failed to upsert {len(failed)}/{len(chunks)} chunks "
+                f"to {index_name}",
+                failed,
+            )
+
+    def _upsert_chunk(
+        self, index, chunk: List[tuple], namespace: Optional[str]
+    ) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                index.upsert(vectors=chunk, namespace=namespace)
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter keeps retrying workers from hitting Pinecone in sync
+                delay = random.uniform(0, self.retry_delay * 2**attempt)
+                logging.warning(f"Upsert failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _chunks(self, vectors: List[tuple]) -> Iterator[List[tuple]]:
+        """Split vectors so each request stays under the count and size limits"""
+        chunk: List[tuple] = []
+        chunk_bytes = 0
+        for vector in vectors:
+            size = self._estimate_bytes(vector)
+            if chunk and (
+                len(chunk) >= self.chunk_size or chunk_bytes + size > self.chunk_bytes
+            ):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+            chunk.append(vector)
+            chunk_bytes += size
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _estimate_bytes(vector: tuple) -> int:
+        doc_id, values, metadata = vector
+        # Values are sent as JSON numbers of roughly 20 characters each
+        return len(doc_id) + 20 * len(values) + len(json.dumps(metadata, default=str))
+
+    @metrics.timed("vector_search")
+    def query(
+        self,
+        index_name: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Match]:
+        """Search for similar vectors in Pinecone, filtering on the server"""
         try:
-            index = self.pc.Index(index_name)
+            index = self._handle(index_name)
             results = index.query(
-                vector=query_vector, top_k=top_k, include_metadata=True
+                vector=query_vector,
+                top_k=top_k,
+                namespace=namespace,
+                include_metadata=True,
+                **({"filter": filter} if filter else {}),
             )
-            return [match.metadata for match in results.matches]
+            return [
+                Match(match.id, match.score, match.metadata or {})
+                for match in results.matches
+            ]
         except Exception as e:
             raise VectorStoreError(f"Failed to search vectors: {str(e)}")
 
-    def delete(self, index_name: str):
+    def fetch(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> List[tuple]:
+        """Fetch stored vectors and metadata from Pinecone by id"""
+        try:
+            index = self._handle(index_name)
+            vectors = []
+            # Ids travel in the query string, so keep requests short
+            for start in range(0, len(ids), 100):
+                response = index.fetch(
+                    ids=ids[start : start + 100], namespace=namespace
+                )
+                vectors.extend(
+                    (vector.id, vector.values, vector.metadata or {})
+                    for vector in response.vectors.values()
+                )
+            return vectors
+        except Exception as e:
+            raise VectorStoreError(f"Failed to fetch vectors: {str(e)}")
+
+    def count(self, index_name: str, namespace: Optional[str] = None) -> int:
+        """Number of vectors Pinecone reports as indexed"""
+        try:
+            stats = self._handle(index_name).describe_index_stats()
+            if namespace is None:
+                return stats.total_vector_count
+            summary = stats.namespaces.get(namespace)
+            return summary.vector_count if summary else 0
+        except Exception as e:
+            raise VectorStoreError(f"Failed to describe index: {str(e)}")
+
+    def delete_vectors(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> None:
+        """Delete vectors from a Pinecone index by id"""
+        try:
+            index = self._handle(index_name)
+            # Pinecone accepts at most 1000 ids per delete request
+            for start in range(0, len(ids), 1000):
+                index.delete(ids=ids[start : start + 1000], namespace=namespace)
+        except Exception as e:
+            raise VectorStoreError(f"Failed to delete vectors: {str(e)}")
+
+    def delete(self, index_name: str, namespace: Optional[str] = None):
+        """Delete an index, or only one namespace of it
+
+        Deleting a namespace is a data-plane request that returns at once,
+        unlike deleting an index, and leaves the other namespaces in place.
+        """
         try:
             # Check if index exists
-            indexes = self.pc.list_indexes()
-            if index_name not in indexes.names():
+            if not self._index_exists(index_name):
                 return  # Index doesn't exist, nothing to delete
 
+            if namespace is not None:
+                self._delete_namespace(index_name, namespace)
+                return
+
             # Delete the index
             self.pc.delete_index(index_name)
+            self.invalidate(index_name)
             logging.info(f"Pinecone index {index_name} deleted")
 
         except Exception as e:
             raise VectorStoreError(
                 f"Failed to delete Pinecone index '{index_name}': {str(e)}"
             )
+
+    def _delete_namespace(self, index_name: str, namespace: str) -> None:
+        index = self._handle(index_name)
+        # Pinecone answers 404 for namespaces that hold no vectors
+        if namespace not in index.describe_index_stats().namespaces:
+            return
+        index.delete(delete_all=True, namespace=namespace)
+        logging.info(f"Pinecone namespace {namespace} of {index_name} deleted")
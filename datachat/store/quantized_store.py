@@ -0,0 +1,547 @@
+import copy
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .numpy_store import NumpyStore, _Index, _normalize_query, _top_k
+from .vector_store import Match
+
+# Rows decoded at a time while scoring, bounding the float32 scratch memory
+_SCORE_BATCH = 4096
+
+
+class Quantizer(ABC):
+    """Compresses unit vectors into codes that queries are scored against"""
+
+    # Whether train must see the index's vectors before encode works
+    learned = False
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    def train(self, vectors: np.ndarray, seed: int = 0) -> None:
+        """Fit the quantizer to a sample of vectors"""
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Compress a (n, dimension) float32 matrix into n codes"""
+
+    @abstractmethod
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate inner products of a full-precision query with codes"""
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays needed to decode codes, persisted next to them"""
+        return {}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        pass
+
+
+class Float16Quantizer(Quantizer):
+    """Half precision floats: 2x smaller, with nearly exact scores"""
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return _batched(codes, lambda batch: batch.astype(np.float32) @ query)
+
+
+class Int8Quantizer(Quantizer):
+    """Scalar int8 quantization with one float32 scale per vector
+
+    Each vector is divided by its largest absolute component over 127 and
+    rounded, so it spends the full int8 range whatever its distribution.
+    """
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty(len(vectors), dtype=self._dtype(vectors.shape[1]))
+        scale = np.abs(vectors).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        codes["scale"] = scale
+        codes["code"] = np.rint(vectors / scale[:, None])
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return _batched(
+            codes,
+            lambda batch: (batch["code"].astype(np.float32) @ query) * batch["scale"],
+        )
+
+    @staticmethod
+    def _dtype(dimension: int) -> np.dtype:
+        return np.dtype([("scale", np.float32), ("code", np.int8, (dimension,))])
+
+
+class ProductQuantizer(Quantizer):
+    """Product quantization: one byte per subvector of a vector
+
+    Vectors are split into subvectors of ``subvector_dim`` components, and
+    each subvector is replaced by the number of its nearest centroid among
+    256 learned by k-means for that position. Queries are never quantized:
+    a table of the query's inner product with every centroid is computed
+    once, and a code's score is the sum of its table entries.
+    """
+
+    learned = True
+
+    def __init__(self, subvector_dim: int = 4, centroids: int = 256):
+        """Initialize the quantizer
+
+        Args:
+            subvector_dim: Components per subvector; float32 vectors
+                shrink by 4 * subvector_dim
+            centroids: Centroids per subvector position, at most 256
+        """
+        self.subvector_dim = subvector_dim
+        self.centroids = min(centroids, 256)
+        # (subvectors, centroids, subvector_dim) centroid coordinates
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def train(self, vectors: np.ndarray, seed: int = 0, iterations: int = 10) -> None:
+        """Learn the codebooks with k-means on every subvector position"""
+        rng = np.random.default_rng(seed)
+        sample = self._split(vectors)
+        count, subvectors, _ = sample.shape
+        k = min(self.centroids, count)
+
+        codebooks = sample[rng.choice(count, k, replace=False)].transpose(1, 0, 2)
+        codebooks = np.ascontiguousarray(codebooks)
+        # Offsets of every subvector's centroids in a flattened codebook
+        offsets = np.arange(subvectors) * k
+        for _ in range(iterations):
+            flat = (self._assign(sample, codebooks) + offsets).ravel()
+            counts = np.bincount(flat, minlength=subvectors * k)
+            sums = np.stack(
+                [
+                    np.bincount(
+                        flat, weights=sample[:, :, d].ravel(), minlength=len(counts)
+                    )
+                    for d in range(self.subvector_dim)
+                ],
+                axis=1,
+            )
+            updated = sums / np.maximum(counts, 1)[:, None]
+            # Keep the previous position of centroids that attracted nothing
+            empty = counts == 0
+            updated[empty] = codebooks.reshape(-1, self.subvector_dim)[empty]
+            codebooks = updated.reshape(subvectors, k, -1).astype(np.float32)
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return self._assign(self._split(vectors), self.codebooks).astype(np.uint8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        table = np.einsum("skd,sd->sk", self.codebooks, self._split(query[None])[0])
+        offsets = np.arange(table.shape[0]) * table.shape[1]
+        table = table.ravel()
+        return _batched(
+            codes, lambda batch: table[batch.astype(np.int64) + offsets].sum(axis=1)
+        )
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebooks": self.codebooks} if self.trained else {}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        self.codebooks = state.get("codebooks")
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """Reshape to (n, subvectors, subvector_dim), zero padding the end"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        padding = -vectors.shape[1] % self.subvector_dim
+        if padding:
+            vectors = np.pad(vectors, ((0, 0), (0, padding)))
+        return vectors.reshape(len(vectors), -1, self.subvector_dim)
+
+    @staticmethod
+    def _assign(subvectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        """Nearest centroid of every subvector, as an (n, subvectors) matrix"""
+        count, positions, _ = subvectors.shape
+        norms = (codebooks**2).sum(axis=2)[:, None, :]
+        transposed = codebooks.transpose(0, 2, 1)
+        labels = np.empty((count, positions), dtype=np.int64)
+        # Bound the (positions, batch, centroids) distance scratch matrix
+        batch = max(1, 2**22 // (positions * codebooks.shape[1]))
+        for start in range(0, count, batch):
+            chunk = subvectors[start : start + batch].transpose(1, 0, 2)
+            # |x - c|^2 ranks like |c|^2 - 2 x.c as |x|^2 is fixed per subvector
+            distances = norms - 2 * np.matmul(chunk, transposed)
+            labels[start : start + batch] = distances.argmin(axis=2).T
+        return labels
+
+
+def _batched(codes: np.ndarray, score) -> np.ndarray:
+    return np.concatenate(
+        [
+            score(codes[start : start + _SCORE_BATCH]).astype(np.float32)
+            for start in range(0, len(codes), _SCORE_BATCH)
+        ]
+        or [np.empty(0, dtype=np.float32)]
+    )
+
+
+def _encode(quantizer: Quantizer, vectors: np.ndarray) -> np.ndarray:
+    """Encode a memory mapped matrix without reading all of it into memory"""
+    codes = None
+    for start in range(0, len(vectors), _SCORE_BATCH):
+        batch = quantizer.encode(vectors[start : start + _SCORE_BATCH])
+        if codes is None:
+            codes = np.empty((len(vectors),) + batch.shape[1:], batch.dtype)
+        codes[start : start + len(batch)] = batch
+    return codes if codes is not None else quantizer.encode(vectors)
+
+
+class _QuantizedIndex(_Index):
+    """Index searched through compressed codes of its vectors
+
+    The full-precision matrix stays memory mapped on disk; only the codes
+    are read by every query. The ``rescore`` best candidates per requested
+    result are then re-scored exactly, which touches a few rows of the map.
+    Like the matrix, the codes are the first rows of a buffer with spare
+    room that upserts write new codes into.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        quantizer: Quantizer,
+        codes: Optional[np.ndarray] = None,
+        rescore: int = 8,
+        min_train_size: int = 1024,
+    ):
+        super().__init__(vectors, ids, metadata)
+        self.quantizer = quantizer
+        self.set_codes(codes)
+        self.rescore = rescore
+        self.min_train_size = min_train_size
+        self.trained_size = len(ids) if quantizer.trained else 0
+        if self._needs_training():
+            self.train()
+        elif self.codes is None and self.ids and quantizer.trained:
+            self.set_codes(_encode(quantizer, self.vectors))
+
+    def set_codes(self, buffer: Optional[np.ndarray]) -> None:
+        """Use a buffer holding the codes of the vectors in its first rows"""
+        self.code_buffer = buffer
+        self.codes = None if buffer is None else buffer[: len(self.ids)]
+
+    def upsert(self, vectors: List[tuple]) -> np.ndarray:
+        previous = len(self.ids)
+        rows = super().upsert(vectors)
+        if self._needs_training():
+            self.train()
+        elif self.quantizer.trained:
+            new_codes = _encode(self.quantizer, self.vectors[rows])
+            buffer = self.code_buffer
+            if buffer is None or len(buffer) < len(self.ids):
+                buffer = np.empty(
+                    (2 * len(self.ids),) + new_codes.shape[1:], new_codes.dtype
+                )
+                if previous:
+                    buffer[:previous] = self.codes
+            buffer[rows] = new_codes
+            self.set_codes(buffer)
+        return rows
+
+    def delete(self, ids: List[str]) -> np.ndarray:
+        keep = super().delete(ids)
+        if self.codes is not None and not keep.all():
+            self.set_codes(self.code_buffer[: len(keep)][keep])
+        return keep
+
+    def train(self, sample_size: int = 4096, seed: int = 0) -> None:
+        """Fit a new quantizer on a sample of the vectors and re-encode them"""
+        count = len(self.ids)
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(count, min(count, sample_size), replace=False))
+        # Searches may still be using the current quantizer, so train a copy
+        quantizer = copy.deepcopy(self.quantizer)
+        quantizer.train(self.vectors[sample], seed)
+        self.set_codes(_encode(quantizer, self.vectors))
+        self.quantizer = quantizer
+        self.trained_size = count
+        logging.info(f"Trained quantizer over {count} vectors")
+
+    def search_rows(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        return self.scored_rows(query_vector, top_k, filter)[0]
+
+    def query(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Match]:
+        rows, scores = self.scored_rows(query_vector, top_k, filter)
+        return [
+            Match(self.ids[row], float(score), self.metadata[row])
+            for row, score in zip(rows, scores)
+        ]
+
+    def scored_rows(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        rescore: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Best rows and their scores, ranked on the codes then re-scored
+
+        Args:
+            rescore: Candidates per result re-scored exactly, defaults to
+                the index's setting; 0 ranks by the codes alone
+        """
+        if not self.ids or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = _normalize_query(query_vector)
+        if self.codes is None:
+            # Untrained indexes are too small for compression to matter
+            rows = super().search_rows(query_vector, top_k, filter)
+            return rows, self.vectors[rows] @ query
+
+        rows = None if filter is None else self.filter_rows(filter)
+        codes = self.codes if rows is None else self.codes[rows]
+        approximate = self.quantizer.scores(codes, query)
+        rescore = self.rescore if rescore is None else rescore
+
+        best = _top_k(approximate, top_k * max(rescore, 1))
+        candidates = best if rows is None else rows[best]
+        if not rescore:
+            return candidates, approximate[best]
+        # Fancy indexing a memory map reads only the candidates' pages, and
+        # reads them in file order when the rows are sorted
+        candidates = np.sort(candidates)
+        exact = self.vectors[candidates] @ query
+        order = _top_k(exact, top_k)
+        return candidates[order], exact[order]
+
+    def _needs_training(self) -> bool:
+        if not self.quantizer.learned:
+            return False
+        count = len(self.ids)
+        if not self.quantizer.trained:
+            return count >= self.min_train_size
+        # Retrain once the codebooks were fitted to a much smaller index
+        return count >= 4 * self.trained_size
+
+
+class QuantizedStore(NumpyStore):
+    """Vector store keeping only compressed vectors in memory
+
+    Queries are scored against the codes (asymmetric distance: the query
+    itself stays full precision) and the best candidates are re-scored with
+    the full-precision vectors, which stay memory mapped on disk. Upserts
+    write those straight to the mapped file and vectors are encoded a few
+    thousand at a time, so ingesting never holds the float32 matrix in
+    memory either. Bytes kept in memory per 1536-dimension vector:
+
+    - ``float16``: 3072 (2x smaller than float32)
+    - ``int8``: 1540, one byte per component plus a scale (4x)
+    - ``pq``: 384 with the default 4 components per byte (16x); needs
+      ``min_train_size`` vectors to learn its codebooks and searches exactly
+      until then
+
+    :meth:`measure_recall` reports what the compression costs in recall.
+    """
+
+    FLOAT16 = "float16"
+    INT8 = "int8"
+    PQ = "pq"
+    QUANTIZATIONS = (FLOAT16, INT8, PQ)
+
+    CODES_FILE = "codes.npy"
+    QUANTIZER_FILE = "quantizer.npz"
+    PARAMS_FILE = "quantization.json"
+
+    def __init__(
+        self,
+        root_dir: str = "vector_indexes",
+        quantization: str = INT8,
+        rescore: int = 8,
+        subvector_dim: int = 4,
+        min_train_size: int = 1024,
+    ):
+        """Initialize the store
+
+        Args:
+            root_dir: Directory the indexes are persisted in
+            quantization: "float16", "int8" or "pq"
+            rescore: Candidates per requested result re-scored against the
+                full-precision vectors; 0 ranks by the codes alone
+            subvector_dim: Vector components encoded by each byte of a
+                product quantization code
+            min_train_size: Vectors an index needs before product
+                quantization codebooks are learned
+
+        Raises:
+            ValueError: If quantization is unknown
+        """
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown quantization '{quantization}', expected one of "
+                f"{', '.join(self.QUANTIZATIONS)}"
+            )
+        self.quantization = quantization
+        self.rescore = rescore
+        self.subvector_dim = subvector_dim
+        self.min_train_size = min_train_size
+        # Quantizer last written per index, rewritten only after training
+        self._saved_quantizers: Dict[str, Quantizer] = {}
+        super().__init__(root_dir)
+
+    def measure_recall(
+        self,
+        index_name: str,
+        top_k: int = 10,
+        samples: int = 100,
+        rescore: Optional[int] = None,
+        seed: int = 0,
+    ) -> float:
+        """Recall@top_k of the quantized search against exact search
+
+        Stored vectors are used as sample queries.
+        """
+        index = self._get_index(index_name)
+        if not index.ids:
+            return 1.0
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(len(index.ids), min(samples, len(index.ids)), False)
+
+        found = 0
+        for row in queries:
+            query = index.vectors[row]
+            exact = set(_Index.search_rows(index, query, top_k).tolist())
+            rows, _ = index.scored_rows(query, top_k, rescore=rescore)
+            found += len(exact & set(rows.tolist()))
+        return found / (len(queries) * min(top_k, len(index.ids)))
+
+    def memory_bytes(self, index_name: str) -> int:
+        """Bytes of codes kept in memory for an index"""
+        index = self._get_index(index_name)
+        if index.codes is None:
+            return index.vectors.nbytes if index.ids else 0
+        return index.codes.nbytes
+
+    def _quantizer(self) -> Quantizer:
+        if self.quantization == self.FLOAT16:
+            return Float16Quantizer()
+        if self.quantization == self.INT8:
+            return Int8Quantizer()
+        return ProductQuantizer(self.subvector_dim)
+
+    def _new_index(
+        self, vectors: np.ndarray, ids: List[str], metadata: List[Dict[str, Any]]
+    ) -> _QuantizedIndex:
+        return _QuantizedIndex(
+            vectors,
+            ids,
+            metadata,
+            self._quantizer(),
+            rescore=self.rescore,
+            min_train_size=self.min_train_size,
+        )
+
+    def _load(self, index_name: str) -> _QuantizedIndex:
+        path = self._index_path(index_name)
+        params = {}
+        if (path / self.PARAMS_FILE).exists():
+            with open(path / self.PARAMS_FILE, encoding="utf-8") as f:
+                params = json.load(f)
+        if params.get("quantization") != self.quantization:
+            # Indexes written without this quantization are encoded afresh
+            return super()._load(index_name)
+
+        vectors, ids, metadata = self._read(index_name)
+        quantizer = self._quantizer()
+        if (path / self.QUANTIZER_FILE).exists():
+            with np.load(path / self.QUANTIZER_FILE) as state:
+                quantizer.load_state(dict(state))
+        codes = None
+        if (path / self.CODES_FILE).exists():
+            codes = np.load(path / self.CODES_FILE, mmap_mode="r+")
+            if len(codes) < len(ids):
+                # Left behind by an interrupted save: encode the vectors again
+                logging.warning(f"Re-encoding quantized index {index_name}")
+                codes = None
+        index = _QuantizedIndex(
+            vectors,
+            ids,
+            metadata,
+            quantizer,
+            codes,
+            rescore=self.rescore,
+            min_train_size=self.min_train_size,
+        )
+        index.trained_size = params["trained_size"]
+        self._saved_quantizers[index_name] = index.quantizer
+        return index
+
+    def _reserve(
+        self, index_name: str, index: _QuantizedIndex, rows: int, dimension: int
+    ) -> None:
+        super()._reserve(index_name, index, rows, dimension)
+        if index.codes is not None and len(index.code_buffer) < rows:
+            index.set_codes(
+                self._grow(
+                    index_name,
+                    self.CODES_FILE,
+                    index.codes,
+                    rows,
+                    index.codes.shape[1:],
+                )
+            )
+
+    def _save(
+        self,
+        index_name: str,
+        index: _QuantizedIndex,
+        rows: Optional[np.ndarray] = None,
+    ) -> None:
+        # The base class commits the index, so everything it refers to
+        # must be on disk first
+        path = self._index_path(index_name)
+        path.mkdir(parents=True, exist_ok=True)
+        if index.codes is not None:
+            index.set_codes(
+                self._persist(path, self.CODES_FILE, index.code_buffer, len(index.ids))
+            )
+        state = index.quantizer.state()
+        # The quantizer only changes when it is trained
+        if state and self._saved_quantizers.get(index_name) is not index.quantizer:
+            tmp = path / (self.QUANTIZER_FILE + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **state)
+            os.replace(tmp, path / self.QUANTIZER_FILE)
+            self._saved_quantizers[index_name] = index.quantizer
+        tmp = path / (self.PARAMS_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "quantization": self.quantization,
+                    "trained_size": index.trained_size,
+                },
+                f,
+            )
+        os.replace(tmp, path / self.PARAMS_FILE)
+        super()._save(index_name, index, rows)
+
+    def _forget(self, index_name: str) -> None:
+        super()._forget(index_name)
+        self._saved_quantizers.pop(index_name, None)
@@ -1,23 +1,160 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from dataclasses import dataclass
+from typing import Iterable, List, Dict, Any, Optional, Tuple
+
+import numpy as np
 
 from datachat.core.document import Document
 
 
+@dataclass
+class Match:
+    """A search result: document id, similarity score and metadata"""
+
+    id: str
+    score: float
+    metadata: Dict[str, Any]
+
+
+# Ids, (len(ids), dimension) vectors and metadata of consecutive documents
+VectorBatch = Tuple[List[str], np.ndarray, List[Dict[str, Any]]]
+
+
 class VectorStore(ABC):
-    """Base class for vector stores"""
+    """Base class for vector stores
+
+    Every method takes an optional namespace, a partition of the index that
+    is written, searched, counted and deleted independently of the others,
+    so many datasets can share one index. None is the default partition.
+
+    The async methods run the blocking implementations in a worker thread;
+    stores with a native async client can override them.
+    """
 
     @abstractmethod
-    def upsert(self, index_name: str, vectors: List[tuple]) -> None:
+    def upsert(
+        self, index_name: str, vectors: List[tuple], namespace: Optional[str] = None
+    ) -> None:
         """Upsert vectors to store"""
         pass
 
     @abstractmethod
-    def search(self, index_name: str, query: str, top_k: int) -> List[Dict[str, Any]]:
-        """Search for similar vectors"""
+    def query(
+        self,
+        index_name: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Match]:
+        """Search for similar vectors, returning scored matches best first
+
+        Args:
+            filter: Optional Pinecone-style metadata filter; only vectors
+                whose metadata matches it are returned
+            namespace: Optional namespace to search instead of the default
+        """
         pass
 
+    def search(
+        self,
+        index_name: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Search for similar vectors, returning their metadata best first"""
+        matches = self.query(index_name, query_vector, top_k, filter, namespace)
+        return [match.metadata for match in matches]
+
     @abstractmethod
-    def delete(self, index_name: str):
-        """Delete index"""
+    def fetch(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> List[tuple]:
+        """(id, vector, metadata) tuples of the stored vectors with these ids
+
+        Unknown ids are left out.
+        """
         pass
+
+    def bulk_load(
+        self,
+        index_name: str,
+        batches: Iterable[VectorBatch],
+        namespace: Optional[str] = None,
+    ) -> None:
+        """Load a whole collection of vectors at once, e.g. from a snapshot
+
+        Batches are consumed one at a time, so a memory-mapped matrix is
+        never read into memory as a whole. Stores that can build an index
+        from the batches replace what the index or namespace holds in one
+        step, so a failed load leaves it as it was. By default each batch
+        is upserted, keeping stored vectors with other ids.
+
+        Args:
+            batches: (ids, vectors, metadata) of consecutive documents
+        """
+        for ids, matrix, metadata in batches:
+            self.upsert(
+                index_name,
+                list(zip(ids, np.asarray(matrix).tolist(), metadata)),
+                namespace=namespace,
+            )
+
+    @abstractmethod
+    def count(self, index_name: str, namespace: Optional[str] = None) -> int:
+        """Number of vectors currently visible to searches"""
+        pass
+
+    @abstractmethod
+    def delete_vectors(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> None:
+        """Delete individual vectors by document id"""
+        pass
+
+    @abstractmethod
+    def delete(self, index_name: str, namespace: Optional[str] = None):
+        """Delete index, or only one namespace of it when namespace is given"""
+        pass
+
+    async def aupsert(
+        self, index_name: str, vectors: List[tuple], namespace: Optional[str] = None
+    ) -> None:
+        await asyncio.to_thread(self.upsert, index_name, vectors, namespace=namespace)
+
+    async def aquery(
+        self,
+        index_name: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Match]:
+        return await asyncio.to_thread(
+            self.query, index_name, query_vector, top_k, filter, namespace
+        )
+
+    async def asearch(
+        self,
+        index_name: str,
+        query_vector: List[float],
+        top_k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        matches = await self.aquery(index_name, query_vector, top_k, filter, namespace)
+        return [match.metadata for match in matches]
+
+    async def acount(self, index_name: str, namespace: Optional[str] = None) -> int:
+        return await asyncio.to_thread(self.count, index_name, namespace)
+
+    async def adelete_vectors(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> None:
+        await asyncio.to_thread(self.delete_vectors, index_name, ids, namespace)
+
+    async def adelete(self, index_name: str, namespace: Optional[str] = None):
+        await asyncio.to_thread(self.delete, index_name, namespace)
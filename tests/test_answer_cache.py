@@ -0,0 +1,36 @@
+from datachat.core.answer_cache import AnswerCache
+
+
+class TestAnswerCache:
+    """Tests for the per-dataset semantic answer cache"""
+
+    def test_hits_on_normalized_and_similar_queries(self):
+        cache = AnswerCache(similarity_threshold=0.9)
+        cache.put("ds", "What keynotes are there?", [1.0, 0.0], "Two", 0, 1.5)
+
+        assert cache.get("ds", "what keynotes  are there") == "Two"
+        assert cache.get_similar("ds", [0.99, 0.05]) == "Two"
+        assert cache.get_similar("ds", [0.0, 1.0]) is None
+        assert cache.get("other", "What keynotes are there?") is None
+        assert cache.stats()["saved_seconds"] == 3.0
+
+    def test_invalidation_drops_entries_and_stale_answers(self):
+        cache = AnswerCache()
+        version = cache.version("ds")
+        cache.put("ds", "q1", [1.0, 0.0], "a1", version, 0.1)
+
+        cache.invalidate("ds")
+        cache.put("ds", "q2", [0.0, 1.0], "a2", version, 0.1)
+
+        assert cache.get("ds", "q1") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = AnswerCache(max_entries=2)
+        cache.put("ds", "q1", [1.0, 0.0], "a1", 0, 0.1)
+        cache.put("ds", "q2", [0.0, 1.0], "a2", 0, 0.1)
+        cache.get("ds", "q1")
+        cache.put("ds", "q3", [1.0, 1.0], "a3", 0, 0.1)
+
+        assert cache.get("ds", "q2") is None
+        assert cache.get("ds", "q1") == "a1"
@@ -0,0 +1,22 @@
+from benchmarks.fakes import FakeEmbedding, synthetic_documents
+from benchmarks.run import percentile
+
+
+class TestBenchmarks:
+    """Tests for the offline benchmark helpers"""
+
+    def test_percentile_interpolates_between_ranks(self):
+        values = [4.0, 1.0, 3.0, 2.0]
+
+        assert percentile(values, 50) == 2.5
+        assert percentile(values, 100) == 4.0
+        assert percentile([], 99) == 0.0
+
+    def test_fakes_are_deterministic(self):
+        model = FakeEmbedding(dimension=8, latency=0, per_text_latency=0)
+        first = [doc.text for doc in synthetic_documents(3)]
+        second = [doc.text for doc in synthetic_documents(3)]
+
+        assert first == second
+        assert model.create_embedding("a") == model.create_embedding("a")
+        assert model.create_embedding("a") != model.create_embedding("b")
@@ -0,0 +1,92 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, synthetic_documents
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.store.numpy_store import NumpyStore
+
+
+class RecordingInference(FakeInference):
+    """Fake chat model recording the history of each prompt"""
+
+    def __init__(self):
+        super().__init__(latency=0, tokens=8)
+        self.histories: List[str] = []
+
+    def generate_response(self, context, user_query, system_prompt, history_text=""):
+        self.histories.append(history_text)
+        return super().generate_response(
+            context, user_query, system_prompt, history_text
+        )
+
+
+class TestChat:
+    """Tests for answering questions about a registered dataset"""
+
+    @pytest.fixture
+    def chat(self, tmp_path, monkeypatch) -> DataChat:
+        monkeypatch.chdir(tmp_path)
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        chat = DataChat(
+            config,
+            vector_store=NumpyStore(),
+            embedding_model=FakeEmbedding(dimension=16, latency=0, per_text_latency=0),
+            inference_model=RecordingInference(),
+        )
+        chat.register_dataset("sessions", synthetic_documents(20), "prompt")
+        return chat
+
+    def test_sessionless_questions_share_no_history(self, chat: DataChat):
+        chat.generate_response("sessions", "who speaks first?")
+        chat.generate_response("sessions", "what is on today?")
+
+        assert chat.inference_model.histories == ["", ""]
+        assert len(chat.sessions) == 0
+
+    def test_sessions_keep_their_own_history(self, chat: DataChat):
+        chat.generate_response("sessions", "who speaks first?", session_id="a")
+        chat.generate_response("sessions", "and after that?", session_id="a")
+        chat.generate_response("sessions", "what is on today?", session_id="b")
+
+        first, follow_up, other = chat.inference_model.histories
+        assert first == "" and "who speaks first?" in follow_up
+        assert other == ""
+
+    def test_repeated_sessionless_question_hits_cache(self, chat: DataChat):
+        first = chat.generate_response("sessions", "who speaks first?")
+        chat.generate_response("sessions", "what is on today?")
+        second = chat.generate_response("sessions", "who speaks first?")
+
+        assert second == first
+        assert len(chat.inference_model.histories) == 2
+        assert chat.answer_cache.stats()["hits"] == 1
+
+    def test_async_path_matches_sync_path(self, chat: DataChat):
+        documents = list(synthetic_documents(30, seed=1))
+        sync_stats = chat.register_dataset("sync", documents, "prompt", batch_size=8)
+        async_stats = asyncio.run(
+            chat.aregister_dataset("async", documents, "prompt", batch_size=8)
+        )
+
+        for field in ("rows_read", "rows_upserted", "rows_unchanged"):
+            assert getattr(async_stats, field) == getattr(sync_stats, field)
+        assert chat.repo.count_documents("async") == 30
+
+        question = "which keynote covers vector search?"
+        answer = chat.generate_response("sync", question)
+        sync_context = DataChat.last_context()
+        assert asyncio.run(chat.agenerate_response("async", question)) == answer
+        assert sync_context.text
+        assert DataChat.last_context().text == sync_context.text
+
+        question = "who talks about latency?"
+
+        async def stream() -> List[str]:
+            return [t async for t in chat.astream_response("async", question)]
+
+        assert asyncio.run(stream()) == list(chat.stream_response("sync", question))
@@ -0,0 +1,34 @@
+from datachat.core.context import ContextBuilder
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+class TestContextBuilder:
+    """Tests for token-budgeted context packing"""
+
+    def test_documents_are_projected_and_deduplicated(self):
+        builder = ContextBuilder(max_tokens=100, count_tokens=count_words)
+        documents = [
+            {"title": "Agile", "speaker": "Ann", "abstract": "long text"},
+            {"title": "Agile", "speaker": "Ann", "abstract": "other text"},
+            {"title": "Testing", "speaker": None},
+        ]
+
+        packed = builder.build(documents, fields=["title", "speaker"])
+
+        assert packed.text == "title: Agile | speaker: Ann\ntitle: Testing"
+        assert packed.documents_used == 2
+
+    def test_documents_past_the_budget_are_dropped(self):
+        builder = ContextBuilder(max_tokens=10, count_tokens=count_words)
+        documents = [{"title": f"Session {i}"} for i in range(5)]
+
+        packed = builder.build(documents)
+
+        # Each line is three words; lines after the first add a newline token
+        assert packed.documents_used == 2
+        assert packed.tokens_used == 7
+        assert packed.documents_dropped == 3
+        assert packed.tokens_dropped == 9
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+
+import pytest
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, synthetic_documents
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.core.dataset_repository import Dataset, DatasetRepository
+from datachat.store.numpy_store import NumpyStore
+
+
+class TestDatasetCache:
+    """Tests for the in-memory dataset cache in front of SQLite"""
+
+    @pytest.fixture
+    def repo(self, tmp_path) -> DatasetRepository:
+        repo = DatasetRepository(str(tmp_path / "datasets.db"))
+        repo.upsert_dataset(Dataset("ds", "datachat-ds", "prompt"))
+        yield repo
+        repo.close()
+
+    def test_lookups_are_cached_until_the_dataset_changes(self, repo, monkeypatch):
+        first = repo.get_dataset("ds")
+        connect = repo._connect
+        monkeypatch.setattr(repo, "_connect", None)
+        assert repo.get_dataset("ds") == first
+
+        monkeypatch.setattr(repo, "_connect", connect)
+        repo.upsert_dataset(Dataset("ds", "datachat-ds", "new prompt"))
+
+        assert repo.get_dataset("ds").system_prompt == "new prompt"
+
+    def test_callers_get_copies_of_cached_rows(self, repo):
+        repo.upsert_dataset(
+            Dataset("ds", "datachat-ds", "prompt", filter_fields={"type": "keyword"})
+        )
+        repo.add_field_values("ds", {"type": ["keynote"]})
+
+        for _ in range(2):
+            dataset = repo.get_dataset("ds")
+            dataset.system_prompt = "changed"
+            dataset.filter_fields["date"] = "date"
+            repo.get_field_values("ds")["type"].append("changed")
+
+        assert repo.get_dataset("ds").system_prompt == "prompt"
+        assert repo.get_dataset("ds").filter_fields == {"type": "keyword"}
+        assert repo.get_field_values("ds") == {"type": ["keynote"]}
+
+    def test_field_values_read_during_a_write_are_not_cached(self, repo, monkeypatch):
+        repo.add_field_values("ds", {"speaker": ["Ada"]})
+        connect = repo._connect
+        raced = []
+
+        @contextmanager
+        def racing_connect():
+            with connect() as conn:
+                yield conn
+            # Another thread adds a value right after the read
+            if not raced:
+                raced.append(True)
+                repo.add_field_values("ds", {"speaker": ["Bob"]})
+
+        monkeypatch.setattr(repo, "_connect", racing_connect)
+        assert repo.get_field_values("ds") == {"speaker": ["Ada"]}
+        monkeypatch.setattr(repo, "_connect", connect)
+
+        assert sorted(repo.get_field_values("ds")["speaker"]) == ["Ada", "Bob"]
+
+    def test_deleted_dataset_is_not_served_from_cache(self, repo):
+        repo.get_dataset("ds")
+
+        repo.delete_dataset("ds")
+
+        assert repo.get_dataset("ds") is None
+
+
+class TestDocumentHashes:
+    """Tests for the per-document content hashes used by incremental updates"""
+
+    @pytest.fixture
+    def repo(self, tmp_path) -> DatasetRepository:
+        repo = DatasetRepository(str(tmp_path / "datasets.db"))
+        repo.upsert_document_hashes("ds", {"a": "h1", "b": "h2", "c": "h3"}, 1)
+        return repo
+
+    def test_get_returns_only_known_ids(self, repo: DatasetRepository):
+        assert repo.get_document_hashes("ds", ["a", "c", "z"]) == {
+            "a": "h1",
+            "c": "h3",
+        }
+
+    def test_untouched_documents_are_stale(self, repo: DatasetRepository):
+        repo.touch_document_hashes("ds", ["a"], 2)
+        repo.upsert_document_hashes("ds", {"b": "h2-new"}, 2)
+
+        stale = [ids for ids in repo.stale_document_ids("ds", 2, batch_size=1)]
+
+        assert stale == [["c"]]
+        assert repo.count_documents("ds") == 3
+
+
+class TestConnectionPool:
+    """Tests for the bounded pool of SQLite connections"""
+
+    def test_registrations_reuse_connections(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        chat = DataChat(
+            config,
+            vector_store=NumpyStore(),
+            embedding_model=FakeEmbedding(dimension=8, latency=0, per_text_latency=0),
+            inference_model=FakeInference(latency=0),
+        )
+
+        opened = []
+        for _ in range(5):
+            # Every registration runs its pipeline stages on new threads
+            chat.register_dataset(
+                "ds", synthetic_documents(40), "prompt", batch_size=10
+            )
+            opened.append(chat.repo._opened)
+
+        assert opened[-1] == opened[0] <= chat.repo.pool_size
+        chat.repo.close()
+        assert chat.repo._opened == 0
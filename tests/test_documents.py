@@ -0,0 +1,88 @@
+from typing import Iterator
+
+import pytest
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, SyntheticDocument
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.store.numpy_store import NumpyStore
+
+
+def documents(start: int, stop: int, seed: int = 0) -> Iterator[SyntheticDocument]:
+    return (SyntheticDocument(i, seed) for i in range(start, stop))
+
+
+class TestDocuments:
+    """Tests for incremental document changes driven by content hashes"""
+
+    @pytest.fixture
+    def chat(self, tmp_path, monkeypatch) -> DataChat:
+        monkeypatch.chdir(tmp_path)
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        chat = DataChat(
+            config,
+            vector_store=NumpyStore(),
+            embedding_model=FakeEmbedding(dimension=16, latency=0, per_text_latency=0),
+            inference_model=FakeInference(latency=0),
+        )
+        chat.register_dataset("sessions", documents(0, 120), "prompt")
+        return chat
+
+    def count(self, chat: DataChat) -> int:
+        dataset = chat.repo.get_dataset("sessions")
+        return chat.vector_store.count(dataset.index_name, dataset.namespace)
+
+    def test_unchanged_documents_are_not_reembedded(self, chat: DataChat):
+        changed = list(documents(0, 5, seed=1)) + list(documents(5, 120))
+
+        stats = chat.register_dataset("sessions", changed, "prompt")
+
+        assert stats.rows_unchanged == 115
+        assert stats.rows_embedded + stats.rows_cached == 5
+        assert stats.rows_upserted == 5 and stats.rows_deleted == 0
+        assert chat.vector_store.fetch(
+            chat.repo.get_dataset("sessions").index_name, ["doc_0"]
+        )[0][2] == (SyntheticDocument(0, 1).metadata)
+
+    def test_reregistering_a_subset_deletes_stale_documents(self, chat: DataChat):
+        stats = chat.register_dataset("sessions", documents(0, 100), "prompt")
+
+        assert stats.rows_deleted == 20 and stats.rows_upserted == 0
+        assert self.count(chat) == 100
+        assert chat.repo.count_documents("sessions") == 100
+        assert chat.repo.get_document_hashes("sessions", ["doc_100", "doc_119"]) == {}
+
+    def test_add_documents_skips_known_ids(self, chat: DataChat):
+        stats = chat.add_documents(
+            "sessions", list(documents(110, 130, seed=1)), batch_size=8
+        )
+
+        assert stats.rows_upserted == 10 and stats.rows_skipped == 10
+        assert stats.rows_embedded + stats.rows_cached == 10
+        assert self.count(chat) == 130
+        # Known documents keep their content, even though it changed
+        assert chat.vector_store.fetch(
+            chat.repo.get_dataset("sessions").index_name, ["doc_110"]
+        )[0][2] == (SyntheticDocument(110).metadata)
+
+    def test_update_documents_skips_unknown_ids(self, chat: DataChat):
+        updates = list(documents(110, 130, seed=1)) + list(documents(0, 10))
+
+        stats = chat.update_documents("sessions", updates)
+
+        assert stats.rows_upserted == 10
+        assert stats.rows_skipped == 10 and stats.rows_unchanged == 10
+        assert self.count(chat) == 120
+        assert chat.repo.count_documents("sessions") == 120
+
+    def test_remove_documents_counts_known_ids(self, chat: DataChat):
+        removed = chat.remove_documents("sessions", ["doc_0", "doc_1", "missing"])
+
+        assert removed == 2
+        assert self.count(chat) == 118
+        assert chat.repo.count_documents("sessions") == 118
+        # Re-registering brings them back as new documents
+        stats = chat.register_dataset("sessions", documents(0, 120), "prompt")
+        assert stats.rows_upserted == 2 and stats.rows_unchanged == 118
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakeEmbedding
+from datachat.core import embedding_cache
+from datachat.core.embedding_cache import CachedEmbedding, EmbeddingCache
+
+
+class TestEmbeddingCache:
+    """Tests for the persistent LRU embedding cache"""
+
+    @pytest.fixture
+    def clock(self, monkeypatch) -> SimpleNamespace:
+        """Fixture making each cache access one second later than the last"""
+        clock = SimpleNamespace(now=0.0)
+
+        def tick() -> float:
+            clock.now += 1
+            return clock.now
+
+        monkeypatch.setattr(embedding_cache, "time", SimpleNamespace(time=tick))
+        return clock
+
+    def test_hits_and_misses_are_counted(self, tmp_path):
+        model = FakeEmbedding(dimension=8, latency=0, per_text_latency=0)
+        cached = CachedEmbedding(model, EmbeddingCache(str(tmp_path / "cache.db")))
+
+        first, hits = cached.create_embeddings_with_hits(["a", "b", "a"])
+        second, more_hits = cached.create_embeddings_with_hits(["a", "b", "c"])
+
+        assert hits == 0 and more_hits == 2
+        # Cached vectors come back as float32
+        assert first[0] == first[2] == pytest.approx(second[0], rel=1e-6)
+        assert (cached.cache.hits, cached.cache.misses) == (2, 4)
+        assert cached.cache.hit_ratio == pytest.approx(2 / 6)
+        assert len(cached.cache) == 3
+
+    def test_entries_persist_across_instances(self, tmp_path):
+        path = str(tmp_path / "cache.db")
+        EmbeddingCache(path).put_many("model", {"h1": [1.0, 2.0], "h2": [3.0, 4.0]})
+
+        reopened = EmbeddingCache(path)
+
+        assert len(reopened) == 2
+        assert reopened.get_many("model", ["h1", "h3"]) == {"h1": [1.0, 2.0]}
+        assert reopened.get_many("other-model", ["h1"]) == {}
+
+    def test_least_recently_used_are_evicted(self, tmp_path, clock):
+        cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=3)
+        cache.put_many("model", {"h1": [1.0], "h2": [2.0], "h3": [3.0]})
+        cache.get_many("model", ["h1"])
+
+        cache.put_many("model", {"h4": [4.0], "h5": [5.0]})
+
+        assert len(cache) == 3
+        assert set(cache.get_many("model", ["h1", "h2", "h3", "h4", "h5"])) == {
+            "h1",
+            "h4",
+            "h5",
+        }
+        assert len(EmbeddingCache(str(tmp_path / "cache.db"), max_entries=3)) == 3
+
+    def test_overwriting_entries_keeps_count(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=2)
+        cache.put_many("model", {"h1": [1.0], "h2": [2.0]})
+
+        cache.put_many("model", {"h1": [9.0]})
+
+        assert len(cache) == 2
+        assert cache.get_many("model", ["h1", "h2"]) == {"h1": [9.0], "h2": [2.0]}
+        cache.clear()
+        assert len(cache) == 0
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, synthetic_documents
+from datachat.core import data_chat
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.store.numpy_store import NumpyStore
+
+
+class LaggingStore(NumpyStore):
+    """Local store whose writes only become visible after some polls"""
+
+    def __init__(self, lag: int):
+        super().__init__()
+        self.lag = lag
+        self.fetched: List[List[str]] = []
+
+    def fetch(
+        self, index_name: str, ids: List[str], namespace: Optional[str] = None
+    ) -> List[tuple]:
+        self.fetched.append(list(ids))
+        if len(self.fetched) <= self.lag:
+            return []
+        return super().fetch(index_name, ids, namespace)
+
+    def count(self, index_name: str, namespace: Optional[str] = None) -> int:
+        raise AssertionError("Indexing is awaited by id, not by count")
+
+
+class TestIndexingWait:
+    """Tests for waiting until upserted vectors can be searched"""
+
+    @pytest.fixture
+    def clock(self, monkeypatch) -> SimpleNamespace:
+        """Fixture replacing the clock data_chat waits with by a fake one"""
+        clock = SimpleNamespace(now=0.0, sleeps=[])
+        yield_control = asyncio.sleep
+
+        def sleep(seconds: float) -> None:
+            clock.sleeps.append(seconds)
+            clock.now += seconds
+
+        async def asleep(seconds: float) -> None:
+            # asyncio itself sleeps for 0 to let other tasks run
+            if seconds:
+                sleep(seconds)
+            await yield_control(0)
+
+        fake_time = SimpleNamespace(
+            monotonic=lambda: clock.now,
+            sleep=sleep,
+            time_ns=lambda: int(clock.now * 1e9),
+            perf_counter=lambda: clock.now,
+        )
+        monkeypatch.setattr(data_chat, "time", fake_time)
+        monkeypatch.setattr(data_chat.asyncio, "sleep", asleep)
+        return clock
+
+    def make_chat(self, tmp_path, monkeypatch, store: NumpyStore) -> DataChat:
+        monkeypatch.chdir(tmp_path)
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        return DataChat(
+            config,
+            vector_store=store,
+            embedding_model=FakeEmbedding(dimension=8, latency=0, per_text_latency=0),
+            inference_model=FakeInference(latency=0),
+        )
+
+    def test_polls_last_batch_with_backoff(self, tmp_path, monkeypatch, clock):
+        store = LaggingStore(lag=3)
+        chat = self.make_chat(tmp_path, monkeypatch, store)
+
+        chat.register_dataset(
+            "sessions",
+            synthetic_documents(25),
+            "prompt",
+            batch_size=10,
+            max_in_flight=1,
+        )
+
+        # Only the batch written last is polled for
+        assert len(store.fetched) == 4
+        assert len(store.fetched[0]) == 5
+        assert clock.sleeps == [0.1, 0.2, 0.4]
+
+    def test_backoff_is_capped_and_times_out(self, tmp_path, monkeypatch, clock):
+        store = LaggingStore(lag=100)
+        chat = self.make_chat(tmp_path, monkeypatch, store)
+        dataset = SimpleNamespace(name="sessions", index_name="idx", namespace=None)
+
+        waited = chat._wait_for_indexing(dataset, ["doc_0"], timeout=10.0)
+
+        assert waited == pytest.approx(10.0)
+        assert max(clock.sleeps) == 2.0
+        assert sum(clock.sleeps) == pytest.approx(10.0)
+
+    def test_async_wait_polls_until_visible(self, tmp_path, monkeypatch, clock):
+        store = LaggingStore(lag=2)
+        chat = self.make_chat(tmp_path, monkeypatch, store)
+
+        asyncio.run(chat.aregister_dataset("sessions", synthetic_documents(5), "p"))
+
+        assert len(store.fetched) == 3
+        assert clock.sleeps == [0.1, 0.2]
+
+    def test_nothing_upserted_is_not_awaited(self, tmp_path, monkeypatch, clock):
+        store = LaggingStore(lag=100)
+        chat = self.make_chat(tmp_path, monkeypatch, store)
+        chat.register_dataset("sessions", synthetic_documents(5), "prompt")
+        store.fetched.clear()
+        clock.sleeps.clear()
+
+        chat.register_dataset("empty", [], "prompt")
+        chat.register_dataset("sessions", synthetic_documents(5), "prompt")
+
+        assert store.fetched == [] and clock.sleeps == []
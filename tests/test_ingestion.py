@@ -0,0 +1,58 @@
+import asyncio
+import io
+import time
+from types import SimpleNamespace
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, synthetic_documents
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.core.ingestion import IngestionManager, JobStatus
+from datachat.store.numpy_store import NumpyStore
+from tests.session_document import SessionDocument
+
+
+class TestIngestion:
+    """Tests for ingestion progress accounting and background jobs"""
+
+    def test_async_ingest_counts_cached_rows(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        chat = DataChat(
+            config,
+            vector_store=NumpyStore(),
+            embedding_model=FakeEmbedding(dimension=16, latency=0, per_text_latency=0),
+            inference_model=FakeInference(latency=0),
+        )
+        documents = list(synthetic_documents(30))
+
+        first = asyncio.run(chat.aregister_dataset("first", documents, "prompt"))
+        second = asyncio.run(chat.aregister_dataset("second", documents, "prompt"))
+
+        assert (first.rows_embedded, first.rows_cached) == (30, 0)
+        assert (second.rows_embedded, second.rows_cached) == (0, 30)
+
+    def test_finished_jobs_are_pruned(self):
+        data_chat = SimpleNamespace(register_dataset=lambda *args, **kwargs: None)
+        manager = IngestionManager(data_chat, max_workers=1, job_ttl=60, max_jobs=3)
+
+        def run_job():
+            job = manager.submit("sessions", io.BytesIO(b""), SessionDocument, "")
+            while job.stats.finished_at is None:
+                time.sleep(0.001)
+            assert job.status == JobStatus.COMPLETED
+            return job
+
+        jobs = [run_job() for _ in range(4)]
+
+        # Over capacity, the job that finished first goes
+        assert manager.get(jobs[0].id) is None
+        assert all(manager.get(job.id) is job for job in jobs[1:])
+
+        # Past their TTL, all finished jobs go
+        manager.job_ttl = 0
+        last = run_job()
+        manager.shutdown()
+        assert all(manager.get(job.id) is None for job in jobs)
+        assert manager.get(last.id) is last
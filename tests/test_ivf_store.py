@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from datachat.store.ivf_store import IVFStore
+
+
+class TestIVFStore:
+    """Tests for the approximate IVF vector store"""
+
+    @pytest.fixture
+    def vectors(self) -> np.ndarray:
+        """Fixture providing clustered random vectors"""
+        rng = np.random.default_rng(7)
+        centers = rng.normal(size=(20, 32))
+        return centers[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, 32))
+
+    @pytest.fixture
+    def store(self, tmp_path, vectors: np.ndarray) -> IVFStore:
+        store = IVFStore(str(tmp_path), nprobe=4, min_train_size=500)
+        store.upsert(
+            "test-index",
+            [(f"doc_{i}", v.tolist(), {"row": i}) for i, v in enumerate(vectors)],
+        )
+        return store
+
+    def test_tune_reaches_recall_target(self, store: IVFStore):
+        nprobe = store.tune("test-index", target_recall=0.9)
+
+        assert store.measure_recall("test-index", nprobe=nprobe) >= 0.9
+
+    def test_tune_stays_within_namespace(self, tmp_path, store, vectors):
+        for namespace, rows in (("a", vectors), ("b", vectors[:600])):
+            store.upsert(
+                "test-index",
+                [(f"doc_{i}", v.tolist(), {"row": i}) for i, v in enumerate(rows)],
+                namespace=namespace,
+            )
+
+        nprobe = store.tune("test-index", target_recall=1.0, namespace="b")
+
+        assert store._get_index("test-index").nprobe == 4
+        assert store._get_index(store._key("test-index", "a")).nprobe == 4
+        reopened = IVFStore(str(tmp_path))
+        assert reopened._get_index(store._key("test-index", "b")).nprobe == nprobe
+        assert reopened.measure_recall("test-index", nprobe=nprobe, namespace="b") == 1
+
+    def test_deleted_vectors_are_not_returned(self, store, vectors: np.ndarray):
+        store.delete_vectors("test-index", ["doc_3"])
+
+        results = store.search("test-index", vectors[3].tolist(), top_k=5)
+
+        assert {"row": 3} not in results
+
+    def test_index_is_reopened_from_disk(self, tmp_path, store, vectors):
+        store.set_nprobe("test-index", 2)
+        reopened = IVFStore(str(tmp_path))
+
+        results = reopened.search("test-index", vectors[10].tolist(), top_k=1)
+
+        assert results == [{"row": 10}]
+        assert reopened._get_index("test-index").nprobe == 2
+
+    def test_buckets_stay_consistent_across_upserts(self, tmp_path, store, vectors):
+        rng = np.random.default_rng(3)
+        for start in range(0, 600, 100):
+            # Half of each batch replaces existing vectors, half adds new ones
+            ids = list(rng.choice(2000, 50, replace=False)) + list(
+                range(2000 + start, 2050 + start)
+            )
+            batch = rng.normal(size=(len(ids), vectors.shape[1]))
+            store.upsert(
+                "test-index",
+                [(f"doc_{i}", v.tolist(), {"row": int(i)}) for i, v in zip(ids, batch)],
+            )
+
+        for index in (
+            store._get_index("test-index"),
+            IVFStore(str(tmp_path))._get_index("test-index"),
+        ):
+            assert len(index.ids) == 2300
+            assert (index.assignments == index._assign(index.vectors)).all()
+            buckets = [index.bucket(c) for c in range(len(index.centroids))]
+            assert sorted(np.concatenate(buckets).tolist()) == list(range(2300))
+            assert all((index.assignments[b] == c).all() for c, b in enumerate(buckets))
+        assert not list(tmp_path.glob("test-index/*.tmp"))
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+from datachat.core.lexical_index import LexicalIndex
+
+
+class TestLexicalIndex:
+    """Tests for the BM25 keyword index"""
+
+    @pytest.fixture
+    def index(self, tmp_path) -> LexicalIndex:
+        index = LexicalIndex(str(tmp_path / "lexical.db"))
+        index.upsert(
+            "ds",
+            [
+                ("a", "Keynote by Ada Lovelace on engines", {"type": "keynote"}),
+                ("b", "Workshop on analytical engines", {"type": "workshop"}),
+                ("c", "Panel about compilers", {"type": "panel"}),
+            ],
+        )
+        return index
+
+    def test_ranks_rare_terms_higher_and_filters(self, index: LexicalIndex):
+        matches = index.query("ds", "Who is Lovelace speaking about engines?", 3)
+
+        assert [m.id for m in matches] == ["a", "b"]
+        assert matches[0].metadata == {"type": "keynote"}
+        assert index.query("ds", "engines", 3, {"type": "workshop"})[0].id == "b"
+        assert index.query("other", "engines", 3) == []
+
+    def test_documents_are_replaced_and_removed(self, index: LexicalIndex):
+        index.upsert("ds", [("a", "Keynote on compilers", {"type": "keynote"})])
+        index.upsert_missing("ds", [("c", "Ignored text", {}), ("d", "Compilers", {})])
+        index.delete("ds", ["c"])
+
+        assert {m.id for m in index.query("ds", "compilers", 5)} == {"a", "d"}
+        assert index.query("ds", "Lovelace", 5) == []
+
+        index.delete("ds")
+        assert index.query("ds", "compilers", 5) == []
+
+    def test_large_batches_stay_within_parameter_limits(self, tmp_path):
+        index = LexicalIndex(str(tmp_path / "lexical.db"))
+        # The limit of older SQLite versions
+        index._connect().setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        rows = [(f"d{i}", f"talk number {i} on engines", {}) for i in range(3_000)]
+        index.upsert("ds", rows[:100])
+
+        index.upsert_missing("ds", rows)
+
+        matches = index.query("ds", "engines 7", 1_500)
+        assert len(matches) == 1_500
+        assert matches[0].id == "d7"
+        assert matches[1].score == matches[-1].score
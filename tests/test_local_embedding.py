@@ -0,0 +1,31 @@
+import numpy as np
+
+from datachat.core.local_embedding import HashedNgramEmbedding
+
+
+class TestHashedNgramEmbedding:
+    """Tests for the local hashed n-gram embedding model"""
+
+    def test_similar_texts_have_similar_vectors(self):
+        model = HashedNgramEmbedding(dimension=256)
+        model.fit(["Keynote on compilers", "Workshop on databases", "Panel"])
+
+        vectors = model.encode(
+            ["keynote about compilers", "Keynote on compilers", "database workshop"]
+        )
+
+        assert vectors.shape == (3, 256)
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+        assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+        assert model.create_embedding("Panel") == model.encode(["Panel"])[0].tolist()
+
+    def test_fitted_model_round_trips(self, tmp_path):
+        model = HashedNgramEmbedding(dimension=64, ngram_range=(2, 3))
+        model.fit(["alpha beta", "beta gamma"])
+        model.save(str(tmp_path / "model.npz"))
+
+        loaded = HashedNgramEmbedding.load(str(tmp_path / "model.npz"))
+
+        assert loaded.fitted
+        assert loaded.ngram_range == (2, 3)
+        assert np.array_equal(loaded.encode(["beta"]), model.encode(["beta"]))
@@ -0,0 +1,38 @@
+from datachat.core import metrics
+
+
+class TestMetrics:
+    """Tests for the metrics registry and stage timings"""
+
+    def test_renders_prometheus_text_format(self):
+        registry = metrics.MetricsRegistry()
+        calls = registry.counter("calls_total", "Calls", ["model"])
+        latency = registry.histogram("latency_seconds", "Latency", buckets=[0.1, 1])
+        calls.inc(2, 'gpt-"4"')
+        latency.observe(0.5)
+        latency.observe(5)
+
+        lines = registry.render().splitlines()
+
+        assert "# TYPE calls_total counter" in lines
+        assert 'calls_total{model="gpt-\\"4\\""} 2' in lines
+        assert 'latency_seconds_bucket{le="0.1"} 0' in lines
+        assert 'latency_seconds_bucket{le="1"} 1' in lines
+        assert 'latency_seconds_bucket{le="+Inf"} 2' in lines
+        assert "latency_seconds_sum 5.5" in lines
+        assert registry.counter("calls_total", "Calls", ["model"]) is calls
+
+    def test_timings_are_collected_per_request(self):
+        @metrics.timed("test_stage")
+        def work():
+            pass
+
+        before = metrics.STAGE_SECONDS.count("test_stage")
+        with metrics.collect_timings() as timings:
+            work()
+            work()
+        work()
+
+        assert list(timings) == ["test_stage"]
+        assert metrics.STAGE_SECONDS.count("test_stage") == before + 3
+        assert metrics.server_timing({"embed": 0.0123}) == "embed;dur=12.3"
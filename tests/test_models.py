@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from datachat.core.config import OpenAIConfig
+from datachat.core.models import OpenAIEmbedding
+
+
+class FakeEmbeddings:
+    """Embeddings endpoint answering out of order, later batches first
+
+    Each text is embedded as [its length], and the items of a response
+    come back reversed, as the API doesn't promise their order.
+    """
+
+    def __init__(self):
+        self.requests: List[List[str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def create(self, model: str, input: List[str]) -> SimpleNamespace:
+        with self._lock:
+            self.requests.append(list(input))
+            position = len(self.requests)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        # Earlier requests take longer, so they finish last
+        time.sleep(0.05 / position)
+        with self._lock:
+            self.in_flight -= 1
+        return self._response(input)
+
+    @staticmethod
+    def _response(texts: List[str]) -> SimpleNamespace:
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text))])
+            for i, text in enumerate(texts)
+        ]
+        return SimpleNamespace(data=data[::-1], usage=None)
+
+
+class AsyncFakeEmbeddings(FakeEmbeddings):
+    async def create(self, model: str, input: List[str]) -> SimpleNamespace:
+        self.requests.append(list(input))
+        position = len(self.requests)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05 / position)
+        self.in_flight -= 1
+        return self._response(input)
+
+
+class TestOpenAIEmbedding:
+    """Tests for batching and concurrency of OpenAI embedding requests"""
+
+    def make_model(self, **kwargs) -> OpenAIEmbedding:
+        model = OpenAIEmbedding(OpenAIConfig("test"), **kwargs)
+        model.client = SimpleNamespace(embeddings=FakeEmbeddings())
+        model.async_client = SimpleNamespace(embeddings=AsyncFakeEmbeddings())
+        return model
+
+    def test_batches_respect_count_limit(self):
+        model = self.make_model(batch_size=3)
+
+        batches = list(model._batches([f"t{i}" for i in range(8)]))
+
+        assert [len(batch) for batch in batches] == [3, 3, 2]
+
+    def test_batches_respect_token_limit(self):
+        # 39 characters estimate to 10 tokens
+        model = self.make_model(batch_size=100, batch_tokens=25)
+
+        batches = list(model._batches(["x" * 39] * 5))
+
+        assert [len(batch) for batch in batches] == [2, 2, 1]
+
+    def test_oversized_text_is_sent_alone(self):
+        model = self.make_model(batch_tokens=25)
+        texts = ["short", "x" * 1000, "short"]
+
+        assert list(model._batches(texts)) == [["short"], ["x" * 1000], ["short"]]
+        assert model.create_embeddings(texts) == [[5.0], [1000.0], [5.0]]
+
+    def test_concurrent_batches_keep_input_order(self):
+        model = self.make_model(batch_size=2, max_workers=3)
+        texts = ["a" * i for i in range(1, 12)]
+
+        embeddings = model.create_embeddings(texts)
+
+        assert embeddings == [[float(i)] for i in range(1, 12)]
+        assert len(model.client.embeddings.requests) == 6
+        assert 1 < model.client.embeddings.max_in_flight <= 3
+
+    def test_async_batches_keep_input_order(self):
+        model = self.make_model(batch_size=2, max_workers=3)
+        texts = ["a" * i for i in range(1, 12)]
+
+        embeddings = asyncio.run(model.acreate_embeddings(texts))
+
+        assert embeddings == [[float(i)] for i in range(1, 12)]
+        assert len(model.async_client.embeddings.requests) == 6
+        assert 1 < model.async_client.embeddings.max_in_flight <= 3
+
+    @pytest.mark.parametrize("texts", [[], ["only"]])
+    def test_small_inputs_need_no_pool(self, texts: List[str]):
+        model = self.make_model()
+
+        assert model.create_embeddings(texts) == [[4.0]] * len(texts)
+        assert len(model.client.embeddings.requests) == len(texts)
@@ -0,0 +1,178 @@
+from typing import List
+
+import numpy as np
+import pytest
+
+from datachat.core.exceptions import VectorStoreError
+from datachat.store.numpy_store import NumpyStore
+
+
+class TestNumpyStore:
+    """Tests for the in-process NumPy vector store"""
+
+    @pytest.fixture
+    def vectors(self) -> List[tuple]:
+        """Fixture providing orthogonal vectors with metadata"""
+        return [
+            (f"doc_{i}", np.eye(4)[i].tolist(), {"title": f"Document {i}"})
+            for i in range(4)
+        ]
+
+    @pytest.fixture
+    def store(self, tmp_path, vectors: List[tuple]) -> NumpyStore:
+        store = NumpyStore(str(tmp_path))
+        store.upsert("test-index", vectors)
+        return store
+
+    def test_search_returns_nearest_first(self, store: NumpyStore):
+        results = store.search("test-index", [0.1, 0.9, 0.3, 0.0], top_k=2)
+
+        assert [r["title"] for r in results] == ["Document 1", "Document 2"]
+
+    def test_search_applies_metadata_filter(self, store: NumpyStore):
+        results = store.search(
+            "test-index",
+            [1.0, 0.0, 0.0, 0.0],
+            top_k=4,
+            filter={"title": {"$in": ["Document 2", "Document 3"]}},
+        )
+
+        assert [r["title"] for r in results] == ["Document 2", "Document 3"]
+
+    def test_filter_matches_list_elements(self, tmp_path):
+        store = NumpyStore(str(tmp_path))
+        store.upsert(
+            "test-index",
+            [
+                ("doc_0", [1, 0, 0, 0], {"speakers": ["Alice", "Bob"]}),
+                ("doc_1", [0, 1, 0, 0], {"speakers": ["Carol"]}),
+            ],
+        )
+
+        def search(filter):
+            return store.search("test-index", [1, 1, 0, 0], top_k=4, filter=filter)
+
+        assert search({"speakers": "Bob"}) == [{"speakers": ["Alice", "Bob"]}]
+        assert search({"speakers": {"$in": ["Carol", "Dave"]}}) == [
+            {"speakers": ["Carol"]}
+        ]
+        assert search({"speakers": {"$ne": "Bob"}}) == [{"speakers": ["Carol"]}]
+        assert search({"speakers": {"$nin": ["Alice"]}}) == [{"speakers": ["Carol"]}]
+
+    def test_upsert_replaces_existing_ids(self, store: NumpyStore):
+        store.upsert("test-index", [("doc_0", [0, 0, 0, 1], {"title": "Updated"})])
+
+        results = store.search("test-index", [0, 0, 0, 1], top_k=2)
+
+        assert {r["title"] for r in results} == {"Updated", "Document 3"}
+
+    def test_index_is_reopened_from_disk(self, tmp_path, store: NumpyStore):
+        reopened = NumpyStore(str(tmp_path))
+
+        results = reopened.search("test-index", [0, 0, 1, 0], top_k=1)
+
+        assert results == [{"title": "Document 2"}]
+
+    def test_delete_removes_index(self, tmp_path, store: NumpyStore):
+        store.delete("test-index")
+
+        assert NumpyStore(str(tmp_path)).search("test-index", [1, 0, 0, 0], 1) == []
+
+    def test_namespaces_are_searched_and_deleted_separately(
+        self, tmp_path, store: NumpyStore
+    ):
+        store.upsert("test-index", [("doc_0", [1, 0, 0, 0], {"title": "A"})], "a")
+        store.upsert("test-index", [("doc_0", [1, 0, 0, 0], {"title": "B"})], "b")
+
+        assert store.search("test-index", [1, 0, 0, 0], 1, namespace="a") == [
+            {"title": "A"}
+        ]
+        assert store.count("test-index", "b") == 1
+
+        store.delete("test-index", namespace="a")
+        reopened = NumpyStore(str(tmp_path))
+
+        assert reopened.count("test-index", "a") == 0
+        assert reopened.count("test-index", "b") == 1
+        assert reopened.count("test-index") == 4
+
+    def test_bulk_load_replaces_index_and_keeps_namespaces(
+        self, tmp_path, store: NumpyStore
+    ):
+        store.upsert("test-index", [("doc_0", [1, 0, 0, 0], {"title": "A"})], "a")
+        matrix = np.array([[0, 0, 0, 2], [0, 3, 0, 0]], dtype=np.float32)
+
+        store.bulk_load(
+            "test-index", [(["new_0", "new_1"], matrix, [{"n": 0}, {"n": 1}])]
+        )
+        reopened = NumpyStore(str(tmp_path))
+
+        for s in (store, reopened):
+            assert s.count("test-index") == 2
+            assert s.search("test-index", [0, 1, 0, 0], 1) == [{"n": 1}]
+            assert s.count("test-index", "a") == 1
+        assert not (tmp_path / "test-index.loading").exists()
+
+    def test_bulk_load_grows_across_batches(self, tmp_path, store: NumpyStore):
+        rows = NumpyStore.MIN_CAPACITY + 500
+        matrix = np.eye(rows, 4, dtype=np.float32) + 1
+        batches = (
+            (
+                [f"new_{i}" for i in range(start, min(start + 300, rows))],
+                matrix[start : start + 300],
+                [{"n": i} for i in range(start, min(start + 300, rows))],
+            )
+            for start in range(0, rows, 300)
+        )
+
+        store.bulk_load("test-index", batches)
+        reopened = NumpyStore(str(tmp_path))
+
+        for s in (store, reopened):
+            assert s.count("test-index") == rows
+            assert s.fetch("test-index", ["new_2", f"new_{rows - 1}"])[1][2] == {
+                "n": rows - 1
+            }
+            assert s.search("test-index", [1, 1, 2, 1], 1) == [{"n": 2}]
+        assert not (tmp_path / "test-index.loading").exists()
+
+    def test_bulk_load_rejects_repeated_ids_across_batches(self, store: NumpyStore):
+        matrix = np.ones((1, 4), dtype=np.float32)
+
+        with pytest.raises(VectorStoreError, match="unique"):
+            store.bulk_load(
+                "test-index",
+                [(["new_0"], matrix, [{}]), (["new_0"], matrix, [{}])],
+            )
+
+        assert store.count("test-index") == 4
+
+    def test_upserts_append_to_preallocated_file(self, tmp_path, store: NumpyStore):
+        path = tmp_path / "test-index" / NumpyStore.VECTORS_FILE
+        inode = path.stat().st_ino
+        for i in range(4, 40):
+            store.upsert("test-index", [(f"doc_{i}", [1, 1, 0, i], {"title": str(i)})])
+        store.upsert("test-index", [("doc_1", [0, 0, 0, 1], {"title": "Updated"})])
+
+        assert path.stat().st_ino == inode
+        assert np.load(path, mmap_mode="r").shape == (NumpyStore.MIN_CAPACITY, 4)
+        reopened = NumpyStore(str(tmp_path))
+        assert reopened.count("test-index") == 40
+        assert reopened.fetch("test-index", ["doc_1", "doc_39"]) == (
+            store.fetch("test-index", ["doc_1", "doc_39"])
+        )
+        assert reopened.search("test-index", [0, 0, 0, 1], 1) == [{"title": "Updated"}]
+
+    def test_uncommitted_writes_are_ignored(self, tmp_path, store: NumpyStore):
+        path = tmp_path / "test-index"
+        # What a crash between writing a batch and committing it leaves
+        with open(path / NumpyStore.RECORDS_FILE, "ab") as f:
+            f.write(b'[4, "doc_4", {"title": "Torn"}]\n[5, "doc_')
+
+        reopened = NumpyStore(str(tmp_path))
+        assert reopened.count("test-index") == 4
+        reopened.upsert("test-index", [("doc_9", [1, 1, 1, 1], {"title": "New"})])
+
+        reopened = NumpyStore(str(tmp_path))
+        assert reopened.search("test-index", [1, 1, 1, 1], 1) == [{"title": "New"}]
+        assert reopened.count("test-index") == 5
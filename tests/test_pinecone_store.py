@@ -0,0 +1,259 @@
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set
+
+import pytest
+
+from datachat.core.config import PineconeConfig
+from datachat.core.exceptions import UpsertError
+from datachat.store import pinecone_store
+from datachat.store.pinecone_store import PineconeStore
+
+
+class AlreadyExists(Exception):
+    """Error Pinecone answers when an index is created twice"""
+
+    status = 409
+
+
+class FakeIndexList:
+    def __init__(self, names: List[str]):
+        self._names = names
+
+    def names(self) -> List[str]:
+        return list(self._names)
+
+
+class FakePinecone:
+    """Control plane client creating indexes slowly, like the real one"""
+
+    def __init__(self):
+        self.indexes: List[str] = []
+        self.create_calls = 0
+        self._lock = threading.Lock()
+
+    def list_indexes(self) -> FakeIndexList:
+        return FakeIndexList(self.indexes)
+
+    def create_index(self, name: str, **kwargs) -> None:
+        with self._lock:
+            self.create_calls += 1
+            if name in self.indexes:
+                raise AlreadyExists(f"Resource {name} already exists")
+        time.sleep(0.05)
+        with self._lock:
+            self.indexes.append(name)
+
+    def Index(self, name: str) -> str:
+        return f"handle:{name}"
+
+    def delete_index(self, name: str) -> None:
+        self.indexes.remove(name)
+
+
+class FlakyIndex:
+    """Index handle failing chunks holding given ids once, or always"""
+
+    def __init__(self, fail_once: Set[str], fail_always: Set[str]):
+        self.fail_once = set(fail_once)
+        self.fail_always = fail_always
+        self.attempts: Dict[str, int] = {}
+        self.upserted: List[str] = []
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[tuple], namespace: Optional[str] = None) -> None:
+        ids = {doc_id for doc_id, _, _ in vectors}
+        with self._lock:
+            for doc_id in ids:
+                self.attempts[doc_id] = self.attempts.get(doc_id, 0) + 1
+            if ids & self.fail_always:
+                raise ConnectionError("upstream unavailable")
+            if ids & self.fail_once:
+                self.fail_once -= ids
+                raise ConnectionError("connection reset")
+            self.upserted.extend(doc_id for doc_id, _, _ in vectors)
+
+
+class RecordingIndex:
+    """Index handle recording every call, holding vectors in two namespaces"""
+
+    def __init__(self):
+        self.calls: List[tuple] = []
+        self.namespaces = {
+            "ds-a": SimpleNamespace(vector_count=3),
+            "ds-b": SimpleNamespace(vector_count=5),
+        }
+
+    def _record(self, method: str, **kwargs) -> None:
+        self.calls.append((method, kwargs))
+
+    def upsert(self, **kwargs) -> None:
+        self._record("upsert", **kwargs)
+
+    def query(self, **kwargs) -> SimpleNamespace:
+        self._record("query", **kwargs)
+        return SimpleNamespace(matches=[])
+
+    def fetch(self, **kwargs) -> SimpleNamespace:
+        self._record("fetch", **kwargs)
+        return SimpleNamespace(vectors={})
+
+    def delete(self, **kwargs) -> None:
+        self._record("delete", **kwargs)
+
+    def describe_index_stats(self) -> SimpleNamespace:
+        return SimpleNamespace(total_vector_count=8, namespaces=self.namespaces)
+
+
+class TestPineconeStore:
+    """Tests for the Pinecone store, without talking to Pinecone"""
+
+    def make_store(self) -> PineconeStore:
+        store = PineconeStore(PineconeConfig("test", "us-east-1"))
+        store.pc = FakePinecone()
+        return store
+
+    def test_concurrent_get_index_creates_once(self):
+        store = self.make_store()
+        handles, errors = [], []
+        start = threading.Barrier(8)
+
+        def get_index():
+            start.wait()
+            try:
+                handles.append(store.get_index("new-index", 32))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=get_index) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        assert store.pc.create_calls == 1
+        assert handles == ["handle:new-index"] * 8
+
+    def test_index_created_elsewhere_is_not_an_error(self):
+        store = self.make_store()
+        store._index_names = set()
+        store.pc.indexes.append("new-index")
+
+        assert store.get_index("new-index", 32) == "handle:new-index"
+        assert store._index_exists("new-index")
+
+    def vectors(self, n: int, dimension: int = 4) -> List[tuple]:
+        return [(f"doc_{i}", [0.1] * dimension, {"row": i}) for i in range(n)]
+
+    def test_chunks_respect_count_limit(self):
+        store = PineconeStore(PineconeConfig("test", "us-east-1"), chunk_size=4)
+
+        chunks = list(store._chunks(self.vectors(10)))
+
+        assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+        assert [v for chunk in chunks for v in chunk] == self.vectors(10)
+
+    def test_chunks_respect_size_limit(self):
+        vectors = self.vectors(10, dimension=100)
+        size = PineconeStore._estimate_bytes(vectors[0])
+        store = PineconeStore(
+            PineconeConfig("test", "us-east-1"),
+            chunk_size=100,
+            chunk_bytes=3 * size + 1,
+        )
+
+        chunks = list(store._chunks(vectors))
+
+        assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+
+    def test_oversized_vector_gets_its_own_chunk(self):
+        store = PineconeStore(PineconeConfig("test", "us-east-1"), chunk_bytes=10)
+
+        chunks = list(store._chunks(self.vectors(3)))
+
+        assert [len(chunk) for chunk in chunks] == [1, 1, 1]
+
+    def test_failed_chunks_are_retried_and_reported(self, monkeypatch):
+        delays: List[float] = []
+        monkeypatch.setattr(pinecone_store.time, "sleep", delays.append)
+        store = PineconeStore(
+            PineconeConfig("test", "us-east-1"),
+            chunk_size=2,
+            max_workers=1,
+            max_retries=2,
+            retry_delay=1.0,
+        )
+        index = FlakyIndex(fail_once={"doc_2"}, fail_always={"doc_7"})
+        monkeypatch.setattr(store, "get_index", lambda *args: index)
+
+        with pytest.raises(UpsertError) as error:
+            store.upsert("test-index", self.vectors(10))
+
+        # The chunk failing once succeeds on its first retry
+        assert index.attempts["doc_2"] == 2 and "doc_2" in index.upserted
+        # The chunk failing always is tried once plus max_retries times
+        assert index.attempts["doc_7"] == 3
+        assert [v[0] for v in error.value.failed_vectors] == ["doc_6", "doc_7"]
+        assert error.value.failed_chunks == [self.vectors(10)[6:8]]
+        assert sorted(index.upserted) == sorted(
+            f"doc_{i}" for i in range(10) if i not in (6, 7)
+        )
+        # Jittered backoff: each delay lies within the doubling window
+        assert len(delays) == 3
+        assert 0 <= delays[0] <= 1.0
+        assert 0 <= delays[1] <= 1.0 and 0 <= delays[2] <= 2.0
+
+    def test_retry_delays_are_jittered(self, monkeypatch):
+        delays: List[float] = []
+        monkeypatch.setattr(pinecone_store.time, "sleep", delays.append)
+        store = PineconeStore(
+            PineconeConfig("test", "us-east-1"), max_retries=1, retry_delay=1.0
+        )
+        index = FlakyIndex(fail_once=set(), fail_always={"doc_0"})
+
+        for _ in range(20):
+            with pytest.raises(ConnectionError):
+                store._upsert_chunk(index, self.vectors(1), None)
+
+        assert len(delays) == 20 and len(set(delays)) > 1
+        assert all(0 <= delay <= 1.0 for delay in delays)
+
+    def test_namespace_is_passed_on_every_call(self, monkeypatch):
+        store = self.make_store()
+        store.pc.indexes.append("shared")
+        index = RecordingIndex()
+        monkeypatch.setattr(store, "_handle", lambda name: index)
+
+        store.upsert("shared", self.vectors(3), namespace="ds-a")
+        store.query("shared", [0.1] * 4, top_k=2, namespace="ds-a")
+        store.fetch("shared", ["doc_0"], namespace="ds-a")
+        store.delete_vectors("shared", ["doc_0"], namespace="ds-a")
+        store.delete("shared", namespace="ds-a")
+
+        assert [method for method, _ in index.calls] == [
+            "upsert",
+            "query",
+            "fetch",
+            "delete",
+            "delete",
+        ]
+        assert all(kwargs["namespace"] == "ds-a" for _, kwargs in index.calls)
+        assert index.calls[-1][1] == {"delete_all": True, "namespace": "ds-a"}
+        assert store.count("shared", namespace="ds-a") == 3
+        assert store.count("shared", namespace="ds-c") == 0
+        assert store.count("shared") == 8
+
+    def test_deleting_a_namespace_keeps_the_shared_index(self, monkeypatch):
+        store = self.make_store()
+        store.pc.indexes.append("shared")
+        index = RecordingIndex()
+        monkeypatch.setattr(store, "_handle", lambda name: index)
+
+        store.delete("shared", namespace="ds-b")
+        # Empty namespaces don't exist on Pinecone, so nothing is deleted
+        store.delete("shared", namespace="ds-c")
+
+        assert store.pc.indexes == ["shared"]
+        assert index.calls == [("delete", {"delete_all": True, "namespace": "ds-b"})]
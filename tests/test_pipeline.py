@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+
+from benchmarks.fakes import SyntheticDocument
+from datachat.core.ingestion import IngestStats
+from datachat.core.pipeline import IngestPipeline
+
+BATCH_SIZE = 5
+MAX_IN_FLIGHT = 2
+# Batches the pipeline may hold while upserts are stuck: one per upsert
+# worker, embed worker and queue slot of both stages, plus the one the
+# producer is waiting to queue
+MAX_BUFFERED = 4 * MAX_IN_FLIGHT + 1
+
+
+class CountingDocuments:
+    """Lazy document source recording how far it has been read"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.read = 0
+
+    def __iter__(self) -> Iterator[SyntheticDocument]:
+        for i in range(self.count):
+            self.read += 1
+            yield SyntheticDocument(i, 0)
+
+
+def embed(texts: List[str]) -> List[List[float]]:
+    return [[float(len(text))] for text in texts]
+
+
+async def aembed(texts: List[str]) -> List[List[float]]:
+    return embed(texts)
+
+
+class TestIngestPipeline:
+    """Tests for the overlapping render, embed and upsert stages"""
+
+    def make_pipeline(self) -> IngestPipeline:
+        return IngestPipeline(batch_size=BATCH_SIZE, max_in_flight=MAX_IN_FLIGHT)
+
+    def wait_until_stalled(self, documents: CountingDocuments) -> int:
+        """Wait until the input stops being read, returning how far it got"""
+        read = -1
+        while read != documents.read:
+            read = documents.read
+            time.sleep(0.05)
+        return read
+
+    def test_run_reads_input_only_as_far_as_it_buffers(self):
+        documents = CountingDocuments(1000)
+        release = threading.Event()
+        upserted: List[str] = []
+
+        def upsert(vectors: List[tuple]) -> None:
+            release.wait()
+            upserted.extend(doc_id for doc_id, _, _ in vectors)
+
+        stats = IngestStats()
+        runner = threading.Thread(
+            target=self.make_pipeline().run,
+            args=(documents, stats, embed, upsert),
+        )
+        runner.start()
+        read = self.wait_until_stalled(documents)
+        release.set()
+        runner.join()
+
+        assert read <= MAX_BUFFERED * BATCH_SIZE
+        assert sorted(upserted) == sorted(f"doc_{i}" for i in range(1000))
+        assert stats.rows_read == stats.rows_upserted == 1000
+
+    def test_arun_reads_input_only_as_far_as_it_buffers(self):
+        documents = CountingDocuments(1000)
+        upserted: List[str] = []
+
+        async def main() -> int:
+            release = asyncio.Event()
+
+            async def upsert(vectors: List[tuple]) -> None:
+                await release.wait()
+                upserted.extend(doc_id for doc_id, _, _ in vectors)
+
+            run = asyncio.create_task(
+                self.make_pipeline().arun(documents, IngestStats(), aembed, upsert)
+            )
+            read = -1
+            while read != documents.read:
+                read = documents.read
+                await asyncio.sleep(0.05)
+            release.set()
+            await run
+            return read
+
+        read = asyncio.run(main())
+
+        assert read <= MAX_BUFFERED * BATCH_SIZE
+        assert len(upserted) == 1000
+
+    def test_arun_reads_input_off_the_event_loop(self):
+        reader_threads = set()
+        upserted: List[str] = []
+
+        def documents() -> Iterator[SyntheticDocument]:
+            for i in range(12):
+                reader_threads.add(threading.get_ident())
+                yield SyntheticDocument(i, 0)
+
+        async def upsert(vectors: List[tuple]) -> None:
+            upserted.extend(doc_id for doc_id, _, _ in vectors)
+
+        stats = IngestStats()
+        asyncio.run(self.make_pipeline().arun(documents(), stats, aembed, upsert))
+
+        # A file or database read would otherwise block the event loop
+        assert reader_threads and threading.get_ident() not in reader_threads
+        assert sorted(upserted) == sorted(f"doc_{i}" for i in range(12))
+        assert stats.rows_read == 12
+
+    def test_run_stops_and_reraises_when_upsert_fails(self):
+        documents = CountingDocuments(1000)
+        calls = 0
+
+        def upsert(vectors: List[tuple]) -> None:
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise ConnectionError("upsert failed")
+
+        with pytest.raises(ConnectionError, match="upsert failed"):
+            self.make_pipeline().run(documents, IngestStats(), embed, upsert)
+
+        assert documents.read <= (MAX_BUFFERED + 2) * BATCH_SIZE
+
+    def test_arun_stops_and_reraises_when_upsert_fails(self):
+        documents = CountingDocuments(1000)
+        calls = 0
+
+        async def upsert(vectors: List[tuple]) -> None:
+            nonlocal calls
+            calls += 1
+            if calls == 2:
+                raise ConnectionError("upsert failed")
+
+        with pytest.raises(ConnectionError, match="upsert failed"):
+            asyncio.run(
+                self.make_pipeline().arun(documents, IngestStats(), aembed, upsert)
+            )
+
+        assert documents.read <= (MAX_BUFFERED + 2) * BATCH_SIZE
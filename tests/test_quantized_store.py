@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from datachat.store.quantized_store import QuantizedStore
+
+
+class TestQuantizedStore:
+    """Tests for the vector store searching compressed vectors"""
+
+    @pytest.fixture
+    def vectors(self) -> np.ndarray:
+        """Fixture providing clustered random vectors"""
+        rng = np.random.default_rng(7)
+        centers = rng.normal(size=(20, 32))
+        return centers[rng.integers(0, 20, 2000)] + 0.3 * rng.normal(size=(2000, 32))
+
+    def make_store(self, tmp_path, vectors, quantization: str) -> QuantizedStore:
+        store = QuantizedStore(str(tmp_path), quantization, min_train_size=500)
+        store.upsert(
+            "test-index",
+            [(f"doc_{i}", v.tolist(), {"row": i}) for i, v in enumerate(vectors)],
+        )
+        return store
+
+    @pytest.mark.parametrize(
+        "quantization, compression", [("float16", 2), ("int8", 3.5), ("pq", 16)]
+    )
+    def test_compressed_search_keeps_recall(
+        self, tmp_path, vectors, quantization: str, compression: float
+    ):
+        store = self.make_store(tmp_path, vectors, quantization)
+
+        assert store.memory_bytes("test-index") * compression <= vectors.size * 4
+        assert store.measure_recall("test-index") >= 0.95
+        assert store.search("test-index", vectors[3].tolist(), 1) == [{"row": 3}]
+
+    def test_index_is_reopened_from_disk(self, tmp_path, vectors: np.ndarray):
+        store = self.make_store(tmp_path, vectors, "pq")
+        store.delete_vectors("test-index", ["doc_3"])
+        reopened = QuantizedStore(str(tmp_path), "pq")
+
+        index = reopened._get_index("test-index")
+        results = reopened.search("test-index", vectors[10].tolist(), top_k=1)
+
+        assert results == [{"row": 10}]
+        assert index.quantizer.trained and len(index.codes) == len(vectors) - 1
+
+    def test_codes_not_matching_index_are_rebuilt(self, tmp_path, vectors):
+        store = self.make_store(tmp_path, vectors, "int8")
+        codes_path = tmp_path / "test-index" / QuantizedStore.CODES_FILE
+        # Codes of a save that never finished cover fewer rows; replace the
+        # file rather than truncate it, as the store has it memory mapped
+        np.save(tmp_path / "codes.npy", np.load(codes_path)[:100])
+        os.replace(tmp_path / "codes.npy", codes_path)
+
+        index = QuantizedStore(str(tmp_path), "int8")._get_index("test-index")
+
+        assert len(index.codes) == len(vectors)
+        assert (index.codes == store._get_index("test-index").codes).all()
+        assert not list(tmp_path.glob("test-index/*.tmp"))
+
+    def test_batched_upserts_append_codes(self, tmp_path, vectors: np.ndarray):
+        store = QuantizedStore(str(tmp_path), "pq", min_train_size=500)
+        for start in range(0, len(vectors), 250):
+            store.upsert(
+                "test-index",
+                [
+                    (f"doc_{i}", vectors[i].tolist(), {"row": i})
+                    for i in range(start, start + 250)
+                ],
+            )
+
+        reopened = QuantizedStore(str(tmp_path), "pq")._get_index("test-index")
+        index = store._get_index("test-index")
+        assert len(reopened.codes) == len(index.codes) == len(vectors)
+        assert (reopened.codes == index.codes).all()
+        assert reopened.trained_size == index.trained_size
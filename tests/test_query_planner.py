@@ -0,0 +1,44 @@
+import pytest
+
+from datachat.core.query_planner import QueryPlanner, annotate
+from datachat.store.filters import compile_filter
+
+
+class TestQueryPlanner:
+    """Tests for rule-based metadata filter extraction"""
+
+    FIELDS = {"speaker": "keyword", "type": "keyword", "date": "date"}
+    VALUES = {"speaker": ["James", "James Smith", "Alice Brown"], "type": ["keynote"]}
+
+    @pytest.fixture
+    def planner(self) -> QueryPlanner:
+        return QueryPlanner()
+
+    def test_extracts_keyword_and_date_equality(self, planner: QueryPlanner):
+        plan = planner.plan(
+            "ds", "keynotes on October 22nd by James Smith", self.FIELDS, self.VALUES
+        )
+
+        assert plan == {
+            "$and": [
+                {"speaker": {"$eq": "James Smith"}},
+                {"type": {"$eq": "keynote"}},
+                {"_date_md": {"$eq": 1022}},
+            ]
+        }
+
+    def test_extracts_date_ranges(self, planner: QueryPlanner):
+        after = planner.plan("ds", "talks after 2024-10-21", self.FIELDS, {})
+        between = planner.plan("ds", "talks between Oct 21 and Oct 23", self.FIELDS, {})
+
+        assert after == {"_date_day": {"$gt": 20241021}}
+        assert between == {"_date_md": {"$gte": 1021, "$lte": 1023}}
+
+    def test_plan_matches_annotated_metadata(self, planner: QueryPlanner):
+        metadata = annotate({"date": "2024-10-22 09:00:00"}, self.FIELDS)
+        plan = planner.plan("ds", "what is on 22 October 2024?", self.FIELDS, {})
+
+        assert compile_filter(plan)(metadata)
+
+    def test_no_plan_without_recognised_values(self, planner: QueryPlanner):
+        assert planner.plan("ds", "what may I ask?", self.FIELDS, self.VALUES) is None
@@ -0,0 +1,28 @@
+from datachat.core.reranker import LexicalReranker
+from datachat.store.vector_store import Match
+
+
+class TestLexicalReranker:
+    """Tests for the local reranker and its adaptive cutoff"""
+
+    def test_term_overlap_promotes_matching_documents(self):
+        reranker = LexicalReranker(max_gap=0.5, min_k=1)
+        matches = [
+            Match("a", 0.9, {"type": "session", "title": "Compilers"}),
+            Match("b", 0.8, {"type": "keynote", "title": "Engines"}),
+            Match("c", 0.1, {"type": "session", "title": "Parsers"}),
+        ]
+
+        ranking = reranker.rerank("Which keynotes are there?", matches)
+
+        assert [m.id for m in ranking.matches] == ["b", "a"]
+        assert ranking.candidates == 3
+        assert ranking.matches[0].score > ranking.matches[1].score
+
+    def test_cutoff_stops_at_threshold_or_score_cliff(self):
+        reranker = LexicalReranker(min_score=0.2, max_gap=0.3, min_k=2)
+
+        assert reranker.cutoff([0.9, 0.8, 0.7, 0.3]) == 3
+        assert reranker.cutoff([0.9, 0.8, 0.7, 0.6, 0.1]) == 4
+        assert reranker.cutoff([0.9, 0.1, 0.05]) == 2
+        assert reranker.cutoff([]) == 0
@@ -0,0 +1,100 @@
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, synthetic_documents
+from datachat.api import routes
+from datachat.api.app import create_app
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.store.numpy_store import NumpyStore
+
+
+class StreamingInference(FakeInference):
+    """Fake chat model streaming fixed tokens, optionally failing part way
+
+    Records the session history length seen while each token is produced.
+    """
+
+    def __init__(self, tokens: List[str], fail_after: Optional[int] = None):
+        super().__init__(latency=0)
+        self.stream_tokens = tokens
+        self.fail_after = fail_after
+        self.chat: Optional[DataChat] = None
+        self.history_seen: List[int] = []
+
+    async def astream_response(self, *args, **kwargs) -> AsyncIterator[str]:
+        for i, token in enumerate(self.stream_tokens):
+            if i == self.fail_after:
+                raise ConnectionError("stream interrupted")
+            self.history_seen.append(len(self.chat.sessions.history("ds", "s1")))
+            yield token
+
+
+def parse_events(body: str) -> List[Tuple[str, Dict]]:
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+class TestChatStream:
+    """Tests for the Server-Sent Events chat endpoint"""
+
+    def make_client(
+        self, tmp_path, monkeypatch, inference: StreamingInference
+    ) -> TestClient:
+        monkeypatch.chdir(tmp_path)
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        chat = DataChat(
+            config,
+            vector_store=NumpyStore(),
+            embedding_model=FakeEmbedding(dimension=16, latency=0, per_text_latency=0),
+            inference_model=inference,
+        )
+        chat.register_dataset("ds", synthetic_documents(10), "prompt")
+        inference.chat = chat
+        monkeypatch.setattr(routes.DataChatManager, "_instance", chat)
+        return TestClient(create_app())
+
+    def stream(self, client: TestClient, message: str) -> List[Tuple[str, Dict]]:
+        response = client.post(
+            "/api/v1/datasets/ds/chat/stream",
+            json={"message": message, "session_id": "s1"},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return parse_events(response.text)
+
+    def test_tokens_are_framed_and_session_saved_after_stream(
+        self, tmp_path, monkeypatch
+    ):
+        inference = StreamingInference(["Two ", "keynotes", "."])
+        client = self.make_client(tmp_path, monkeypatch, inference)
+
+        events = self.stream(client, "how many keynotes?")
+
+        assert [name for name, _ in events] == ["token"] * 3 + ["done"]
+        assert "".join(data["token"] for _, data in events[:3]) == "Two keynotes."
+        assert events[-1][1]["documents_selected"] > 0
+        # Nothing is remembered until the whole answer was streamed
+        assert inference.history_seen == [0, 0, 0]
+        assert inference.chat.sessions.history("ds", "s1") == [
+            ("how many keynotes?", "Two keynotes.")
+        ]
+
+    def test_failure_part_way_ends_with_error_event(self, tmp_path, monkeypatch):
+        inference = StreamingInference(["Two ", "keynotes", "."], fail_after=2)
+        client = self.make_client(tmp_path, monkeypatch, inference)
+
+        events = self.stream(client, "how many keynotes?")
+
+        assert [name for name, _ in events] == ["token", "token", "error"]
+        assert "stream interrupted" in events[-1][1]["detail"]
+        assert inference.chat.sessions.history("ds", "s1") == []
+        assert len(inference.chat.answer_cache) == 0
@@ -0,0 +1,41 @@
+import pytest
+
+from datachat.core.session_memory import (
+    InMemorySessionStore,
+    SessionStore,
+    SQLiteSessionStore,
+)
+
+
+class TestSessionStore:
+    """Tests shared by every session store backend"""
+
+    @pytest.fixture(params=["memory", "sqlite"])
+    def store(self, request, tmp_path) -> SessionStore:
+        if request.param == "memory":
+            return InMemorySessionStore(window=2, max_sessions=2)
+        return SQLiteSessionStore(str(tmp_path / "sessions.db"), 2, 2)
+
+    def test_sessions_are_isolated_and_windowed(self, store: SessionStore):
+        for i in range(3):
+            store.append("ds", "a", f"q{i}", f"r{i}")
+        store.append("other", "a", "q", "r")
+
+        assert store.history("ds", "a") == [("q1", "r1"), ("q2", "r2")]
+        assert store.history("other", "a") == [("q", "r")]
+
+    def test_least_recently_used_session_is_evicted(self, store: SessionStore):
+        store.append("ds", "a", "q", "r")
+        store.append("ds", "b", "q", "r")
+        store.append("ds", "a", "q", "r")
+        store.append("ds", "c", "q", "r")
+
+        assert len(store) == 2
+        assert store.history("ds", "b") == []
+
+    def test_idle_sessions_expire(self, store: SessionStore):
+        store.append("ds", "a", "q", "r")
+        store.ttl_seconds = -1
+
+        assert store.history("ds", "a") == []
+        assert len(store) == 0
@@ -0,0 +1,123 @@
+from typing import List, Sequence
+
+import pytest
+
+from benchmarks.fakes import FakeEmbedding, FakeInference, synthetic_documents
+from datachat.cli import main
+from datachat.core.config import Config, Environment, OpenAIConfig, PineconeConfig
+from datachat.core.data_chat import DataChat
+from datachat.core.snapshot import SnapshotReader
+from datachat.store.numpy_store import NumpyStore
+
+
+class CountingEmbedding(FakeEmbedding):
+    """Fake embedding model counting the texts it embeds"""
+
+    def __init__(self):
+        super().__init__(dimension=32, latency=0, per_text_latency=0)
+        self.texts = 0
+
+    def create_embeddings(self, texts: Sequence[str]) -> List[List[float]]:
+        self.texts += len(texts)
+        return super().create_embeddings(texts)
+
+
+class TestSnapshot:
+    """Tests for exporting and importing dataset snapshots"""
+
+    def make_chat(self, embedding: CountingEmbedding) -> DataChat:
+        config = Config(
+            OpenAIConfig("test"), PineconeConfig("test", "local"), Environment.TEST
+        )
+        return DataChat(
+            config,
+            vector_store=NumpyStore(),
+            embedding_model=embedding,
+            inference_model=FakeInference(latency=0),
+        )
+
+    def test_imported_dataset_matches_without_embedding(self, tmp_path, monkeypatch):
+        (tmp_path / "source").mkdir()
+        (tmp_path / "target").mkdir()
+        monkeypatch.chdir(tmp_path / "source")
+        source = self.make_chat(CountingEmbedding())
+        source.register_dataset(
+            "sessions",
+            synthetic_documents(50),
+            "You answer questions about sessions.",
+            filter_fields={"type": "keyword"},
+        )
+        main(["export", "sessions", str(tmp_path / "snapshot")], source)
+
+        monkeypatch.chdir(tmp_path / "target")
+        embedding = CountingEmbedding()
+        target = self.make_chat(embedding)
+        main(["import", str(tmp_path / "snapshot"), "--batch-size", "16"], target)
+
+        assert embedding.texts == 0
+        dataset = target.repo.get_dataset("sessions")
+        assert dataset.system_prompt == "You answer questions about sessions."
+        assert target.repo.get_field_values("sessions") == (
+            source.repo.get_field_values("sessions")
+        )
+        question = "vector search latency"
+        vector = source.embedding_model.create_embedding(question)
+        ranked = [
+            [m.id for m in chat._search(dataset, question, vector, top_k=5)]
+            for chat in (source, target)
+        ]
+        assert ranked[0] and ranked[0] == ranked[1]
+
+    def test_reader_rejects_missing_snapshot(self, tmp_path):
+        with pytest.raises(ValueError, match="No snapshot"):
+            SnapshotReader(str(tmp_path))
+
+    def export(self, tmp_path, monkeypatch, count: int) -> str:
+        """Register count documents in a fresh instance and export them"""
+        source_dir = tmp_path / f"source-{count}"
+        source_dir.mkdir()
+        monkeypatch.chdir(source_dir)
+        source = self.make_chat(CountingEmbedding())
+        source.register_dataset("sessions", synthetic_documents(count), "prompt")
+        path = str(tmp_path / f"snapshot-{count}")
+        source.export_dataset("sessions", path)
+        return path
+
+    def test_reimport_replaces_dataset(self, tmp_path, monkeypatch):
+        larger = self.export(tmp_path, monkeypatch, 40)
+        smaller = self.export(tmp_path, monkeypatch, 25)
+        (tmp_path / "target").mkdir()
+        monkeypatch.chdir(tmp_path / "target")
+        target = self.make_chat(CountingEmbedding())
+        target.import_dataset(larger)
+
+        stats = target.import_dataset(smaller)
+
+        dataset = target.repo.get_dataset("sessions")
+        assert stats.rows_upserted == 25 and stats.rows_deleted == 15
+        assert target.repo.count_documents("sessions") == 25
+        assert target.vector_store.count(dataset.index_name) == 25
+
+    def test_failed_import_keeps_existing_dataset(self, tmp_path, monkeypatch):
+        larger = self.export(tmp_path, monkeypatch, 40)
+        smaller = self.export(tmp_path, monkeypatch, 25)
+        (tmp_path / "target").mkdir()
+        monkeypatch.chdir(tmp_path / "target")
+        target = self.make_chat(CountingEmbedding())
+        target.import_dataset(larger)
+        dataset = target.repo.get_dataset("sessions")
+        question = "vector search latency"
+        vector = target.embedding_model.create_embedding(question)
+        before = [m.id for m in target._search(dataset, question, vector, top_k=5)]
+
+        def fail(*args, **kwargs):
+            raise ConnectionError("store unavailable")
+
+        monkeypatch.setattr(target.vector_store, "bulk_load", fail)
+        with pytest.raises(ConnectionError):
+            target.import_dataset(smaller)
+
+        dataset = target.repo.get_dataset("sessions")
+        after = [m.id for m in target._search(dataset, question, vector, top_k=5)]
+        assert before and after == before
+        assert target.repo.count_documents("sessions") == 40